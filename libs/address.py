@@ -1,74 +1,86 @@
 import abc
 import numpy as np
 
-class Address(abc.ABC):
-    ADDRESS_LENGTH = 40
+import typing
+if typing.TYPE_CHECKING:
+    from libs.rng import RandomStream
 
+class Address(abc.ABC):
     @abc.abstractmethod
-    def __init__(self, array: "np.ndarray"):
-        if not isinstance(array, np.ndarray):
-            raise TypeError("invalid type for array")
-        if len(array) != Address.ADDRESS_LENGTH:
-            raise ValueError("invalid array length")
+    def __init__(self, value: "int", bits: "int"):
+        if not isinstance(value, int):
+            raise TypeError("invalid type for value")
+        if value < 0 or value >> bits:
+            raise ValueError("invalid value length")
 
-        self._array = array
+        self._value = value
+        self._bits = bits
         return
 
     @abc.abstractmethod
     def get_distance(self, address: "Address") -> "int":
         pass
 
+    @property
+    def value(self) -> "int":
+        """
+        Address packed into an integer with the first bit as the most
+        significant bit.
+        """
+        return self._value
+
+    @property
+    def bits(self) -> "int":
+        return self._bits
+
     @property
     def array(self) -> "np.ndarray":
-        return self._array
+        """
+        Unpacked bit array view of the address, kept for compatibility.
+        """
+        return np.array([int(c) for c in repr(self)])
 
     def __eq__(self, address) -> "bool":
-        return np.array_equal(self.array, address.array)
+        if not isinstance(address, Address):
+            return NotImplemented
+        return self._value == address._value and self._bits == address._bits
 
     def __repr__(self) -> "str":
-        return "".join([str(c) for c in self.array])
+        return format(self._value, f"0{self._bits}b")
 
     def __hash__(self) -> "int":
-        return hash(self.__repr__)
+        return hash(self._value)
+
+    @classmethod
+    def from_array(cls, array: "np.ndarray") -> "Address":
+        if not isinstance(array, np.ndarray):
+            raise TypeError("invalid type for array")
+        if not len(array):
+            raise ValueError("invalid array length")
+
+        return cls(int("".join([str(int(c)) for c in array]), 2), len(array))
 
-    @staticmethod
-    def generate_random_address() -> "Address":
-        array = np.random.randint(2, size=Address.ADDRESS_LENGTH)
-        return Address(array)
+    @classmethod
+    def generate_random_address(
+        cls,
+        bits: "int",
+        rng: "RandomStream",
+    ) -> "Address":
+        """
+        Uniformly random address drawn from `rng`.
+        """
+        num_bytes = (bits + 7) // 8
+        value = int.from_bytes(rng.bytes(num_bytes), "big")
+        return cls(value >> (num_bytes * 8 - bits), bits)
 
-    @staticmethod
-    def generate_default_address() -> "Address":
-        array = np.zeros(shape=Address.ADDRESS_LENGTH, dtype="int")
-        return Address(array)
+    @classmethod
+    def generate_default_address(cls, bits: "int") -> "Address":
+        return cls(0, bits)
 
 class KademliaAddress(Address):
-    def __init__(self, array: np.ndarray):
-        super().__init__(array)
-        self._distances = {}
+    def __init__(self, value: "int", bits: "int"):
+        super().__init__(value, bits)
         return
 
     def get_distance(self, address: "KademliaAddress") -> "int":
-        try:
-            return self._distances[address]
-        except:
-            distance = Address.ADDRESS_LENGTH
-            xor = self.array ^ address.array
-            argmax = np.argmax(xor)
-            first = xor[0]
-
-            if argmax or first:
-                distance = distance - argmax
-            else:
-                distance = 0
-            self._distances[address] = distance
-            return self._distances[address]
-
-    @staticmethod
-    def generate_random_address() -> "KademliaAddress":
-        array = np.random.randint(2, size=Address.ADDRESS_LENGTH)
-        return KademliaAddress(array)
-
-    @staticmethod
-    def generate_default_address() -> "KademliaAddress":
-        array = np.zeros(shape=Address.ADDRESS_LENGTH, dtype="int")
-        return KademliaAddress(array)
+        return (self._value ^ address._value).bit_length()
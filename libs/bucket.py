@@ -1,38 +1,67 @@
-import random
 from libs.address import KademliaAddress
 
-class Bucket:
-    BUCKET_SIZE = 10
+import typing
+if typing.TYPE_CHECKING:
+    from libs.rng import RandomStream
+    from libs.store import NodeStore
 
-    def __init__(self, address: "KademliaAddress", distance: "int"):
-        self._address = address
+class Bucket:
+    """
+    View of one bucket of a node's routing table in a `NodeStore`.
+    """
+    def __init__(self, store: "NodeStore", index: "int", distance: "int"):
+        self._store = store
+        self._index = index
         self._distance = distance
-        self._peers = []
         return
 
     def add_address(self, address: "KademliaAddress"):
+        """
+        Adds `address` as the most recently seen peer, moving it to the
+        tail if already present and evicting the least recently seen peer
+        at the head if the bucket overflows.
+        """
         if self.address.get_distance(address) != self.distance:
             raise ValueError("invalid distance")
 
-        if not address in self.peers:
-            self._peers.append(address)
-            if len(self.peers) > Bucket.BUCKET_SIZE:
-                self._peers = self._peers[1:]
+        self._store.add_peer(
+            self._index,
+            self._distance,
+            self._store.get_index(address),
+        )
         return
 
-    def select_random_address(self) -> "KademliaAddress":
-        if not self._peers:
+    def select_random_address(self, rng: "RandomStream") -> "KademliaAddress":
+        peers = self._store.get_bucket_peer_indices(
+            self._index,
+            self._distance,
+        )
+        if not len(peers):
             raise RuntimeError("invalid method call")
 
-        return random.choice(self.peers)
+        return self._store.get_address(
+            int(peers[rng.randrange(len(peers))])
+        )
+
+    def generate_random_address(
+        self,
+        rng: "RandomStream",
+    ) -> "KademliaAddress":
+        """
+        Generate a random address at `distance` from `address`.
+        """
+        if not self._distance:
+            return self.address
 
-    def generate_random_address(self) -> "KademliaAddress":
+        # keep the common prefix, flip the first differing bit and
+        # randomize the remaining lower bits
+        bits = self.address.bits
+        mask = (1 << (self._distance - 1)) - 1
+        random_address = KademliaAddress.generate_random_address(bits, rng)
         return KademliaAddress(
-            self._address.array[
-                :KademliaAddress.ADDRESS_LENGTH - self._distance
-            ] + KademliaAddress.generate_random_address().array[
-                KademliaAddress.ADDRESS_LENGTH - self._distance:
-            ]
+            (self.address.value ^ (1 << (self._distance - 1))) & ~mask
+                | random_address.value & mask,
+            bits,
         )
 
     @property
@@ -40,7 +69,7 @@ class Bucket:
         """
         Address of the routing table owning this bucket
         """
-        return self._address
+        return self._store.get_address(self._index)
 
     @property
     def distance(self) -> "int":
@@ -49,6 +78,16 @@ class Bucket:
         """
         return self._distance
 
+    @property
+    def size(self) -> "int":
+        """
+        Maximum number of peers kept, i.e. `k`.
+        """
+        return self._store.id_space.k
+
     @property
     def peers(self) -> "list":
-        return self._peers
+        """
+        Peers least recently seen first.
+        """
+        return self._store.get_bucket_peers(self._index, self._distance)
@@ -0,0 +1,418 @@
+import abc
+import functools
+import heapq
+import math
+import numpy as np
+from libs.message import Message
+from libs.node import KademliaNode
+
+import typing
+if typing.TYPE_CHECKING:
+    from libs.network import KademliaNetwork
+
+class SessionLength(abc.ABC):
+    """
+    Distribution of the time in seconds a node stays in the network.
+
+    Samples are drawn from `rng` in blocks to keep the per-join cost low.
+    """
+    BLOCK_SIZE = 1 << 14
+
+    def __init__(self, rng: "np.random.Generator"):
+        self._rng = rng
+        self._samples = []
+        return
+
+    def sample(self) -> "float":
+        if not self._samples:
+            self._samples = self._draw(SessionLength.BLOCK_SIZE).tolist()
+        return self._samples.pop()
+
+    @abc.abstractmethod
+    def _draw(self, size: "int") -> "np.ndarray":
+        pass
+
+    @property
+    @abc.abstractmethod
+    def mean(self) -> "float":
+        pass
+
+class ExponentialSession(SessionLength):
+    def __init__(self, mean: "float", rng: "np.random.Generator"):
+        if mean <= 0:
+            raise ValueError(f"invalid mean: {mean}")
+
+        super().__init__(rng)
+        self._mean = mean
+        return
+
+    def _draw(self, size: "int") -> "np.ndarray":
+        return self._rng.exponential(self._mean, size)
+
+    @property
+    def mean(self) -> "float":
+        return self._mean
+
+class ParetoSession(SessionLength):
+    """
+    Pareto distributed sessions of at least `scale` seconds, heavy tailed
+    for small `shape`, as measured on deployed peer-to-peer networks.
+    """
+    def __init__(
+        self,
+        shape: "float",
+        scale: "float",
+        rng: "np.random.Generator",
+    ):
+        if shape <= 0:
+            raise ValueError(f"invalid shape: {shape}")
+        if scale <= 0:
+            raise ValueError(f"invalid scale: {scale}")
+
+        super().__init__(rng)
+        self._shape = shape
+        self._scale = scale
+        return
+
+    def _draw(self, size: "int") -> "np.ndarray":
+        return self._scale * (1.0 + self._rng.pareto(self._shape, size))
+
+    @property
+    def shape(self) -> "float":
+        return self._shape
+
+    @property
+    def scale(self) -> "float":
+        return self._scale
+
+    @property
+    def mean(self) -> "float":
+        if self._shape <= 1:
+            return math.inf
+        return self._shape * self._scale / (self._shape - 1)
+
+class WeibullSession(SessionLength):
+    def __init__(
+        self,
+        shape: "float",
+        scale: "float",
+        rng: "np.random.Generator",
+    ):
+        if shape <= 0:
+            raise ValueError(f"invalid shape: {shape}")
+        if scale <= 0:
+            raise ValueError(f"invalid scale: {scale}")
+
+        super().__init__(rng)
+        self._shape = shape
+        self._scale = scale
+        return
+
+    def _draw(self, size: "int") -> "np.ndarray":
+        return self._scale * self._rng.weibull(self._shape, size)
+
+    @property
+    def shape(self) -> "float":
+        return self._shape
+
+    @property
+    def scale(self) -> "float":
+        return self._scale
+
+    @property
+    def mean(self) -> "float":
+        return self._scale * math.gamma(1.0 + 1.0 / self._shape)
+
+class ConstantSession(SessionLength):
+    def __init__(self, length: "float"):
+        if length <= 0:
+            raise ValueError(f"invalid length: {length}")
+
+        # nothing random to draw
+        super().__init__(None)
+        self._length = length
+        return
+
+    def _draw(self, size: "int") -> "np.ndarray":
+        return np.full(size, self._length)
+
+    @property
+    def mean(self) -> "float":
+        return self._length
+
+class ChurnProbe:
+    """
+    Outcome of one broadcast sent during a churn simulation.
+    """
+    def __init__(
+        self,
+        time: "float",
+        network_size: "int",
+        propagation: "int",
+        send_count: "int",
+        dead_entry_fraction: "float",
+    ):
+        self._time = time
+        self._network_size = network_size
+        self._propagation = propagation
+        self._send_count = send_count
+        self._dead_entry_fraction = dead_entry_fraction
+        return
+
+    @property
+    def time(self) -> "float":
+        return self._time
+
+    @property
+    def network_size(self) -> "int":
+        return self._network_size
+
+    @property
+    def propagation(self) -> "int":
+        return self._propagation
+
+    @property
+    def send_count(self) -> "int":
+        return self._send_count
+
+    @property
+    def dead_entry_fraction(self) -> "float":
+        """
+        Fraction of routing table entries pointing to departed nodes
+        right before the broadcast.
+        """
+        return self._dead_entry_fraction
+
+    @property
+    def success(self) -> "bool":
+        return self._propagation == self._network_size
+
+class ChurnSimulator:
+    """
+    Drives joins, departures and bucket refreshes on `network` in
+    simulated time.
+
+    Every node, present or joining later, stays for a session drawn from
+    `session_length` and then leaves, silently with probability
+    `failure_rate` and gracefully otherwise. New nodes arrive as a
+    Poisson process of `arrival_rate` per second, by default the rate
+    keeping the current size steady. Each node refreshes its routing
+    table every `refresh_interval` seconds with its network's discovery
+    policy. Buckets ping their least recently seen peer before evicting
+    it if `ping_before_replace`, and drop entries after
+    `stale_threshold` failed contacts. Every choice besides session
+    lengths is drawn from the network's random stream.
+
+    Events are kept in one heap of `(time, counter, handler, node)`, so
+    an event costs a heap operation besides the work it triggers.
+    """
+    def __init__(
+        self,
+        network: "KademliaNetwork",
+        session_length: "SessionLength",
+        arrival_rate: "float" = None,
+        refresh_interval: "float" = 3600.0,
+        failure_rate: "float" = 1.0,
+        ping_before_replace: "bool" = True,
+        stale_threshold: "int" = 1,
+    ):
+        if arrival_rate is None:
+            arrival_rate = network.size / session_length.mean
+        if arrival_rate < 0:
+            raise ValueError(f"invalid arrival rate: {arrival_rate}")
+        if refresh_interval <= 0:
+            raise ValueError(f"invalid refresh interval: {refresh_interval}")
+        if not 0 <= failure_rate <= 1:
+            raise ValueError(f"invalid failure rate: {failure_rate}")
+
+        self._network = network
+        self._session_length = session_length
+        self._arrival_rate = arrival_rate
+        self._refresh_interval = refresh_interval
+        self._failure_rate = failure_rate
+        network.store.configure_eviction(ping_before_replace, stale_threshold)
+
+        self._time = 0.0
+        self._counter = 0
+        self._events = []
+        self._joins = 0
+        self._departures = 0
+        self._failures = 0
+        self._refreshes = 0
+        self._probes = []
+
+        for node in network.nodes.values():
+            self._push(self._session_length.sample(), self._leave, node)
+            self._push(
+                network.rng.uniform(0.0, refresh_interval),
+                self._refresh,
+                node,
+            )
+        self._schedule_join()
+        return
+
+    def run(self, duration: "float", probe_interval: "float") -> "list":
+        """
+        Advances the simulation by `duration` seconds, broadcasting a
+        probe message from a random node every `probe_interval` seconds,
+        and returns the probes of this run.
+        """
+        if probe_interval <= 0:
+            raise ValueError(f"invalid probe interval: {probe_interval}")
+
+        end = self._time + duration
+        num_probes = len(self._probes)
+        probe_time = self._time + probe_interval
+        while probe_time <= end:
+            self._push(probe_time - self._time, self._probe, None)
+            probe_time = probe_time + probe_interval
+
+        events = self._events
+        while events and events[0][0] <= end:
+            time, _, handler, node = heapq.heappop(events)
+            self._time = time
+            handler(node)
+        self._time = end
+        return self._probes[num_probes:]
+
+    def add_periodic(self, interval: "float", callback):
+        """
+        Calls `callback()` every `interval` seconds of simulated time,
+        such as `KademliaStorage.republish`.
+        """
+        if interval <= 0:
+            raise ValueError(f"invalid interval: {interval}")
+
+        self._push(
+            interval,
+            functools.partial(self._periodic, interval, callback),
+            None,
+        )
+        return
+
+    def _periodic(self, interval: "float", callback, _):
+        callback()
+        self._push(
+            interval,
+            functools.partial(self._periodic, interval, callback),
+            None,
+        )
+        return
+
+    def _push(self, delay: "float", handler, node: "KademliaNode"):
+        heapq.heappush(
+            self._events,
+            (self._time + delay, self._counter, handler, node),
+        )
+        self._counter = self._counter + 1
+        return
+
+    def _schedule_join(self):
+        if self._arrival_rate > 0:
+            self._push(
+                self._network.rng.expovariate(self._arrival_rate),
+                self._join,
+                None,
+            )
+        return
+
+    def _join(self, _):
+        address = self._network.store.generate_addresses(
+            1,
+            self._network.rng,
+        )[0]
+        node = KademliaNode(self._network, address)
+        self._network.add_node(node)
+        self._joins = self._joins + 1
+
+        self._push(self._session_length.sample(), self._leave, node)
+        self._push(self._refresh_interval, self._refresh, node)
+        self._schedule_join()
+        return
+
+    def _leave(self, node: "KademliaNode"):
+        if self._network.rng.random() < self._failure_rate:
+            self._network.fail_node(node.address)
+            self._failures = self._failures + 1
+        else:
+            self._network.remove_node(node.address)
+            self._departures = self._departures + 1
+        return
+
+    def _refresh(self, node: "KademliaNode"):
+        # the node's index may be reused by a node that joined since
+        if self._network.nodes.get(node.address) is not node:
+            return
+
+        self._network.discovery_policy.refresh_peers(self._network, node)
+        self._refreshes = self._refreshes + 1
+        self._push(self._refresh_interval, self._refresh, node)
+        return
+
+    def _probe(self, _):
+        network = self._network
+        if not network.size:
+            return
+
+        dead_entry_fraction = network.store.get_dead_entry_fraction()
+        network.reset()
+        start_node = network.get_random_node()
+        network.propagate_message(Message("probe", 0), start_node.address)
+        self._probes.append(ChurnProbe(
+            time=self._time,
+            network_size=network.size,
+            propagation=network.propagation,
+            send_count=network.send_count,
+            dead_entry_fraction=dead_entry_fraction,
+        ))
+        return
+
+    @property
+    def network(self) -> "KademliaNetwork":
+        return self._network
+
+    @property
+    def time(self) -> "float":
+        return self._time
+
+    @property
+    def session_length(self) -> "SessionLength":
+        return self._session_length
+
+    @property
+    def arrival_rate(self) -> "float":
+        return self._arrival_rate
+
+    @property
+    def refresh_interval(self) -> "float":
+        return self._refresh_interval
+
+    @property
+    def failure_rate(self) -> "float":
+        return self._failure_rate
+
+    @property
+    def joins(self) -> "int":
+        return self._joins
+
+    @property
+    def departures(self) -> "int":
+        """
+        Graceful departures.
+        """
+        return self._departures
+
+    @property
+    def failures(self) -> "int":
+        """
+        Silent departures.
+        """
+        return self._failures
+
+    @property
+    def refreshes(self) -> "int":
+        return self._refreshes
+
+    @property
+    def probes(self) -> "list":
+        return list(self._probes)
@@ -0,0 +1,45 @@
+class IdSpace:
+    """
+    Geometry of a Kademlia network: address length in bits, bucket
+    size `k` and lookup concurrency `alpha`.
+    """
+    def __init__(self, bits: "int", k: "int", alpha: "int"):
+        if bits < 1:
+            raise ValueError(f"invalid number of bits: {bits}")
+        if k < 1:
+            raise ValueError(f"invalid bucket size: {k}")
+        if alpha < 1:
+            raise ValueError(f"invalid alpha: {alpha}")
+
+        self._bits = bits
+        self._k = k
+        self._alpha = alpha
+        return
+
+    def __eq__(self, id_space) -> "bool":
+        if not isinstance(id_space, IdSpace):
+            return NotImplemented
+        return (
+            (self.bits, self.k, self.alpha)
+                == (id_space.bits, id_space.k, id_space.alpha)
+        )
+
+    def __hash__(self) -> "int":
+        return hash((self.bits, self.k, self.alpha))
+
+    def __repr__(self) -> "str":
+        return f"IdSpace(bits={self.bits}, k={self.k}, alpha={self.alpha})"
+
+    @property
+    def bits(self) -> "int":
+        return self._bits
+
+    @property
+    def k(self) -> "int":
+        return self._k
+
+    @property
+    def alpha(self) -> "int":
+        return self._alpha
+
+DEFAULT_ID_SPACE = IdSpace(bits=40, k=10, alpha=3)
@@ -0,0 +1,145 @@
+import abc
+import math
+import numpy as np
+
+import typing
+if typing.TYPE_CHECKING:
+    from libs.address import KademliaAddress
+
+class LatencyModel(abc.ABC):
+    """
+    One-way link latency in seconds between two nodes.
+    """
+    @abc.abstractmethod
+    def get_latency(
+        self,
+        sender: "KademliaAddress",
+        receiver: "KademliaAddress",
+    ) -> "float":
+        pass
+
+class ConstantLatency(LatencyModel):
+    def __init__(self, latency: "float"):
+        if latency < 0:
+            raise ValueError(f"invalid latency: {latency}")
+
+        self._latency = latency
+        return
+
+    def get_latency(
+        self,
+        sender: "KademliaAddress",
+        receiver: "KademliaAddress",
+    ) -> "float":
+        return self._latency
+
+    @property
+    def latency(self) -> "float":
+        return self._latency
+
+class LogNormalLatency(LatencyModel):
+    """
+    Log-normally distributed latency drawn independently for each send.
+
+    Samples are drawn from `rng` in blocks to keep the per-send cost low.
+    """
+    BLOCK_SIZE = 1 << 14
+
+    def __init__(
+        self,
+        median: "float",
+        sigma: "float",
+        rng: "np.random.Generator",
+    ):
+        if median <= 0:
+            raise ValueError(f"invalid median: {median}")
+        if sigma < 0:
+            raise ValueError(f"invalid sigma: {sigma}")
+
+        self._median = median
+        self._sigma = sigma
+        self._rng = rng
+        self._samples = []
+        return
+
+    def get_latency(
+        self,
+        sender: "KademliaAddress",
+        receiver: "KademliaAddress",
+    ) -> "float":
+        if not self._samples:
+            self._samples = self._rng.lognormal(
+                math.log(self._median),
+                self._sigma,
+                LogNormalLatency.BLOCK_SIZE,
+            ).tolist()
+        return self._samples.pop()
+
+    @property
+    def median(self) -> "float":
+        return self._median
+
+    @property
+    def sigma(self) -> "float":
+        return self._sigma
+
+class XorDistanceLatency(LatencyModel):
+    """
+    Latency growing linearly with the bucket distance between two nodes,
+    for topologies where close IDs are also close on the network.
+    """
+    def __init__(self, base: "float", per_bit: "float"):
+        if base < 0 or per_bit < 0:
+            raise ValueError("invalid latency")
+
+        self._base = base
+        self._per_bit = per_bit
+        return
+
+    def get_latency(
+        self,
+        sender: "KademliaAddress",
+        receiver: "KademliaAddress",
+    ) -> "float":
+        return self._base + self._per_bit * sender.get_distance(receiver)
+
+    @property
+    def base(self) -> "float":
+        return self._base
+
+    @property
+    def per_bit(self) -> "float":
+        return self._per_bit
+
+class RegionLatency(LatencyModel):
+    """
+    Latency looked up from a region-to-region matrix, with each node
+    assigned to a region by its address.
+    """
+    def __init__(self, matrix: "list"):
+        matrix = np.asarray(matrix, dtype=float)
+        if matrix.ndim != 2 or matrix.shape[0] != matrix.shape[1]:
+            raise ValueError("invalid latency matrix")
+        if (matrix < 0).any():
+            raise ValueError("invalid latency")
+
+        self._matrix = matrix.tolist()
+        return
+
+    def get_region(self, address: "KademliaAddress") -> "int":
+        return address.value % len(self._matrix)
+
+    def get_latency(
+        self,
+        sender: "KademliaAddress",
+        receiver: "KademliaAddress",
+    ) -> "float":
+        return self._matrix[
+            self.get_region(sender)
+        ][
+            self.get_region(receiver)
+        ]
+
+    @property
+    def num_regions(self) -> "int":
+        return len(self._matrix)
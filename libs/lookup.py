@@ -0,0 +1,248 @@
+import heapq
+
+import typing
+if typing.TYPE_CHECKING:
+    from libs.address import KademliaAddress
+    from libs.idspace import IdSpace
+    from libs.network import KademliaNetwork
+    from libs.node import KademliaNode
+
+class LookupStats:
+    """
+    Running cost counters of one or more lookups.
+    """
+    def __init__(self):
+        self._lookups = 0
+        self._rounds = 0
+        self._queries = 0
+        self._responses = 0
+        return
+
+    def add_lookup(self):
+        self._lookups = self._lookups + 1
+        return
+
+    def add_round(self, queries: "int", responses: "int"):
+        self._rounds = self._rounds + 1
+        self._queries = self._queries + queries
+        self._responses = self._responses + responses
+        return
+
+    def add(self, stats: "LookupStats"):
+        self._lookups = self._lookups + stats.lookups
+        self._rounds = self._rounds + stats.rounds
+        self._queries = self._queries + stats.queries
+        self._responses = self._responses + stats.responses
+        return
+
+    @property
+    def lookups(self) -> "int":
+        return self._lookups
+
+    @property
+    def rounds(self) -> "int":
+        """
+        Rounds of parallel queries.
+        """
+        return self._rounds
+
+    @property
+    def queries(self) -> "int":
+        """
+        FIND_NODE requests sent.
+        """
+        return self._queries
+
+    @property
+    def responses(self) -> "int":
+        """
+        Contacts returned over all responses, duplicates included.
+        """
+        return self._responses
+
+class IterativeLookup:
+    """
+    Shortlist of an iterative lookup for the `k` closest nodes to
+    `target`, as in the Kademlia FIND_NODE procedure, starting from
+    `contacts` of the node at `origin`. The caller sends the queries of
+    each round and reports their outcome.
+
+    Each round queries the `alpha` closest contacts not yet queried. Once
+    a round fails to find a contact closer than the closest seen so far,
+    all of the `k` closest not yet queried are queried at once, and the
+    lookup ends when every one of the `k` closest has been queried.
+    `max_rounds` caps the number of rounds, with no cap if not positive.
+    """
+    def __init__(
+        self,
+        id_space: "IdSpace",
+        origin: "KademliaAddress",
+        target: "KademliaAddress",
+        contacts: "list",
+        max_rounds: "int" = 0,
+    ):
+        self._k = id_space.k
+        self._alpha = id_space.alpha
+        self._value = target.value
+        self._max_rounds = max_rounds
+        self._stats = LookupStats()
+        self._stats.add_lookup()
+        self._seen = {origin}
+        self._queried = set()
+        self._failed = set()
+        self._closest = []
+        for address in contacts:
+            if not address in self._seen:
+                self._seen.add(address)
+                self._closest.append(address)
+        self._improved = True
+        # closest distance before the round, and what the round found
+        self._best = None
+        self._found = []
+        self._queries = 0
+        self._responses = 0
+        return
+
+    def _get_distance(self, address: "KademliaAddress") -> "int":
+        return address.value ^ self._value
+
+    def next_round(self) -> "list":
+        """
+        Returns the contacts to query in the next round, none once the
+        lookup is over.
+        """
+        unqueried = [
+            address for address in self._closest
+                if not address in self._queried
+        ]
+        if not unqueried:
+            return []
+        if self._max_rounds > 0 and self._stats.rounds >= self._max_rounds:
+            return []
+        if self._improved:
+            unqueried = unqueried[:self._alpha]
+
+        self._best = self._get_distance(self._closest[0])
+        self._found = []
+        self._queries = 0
+        self._responses = 0
+        return unqueried
+
+    def add_response(
+        self,
+        address: "KademliaAddress",
+        contacts: "list",
+    ) -> "list":
+        """
+        Records the query to `address` answered with `contacts`, and
+        returns those not seen before in the lookup.
+        """
+        self._queries = self._queries + 1
+        self._queried.add(address)
+        self._responses = self._responses + len(contacts)
+        found = []
+        for contact in contacts:
+            if not contact in self._seen:
+                self._seen.add(contact)
+                found.append(contact)
+        self._found.extend(found)
+        return found
+
+    def add_failure(self, address: "KademliaAddress"):
+        """
+        Records the query to `address` as unanswered, dropping it from
+        the shortlist.
+        """
+        self._queries = self._queries + 1
+        self._queried.add(address)
+        self._failed.add(address)
+        return
+
+    def end_round(self):
+        """
+        Merges the contacts found in the round into the shortlist.
+        """
+        self._stats.add_round(self._queries, self._responses)
+        closest = self._closest
+        if self._failed:
+            closest = [
+                address for address in closest
+                    if not address in self._failed
+            ]
+        self._closest = heapq.nsmallest(
+            self._k,
+            closest + self._found,
+            key=self._get_distance,
+        )
+        self._improved = (
+            bool(self._closest)
+                and self._get_distance(self._closest[0]) < self._best
+        )
+        return
+
+    @property
+    def closest(self) -> "list":
+        return self._closest
+
+    @property
+    def stats(self) -> "LookupStats":
+        return self._stats
+
+def find_node(
+    network: "KademliaNetwork",
+    node: "KademliaNode",
+    target: "KademliaAddress",
+    max_rounds: "int" = 0,
+    on_query=None,
+    on_round=None,
+) -> "tuple":
+    """
+    Iteratively looks up the `k` closest nodes to `target` starting from
+    the routing table of `node`, driving an `IterativeLookup` with
+    `max_rounds`, and returns them with the cost of the lookup.
+
+    A queried node and `node` add each other to their routing tables, as
+    every exchanged RPC updates the tables of both ends. A query to a
+    node that left times out, is marked stale by `node` and gets no
+    response.
+
+    `on_query`, if given, is called with every node answering a query
+    before its response is used, and ends the lookup at that node by
+    returning `True`, as FIND_VALUE does at the first node holding the
+    value. `on_round`, if given, is called after each round with the
+    nodes that answered in it.
+    """
+    lookup = IterativeLookup(
+        network.id_space,
+        node.address,
+        target,
+        node.get_neighbors(target),
+        max_rounds,
+    )
+    while True:
+        addresses = lookup.next_round()
+        if not addresses:
+            break
+
+        peers = []
+        stopped = False
+        for address in addresses:
+            peer = network.nodes.get(address)
+            if peer is None:
+                node.mark_stale(address)
+                lookup.add_failure(address)
+                continue
+            peer.add_address(node.address)
+            node.add_address(address)
+            peers.append(peer)
+            if on_query is not None and on_query(peer):
+                lookup.add_response(address, [])
+                stopped = True
+                break
+            lookup.add_response(address, peer.get_neighbors(target))
+        lookup.end_round()
+        if on_round is not None:
+            on_round(peers)
+        if stopped:
+            break
+    return lookup.closest, lookup.stats
@@ -1,7 +1,18 @@
 class Message:
-    def __init__(self, content: "str", hops: "int"):
+    def __init__(
+        self,
+        content: "str",
+        hops: "int",
+        height: "int" = None,
+        size: "int" = 0,
+    ):
+        if size < 0:
+            raise ValueError(f"invalid size: {size}")
+
         self._content = content
         self._hops = hops
+        self._height = height
+        self._size = size
         return
 
     @property
@@ -11,3 +22,19 @@ class Message:
     @property
     def hops(self) -> "int":
         return self._hops
+
+    @property
+    def height(self) -> "int":
+        """
+        Bucket distance the message was sent through, limiting where the
+        receiver forwards it under bucket-scoped broadcast, or `None` if
+        unrestricted.
+        """
+        return self._height
+
+    @property
+    def size(self) -> "int":
+        """
+        Size in bytes on the wire.
+        """
+        return self._size
@@ -1,40 +1,153 @@
-import random
 from libs.address import KademliaAddress
+from libs.idspace import DEFAULT_ID_SPACE, IdSpace
 from libs.message import Message
 from libs.node import KademliaNode
 from libs.policy import KademliaBroadcastPolicy, KademliaDiscoveryPolicy
+from libs.rng import RandomStream
+from libs.scheduler import PropagationScheduler, Scheduler
+from libs.store import NodeStore
+
+import typing
+if typing.TYPE_CHECKING:
+    from libs.telemetry import DeliveryTelemetry
+    from libs.trace import PropagationTrace
 
 class KademliaNetwork:
     def __init__(
         self,
         discovery_policy: KademliaDiscoveryPolicy,
         broadcast_policy: KademliaBroadcastPolicy,
+        rng: RandomStream,
+        id_space: IdSpace = DEFAULT_ID_SPACE,
     ):
+        self._id_space = id_space
+        self._rng = rng
         self._seed = None
         self._nodes = {}
-        self._queue = []
+        self._store = NodeStore(id_space)
+        self._scheduler = PropagationScheduler()
+        self._telemetry = None
+        self._trace = None
+        # messages being propagated, shared by every node at the same hop
+        self._content = None
+        self._message_size = 0
+        self._messages = {}
         self._discovery_policy = discovery_policy
         self._broadcast_policy = broadcast_policy
 
         self._send_count = 0
+        # sends to addresses no node is at
+        self._lost_count = 0
+        # bumped on reset, invalidating every node's message at once
+        self._epoch = 0
+        self._propagation = 0
+        self._max_hops = 0
+        self._hop_histogram = []
         return
 
     def set_seed(self, node: KademliaNode):
+        if not node.address in self._nodes:
+            self._register_node(node)
         self._seed = node
-        self._nodes[node.address] = node
         return
 
     def add_node(self, node: KademliaNode):
+        self._add_node(node, self.discovery_policy)
+        return
+
+    def bulk_build(
+        self,
+        addresses: list,
+        policy: KademliaDiscoveryPolicy = None,
+    ):
+        """
+        Adds a node for each of `addresses`, in order, with the same
+        result as calling `add_node` for each of them.
+
+        Complete discovery into an empty network fills every routing
+        table directly instead of joining nodes one at a time. Other
+        policies still join nodes sequentially, as each join depends on
+        the tables built by the previous ones.
+        """
+        if policy is None:
+            policy = self.discovery_policy
+
+        if (
+            policy.discovery_type == KademliaDiscoveryPolicy.COMPLETE
+                and not self._nodes
+        ):
+            nodes = self.restore_nodes(addresses, 0 if addresses else None)
+            policy.bulk_discover_peers_complete(self, nodes)
+        else:
+            for address in addresses:
+                self._add_node(KademliaNode(self, address), policy)
+        return
+
+    def restore_nodes(self, addresses: list, seed_index: int) -> list:
+        """
+        Adds a node for each of `addresses` without running discovery,
+        for restoring saved networks, and returns the new nodes.
+        """
+        if self._nodes:
+            raise RuntimeError("network is not empty")
+        if len(set(addresses)) != len(addresses):
+            raise ValueError("node already in network")
+
+        self._store.reserve(len(addresses))
+        nodes = [KademliaNode(self, address) for address in addresses]
+        for node in nodes:
+            self._register_node(node)
+        if seed_index is not None:
+            self._seed = nodes[seed_index]
+        return nodes
+
+    def _add_node(self, node: KademliaNode, policy: KademliaDiscoveryPolicy):
         if node.address in self._nodes:
             raise ValueError("node already in network")
 
         if not self._nodes:
             # first node is set to seed
-            self._nodes[node.address] = node
+            self._register_node(node)
             self._seed = node
         else:
-            self._nodes[node.address] = node
-            self.discover_peers(node)
+            self._register_node(node)
+            policy.discover_peers(self, node)
+        return
+
+    def remove_node(self, address: KademliaAddress, graceful: bool = True):
+        """
+        Removes the node at `address`. A graceful departure tells the
+        peers in its routing table to drop it. Nodes that still have it
+        in their tables only notice it is gone when contacting it fails.
+        """
+        node = self._nodes.pop(address, None)
+        if node is None:
+            raise ValueError("node not in network")
+
+        self._store.kill(node.index)
+        if graceful:
+            for peer in self._store.get_peer_indices(node.index):
+                if peer != node.index and self._store.is_alive(peer):
+                    self._store.remove_peer(
+                        peer,
+                        self._store.get_address(peer).get_distance(address),
+                        node.index,
+                    )
+        if self._seed is node:
+            # joins bootstrap through the seed, hand it over
+            self._seed = next(iter(self._nodes.values()), None)
+        return
+
+    def fail_node(self, address: KademliaAddress):
+        """
+        Removes the node at `address` without notifying anyone.
+        """
+        self.remove_node(address, graceful=False)
+        return
+
+    def _register_node(self, node: KademliaNode):
+        node.bind(self._store.add(node.address))
+        self._nodes[node.address] = node
         return
 
     def discover_peers(self, node):
@@ -49,42 +162,194 @@ class KademliaNetwork:
         if not message:
             raise ValueError("invalid message")
 
+        self._scheduler.clear()
+        self._content = message.content
+        self._message_size = message.size
+        self._messages = {(message.hops, message.height): message}
         self.send_message(start_address, message)
-        while self._queue:
-            broadcast = self._queue.pop(0)
-            broadcast()
+        while self._scheduler:
+            self._scheduler.step(self)
         return
 
-    def queue_broadcast(self, broadcast):
-        self._queue = self._queue + [broadcast]
+    def queue_broadcast(self, node: KademliaNode, hops: int):
+        self._scheduler.push(node, hops)
         return
 
-    def send_message(self, address: KademliaAddress, message):
+    def broadcast_message(self, node: KademliaNode, hops: int):
+        node.broadcast_message(self.get_message(hops))
+        return
+
+    def get_message(self, hops: int, height: int = None) -> Message:
+        """
+        Returns the message being propagated as seen `hops` hops away
+        from where it started, sent through a bucket at distance
+        `height`.
+        """
+        try:
+            return self._messages[(hops, height)]
+        except KeyError:
+            self._messages[(hops, height)] = Message(
+                self._content,
+                hops,
+                height,
+                self._message_size,
+            )
+            return self._messages[(hops, height)]
+
+    def send_message(
+        self,
+        address: KademliaAddress,
+        message: Message,
+        sender: KademliaNode = None,
+    ):
         self._send_count = self._send_count + 1
-        self.nodes[address].receive_message(message)
+        node = self._nodes.get(address)
+        if node is None:
+            # the send is lost, the sender drops or marks the entry
+            self._lost_count = self._lost_count + 1
+            if sender is not None:
+                sender.mark_stale(address)
+            return
+        self._scheduler.deliver(sender, node, message)
         return
 
     def get_random_node(self) -> KademliaNode:
-        return random.choice(list(self.nodes.values()))
+        if not self._nodes:
+            raise RuntimeError("network is empty")
+
+        # draw store indices until one is alive, which avoids listing
+        # every node unless most of the store has departed
+        store = self._store
+        for _ in range(8):
+            index = self._rng.randrange(store.size)
+            if store.is_alive(index):
+                return self._nodes[store.get_address(index)]
+        return self._rng.choice(list(self._nodes.values()))
+
+    def set_rng(self, rng: RandomStream):
+        """
+        Draws every random choice of the network, its nodes and its
+        policies from `rng` from now on.
+        """
+        self._rng = rng
+        return
 
     def set_broadcast_policy(self, broadcast_policy: KademliaBroadcastPolicy):
         self._broadcast_policy = broadcast_policy
         return
 
+    def set_scheduler(self, scheduler: Scheduler):
+        self._scheduler = scheduler
+        return
+
+    def set_telemetry(self, telemetry: "DeliveryTelemetry"):
+        """
+        Records every delivery in `telemetry`, or stops recording if
+        `None`. The recording methods are swapped on the instance rather
+        than checked on every delivery, so no telemetry costs nothing.
+        """
+        if telemetry is not None and telemetry.network is not self:
+            raise ValueError("telemetry of another network")
+
+        self._telemetry = telemetry
+        self._bind_recorders()
+        return
+
+    def set_trace(self, trace: "PropagationTrace"):
+        """
+        Logs every delivery in `trace`, or stops logging if `None`, in the
+        same way as `set_telemetry`. Both can record at once.
+        """
+        if trace is not None and trace.network is not self:
+            raise ValueError("trace of another network")
+
+        self._trace = trace
+        self._bind_recorders()
+        return
+
+    def _bind_recorders(self):
+        # each recorder passes deliveries on to the methods bound before,
+        # duplicates only once there is another recorder to take them
+        for name in ["record_reception", "record_duplicate"]:
+            try:
+                delattr(self, name)
+            except AttributeError:
+                pass
+        record_duplicate = None
+        for recorder in [self._telemetry, self._trace]:
+            if recorder is not None:
+                recorder.bind(self.record_reception, record_duplicate)
+                self.record_reception = recorder.record_reception
+                self.record_duplicate = recorder.record_duplicate
+                record_duplicate = recorder.record_duplicate
+        return
+
+    def record_reception(
+        self,
+        message: Message,
+        node: KademliaNode,
+        sender: KademliaNode,
+    ):
+        """
+        Updates the propagation counters for `node` receiving `message`
+        from `sender` for the first time.
+        """
+        self._propagation = self._propagation + 1
+        hops = message.hops
+        if hops > self._max_hops:
+            self._max_hops = hops
+        while len(self._hop_histogram) <= hops:
+            self._hop_histogram.append(0)
+        self._hop_histogram[hops] = self._hop_histogram[hops] + 1
+        return
+
+    def record_duplicate(
+        self,
+        message: Message,
+        node: KademliaNode,
+        sender: KademliaNode,
+    ):
+        """
+        Called for a delivery of `message` from `sender` to `node`, which
+        already has it. Duplicates are counted from sends, so there is
+        nothing to do here, and recorders bound over it do not pass
+        duplicates on, which saves them a call per delivery.
+        """
+        return
+
     def reset(self):
         self._reset_send_count()
         self._reset_messages()
+        if self._telemetry is not None:
+            self._telemetry.reset()
+        if self._trace is not None:
+            self._trace.reset()
         return
 
     def _reset_send_count(self):
         self._send_count = 0
+        self._lost_count = 0
         return
 
     def _reset_messages(self):
-        for address in self.nodes:
-            self.nodes[address].reset_message()
+        self._epoch = self._epoch + 1
+        self._propagation = 0
+        self._max_hops = 0
+        self._hop_histogram = []
         return
 
+    @property
+    def id_space(self) -> IdSpace:
+        return self._id_space
+
+    @property
+    def rng(self) -> RandomStream:
+        return self._rng
+
+    @property
+    def store(self) -> NodeStore:
+        return self._store
+
     @property
     def seed(self) -> KademliaNode:
         return self._seed
@@ -105,25 +370,59 @@ class KademliaNetwork:
     def broadcast_policy(self) -> KademliaBroadcastPolicy:
         return self._broadcast_policy
 
+    @property
+    def scheduler(self) -> Scheduler:
+        return self._scheduler
+
+    @property
+    def telemetry(self) -> "DeliveryTelemetry":
+        return self._telemetry
+
+    @property
+    def trace(self) -> "PropagationTrace":
+        return self._trace
+
     @property
     def send_count(self) -> int:
         return self._send_count
 
+    @property
+    def duplicate_count(self) -> int:
+        """
+        Deliveries to a node that already had the message, every send
+        not lost and not a first reception. Sends a scheduler has yet to
+        deliver count as well until the propagation is over.
+        """
+        return self._send_count - self._lost_count - self._propagation
+
+    @property
+    def duplicate_ratio(self) -> float:
+        """
+        Fraction of sends delivered to a node that already had the
+        message.
+        """
+        if not self._send_count:
+            return 0.0
+        return self.duplicate_count / self._send_count
+
+    @property
+    def epoch(self) -> int:
+        return self._epoch
+
     @property
     def propagation(self) -> int:
-        return len([
-            True
-                for node in self.nodes.values()
-                if node.message
-        ])
+        return self._propagation
 
     @property
     def max_hops(self) -> int:
-        return max([
-            node.message.hops
-                for node in self.nodes.values()
-                if node.message
-        ])
+        return self._max_hops
+
+    @property
+    def hop_histogram(self) -> list:
+        """
+        Number of nodes first reached at each hop count.
+        """
+        return list(self._hop_histogram)
 
     @property
     def peer_counts(self) -> list:
@@ -1,44 +1,80 @@
 from libs.address import KademliaAddress
+from libs.idspace import IdSpace
 from libs.message import Message
 from libs.routingtable import KademliaRoutingTable
 
 import typing
 if typing.TYPE_CHECKING:
     from libs.network import KademliaNetwork
+    from libs.rng import RandomStream
 
 class KademliaNode:
+    """
+    View of a node in its network's `NodeStore`, which holds the node's
+    routing table and message state once the node is added.
+    """
     def __init__(
         self,
         network: "KademliaNetwork",
         address: "KademliaAddress",
     ):
+        if address.bits != network.id_space.bits:
+            raise ValueError("invalid address length")
+
         self._network = network
         self._address = address
-        self._routing_table = KademliaRoutingTable(address)
-        self._message = None
+        self._index = None
+        return
+
+    def bind(self, index: "int"):
+        """
+        Binds the node to its index in the network's store.
+        """
+        if self._index is not None:
+            raise RuntimeError("node already bound")
+
+        self._index = index
         return
 
     def add_address(self, address: "KademliaAddress"):
-        self._routing_table.add_address(address)
+        self._network.store.add_address(self._index, address)
+        return
+
+    def mark_stale(self, address: "KademliaAddress"):
+        """
+        Records a failed contact with the peer at `address`.
+        """
+        store = self._network.store
+        store.mark_stale(self._index, store.get_index(address))
         return
 
     def get_neighbors(self, address: "KademliaAddress") -> "list":
-        return self._routing_table.get_neighbors(address)
+        return self.routing_table.get_neighbors(address)
 
     def select_random_peers(self) -> "list":
-        return self._routing_table.select_random_peers()
+        return self.routing_table.select_random_peers(self.rng)
 
     def generate_random_addresses(self) -> "list":
-        return self._routing_table.generate_random_addresses()
-
-    def receive_message(self, message: "Message"):
-        if not self._message:
-            self._message = message
-            self._network.queue_broadcast(
-                lambda: self.broadcast_message(
-                    Message(self.message.content, self.message.hops + 1)
-                )
+        return self.routing_table.generate_random_addresses(self.rng)
+
+    def receive_message(
+        self,
+        message: "Message",
+        sender: "KademliaNode" = None,
+    ):
+        store = self._network.store
+        epoch = self._network.epoch
+        if store.get_hops(self._index, epoch) is None:
+            store.set_message(
+                self._index,
+                epoch,
+                message.hops,
+                message.height,
             )
+            self._network.record_reception(message, self, sender)
+            self._network.queue_broadcast(self, message.hops + 1)
+        else:
+            self._network.record_duplicate(message, self, sender)
         return
 
     def broadcast_message(self, message: "Message"):
@@ -46,25 +82,57 @@ class KademliaNode:
         return
 
     def send_message(self, address: "KademliaAddress", message: "Message"):
-        self._network.send_message(address, message)
+        self._network.send_message(address, message, self)
         return
 
+    def get_message(self, hops: "int", height: "int" = None) -> "Message":
+        """
+        The message being propagated as sent `hops` hops away from where
+        it started through a bucket at distance `height`, shared by every
+        node forwarding it.
+        """
+        return self._network.get_message(hops, height)
+
     def reset_message(self):
-        self._message = None
+        self._network.store.reset_message(self._index)
         return
 
     @property
     def address(self) -> "KademliaAddress":
         return self._address
 
+    @property
+    def index(self) -> "int":
+        """
+        Index of the node in the network's store, in join order.
+        """
+        return self._index
+
+    @property
+    def id_space(self) -> "IdSpace":
+        return self._network.id_space
+
+    @property
+    def rng(self) -> "RandomStream":
+        """
+        Random stream of the node's network.
+        """
+        return self._network.rng
+
     @property
     def routing_table(self) -> "KademliaRoutingTable":
-        return self._routing_table
+        if self._index is None:
+            raise RuntimeError("node not in network")
+        return KademliaRoutingTable(self._network.store, self._index)
 
     @property
     def peers(self) -> "list":
-        return self._routing_table.peers
+        return self._network.store.get_peers(self._index)
 
     @property
     def message(self) -> "Message":
-        return self._message
+        store = self._network.store
+        hops = store.get_hops(self._index, self._network.epoch)
+        if hops is None:
+            return None
+        return self._network.get_message(hops, store.get_height(self._index))
@@ -1,4 +1,5 @@
-import random
+import functools
+from libs.lookup import LookupStats, find_node
 
 import typing
 if typing.TYPE_CHECKING:
@@ -18,17 +19,15 @@ class KademliaDiscoveryPolicy:
 
         self._discovery_type = discovery_type
         self._discovery_depth = discovery_depth
+        self._lookup_stats = LookupStats()
 
         if self.discovery_type == KademliaDiscoveryPolicy.NONE:
             self._discover_peers = self.discover_peers_none
         elif self.discovery_type == KademliaDiscoveryPolicy.PARTIAL:
-            self._discover_peers = (
-                lambda network, node:
-                    self.discover_peers_partial(
-                        network,
-                        node,
-                        self.discovery_depth,
-                    )
+            # partials rather than lambdas keep policies picklable
+            self._discover_peers = functools.partial(
+                self.discover_peers_partial,
+                depth=self.discovery_depth,
             )
         elif self.discovery_type == KademliaDiscoveryPolicy.COMPLETE:
             self._discover_peers = self.discover_peers_complete
@@ -49,6 +48,7 @@ class KademliaDiscoveryPolicy:
         network: "KademliaNetwork",
         node: "KademliaNode",
     ):
+        # no depth limit, the join lookup runs until it converges
         self.discover_peers_partial(network, node, 0)
         return
 
@@ -58,30 +58,16 @@ class KademliaDiscoveryPolicy:
         node: "KademliaNode",
         depth: "int"
     ):
+        """
+        Joins through the seed and looks up the node's own address, with
+        at most `depth` rounds of queries, or until the lookup converges
+        if `depth` is not positive.
+        """
         network.seed.add_address(node.address)
         node.add_address(network.seed.address)
 
-        visited = [network.seed.address]
-        queue = network.seed.get_neighbors(node.address)
-        while True:
-            for address in queue:
-                network.nodes[address].add_address(node.address)
-                node.add_address(address)
-
-            depth = depth - 1
-            if not depth:
-                break
-
-            visited = visited + [
-                address for address in queue if not address in visited
-            ]
-            queue = [
-                neighbor
-                    for address in queue
-                    for neighbor
-                        in network.nodes[address].get_neighbors(node.address)
-                    if not neighbor in visited
-            ]
+        _, stats = find_node(network, node, node.address, depth)
+        self._lookup_stats.add(stats)
         return
 
     def discover_peers_complete(
@@ -94,20 +80,101 @@ class KademliaDiscoveryPolicy:
             node.add_address(address)
         return
 
+    def refresh_peers(
+        self,
+        network: "KademliaNetwork",
+        node: "KademliaNode",
+    ):
+        """
+        Refreshes the routing table of `node` by looking up a random
+        address in each bucket from its closest non-empty bucket up, with
+        at most `discovery_depth` rounds per lookup for partial discovery
+        and until each lookup converges otherwise. Closer buckets are
+        skipped, as no other node is expected in them.
+        """
+        buckets = node.routing_table.non_empty_buckets
+        if not buckets:
+            return
+
+        depth = 0
+        if self.discovery_type == KademliaDiscoveryPolicy.PARTIAL:
+            depth = self.discovery_depth
+        addresses = node.generate_random_addresses()
+        for address in addresses[buckets[0].distance - 1:]:
+            _, stats = find_node(network, node, address, depth)
+            self._lookup_stats.add(stats)
+        return
+
+    def bulk_discover_peers_complete(
+        self,
+        network: "KademliaNetwork",
+        nodes: "list",
+    ):
+        """
+        Fills the routing tables of `nodes`, already in `network` in join
+        order, as if each had joined with complete discovery.
+
+        After complete discovery a bucket at distance `d` holds the last
+        `k` nodes to join among those sharing the owner's address above
+        bit `d - 1` and differing at it, in join order. These are the
+        nodes whose address shifted right by `d - 1` equals the owner's
+        with the last bit flipped, so the last `k` join indices of every
+        prefix are merged up from the longest prefixes one bit at a time.
+        """
+        k = network.id_space.k
+        store = network.store
+
+        # the seed never runs discovery, every other node sees itself
+        for node in nodes[1:]:
+            store.set_bucket(node.index, 0, [node.index])
+
+        # node indices are assigned in join order
+        groups = {node.address.value: (node.index,) for node in nodes}
+        for level in range(network.id_space.bits):
+            for node in nodes:
+                joins = groups.get((node.address.value >> level) ^ 1)
+                if joins:
+                    store.set_bucket(node.index, level + 1, joins)
+
+            parents = {}
+            for prefix, joins in groups.items():
+                parent = prefix >> 1
+                if parent in parents:
+                    parents[parent] = tuple(
+                        sorted(parents[parent] + joins)[-k:]
+                    )
+                else:
+                    parents[parent] = joins
+            groups = parents
+        return
+
     @property
     def discovery_type(self) -> "str":
         return self._discovery_type
 
+    def reset_lookup_stats(self):
+        self._lookup_stats = LookupStats()
+        return
+
     @property
     def discovery_depth(self) -> "int":
         return self._discovery_depth
 
+    @property
+    def lookup_stats(self) -> "LookupStats":
+        """
+        Accumulated cost of the lookups run by joins, one lookup per join,
+        and by refreshes.
+        """
+        return self._lookup_stats
+
 class KademliaBroadcastPolicy:
     FLOOD = "flood"
     SELECT = "select"
     RANDOM = "random"
     HYBRID = "hybrid"
-    POLICIES = [FLOOD, SELECT, RANDOM, HYBRID]
+    KADCAST = "kadcast"
+    POLICIES = [FLOOD, SELECT, RANDOM, HYBRID, KADCAST]
 
     def __init__(self, broadcast_type: "str", broadcast_size: "int"):
         if broadcast_type not in KademliaBroadcastPolicy.POLICIES:
@@ -121,20 +188,19 @@ class KademliaBroadcastPolicy:
         elif self.broadcast_type == KademliaBroadcastPolicy.SELECT:
             self._broadcast_message = self.select_broadcast_message
         elif self.broadcast_type == KademliaBroadcastPolicy.RANDOM:
-            self._broadcast_message = (
-                lambda node, message: self.random_broadcast_message(
-                    node,
-                    message,
-                    self.broadcast_size,
-                )
+            self._broadcast_message = functools.partial(
+                self.random_broadcast_message,
+                size=self.broadcast_size,
             )
         elif self.broadcast_type == KademliaBroadcastPolicy.HYBRID:
-            self._broadcast_message = (
-                lambda node, message: self.hybrid_broadcast_message(
-                    node,
-                    message,
-                    self.broadcast_size,
-                )
+            self._broadcast_message = functools.partial(
+                self.hybrid_broadcast_message,
+                size=self.broadcast_size,
+            )
+        elif self.broadcast_type == KademliaBroadcastPolicy.KADCAST:
+            self._broadcast_message = functools.partial(
+                self.kadcast_broadcast_message,
+                size=self.broadcast_size,
             )
         return
 
@@ -156,7 +222,7 @@ class KademliaBroadcastPolicy:
         node: "KademliaNode",
         message: "Message",
     ):
-        peers = node.routing_table.select_random_peers()
+        peers = node.select_random_peers()
         for peer in peers:
             node.send_message(peer, message)
         return
@@ -169,7 +235,7 @@ class KademliaBroadcastPolicy:
     ):
         population = node.peers
         sample_size = min(size, len(population))
-        peers = random.sample(population, sample_size)
+        peers = node.rng.sample(population, sample_size)
         for peer in peers:
             node.send_message(peer, message)
         return
@@ -180,15 +246,43 @@ class KademliaBroadcastPolicy:
         message: "Message",
         size: "int",
     ):
-        select_peers = node.routing_table.select_random_peers()
+        select_peers = node.select_random_peers()
         population = node.peers
         sample_size = min(size, len(population))
-        random_peers = random.sample(population, sample_size)
+        random_peers = node.rng.sample(population, sample_size)
         peers = set(select_peers + random_peers)
         for peer in peers:
             node.send_message(peer, message)
         return
 
+    def kadcast_broadcast_message(
+        self,
+        node: "KademliaNode",
+        message: "Message",
+        size: "int",
+    ):
+        """
+        Forwards `message` to up to `size` random peers of each bucket
+        below the height the node received it through, as in Kadcast.
+        A message sent through bucket `d` makes the receiver responsible
+        for the subtree of nodes sharing its address above bit `d - 1`,
+        which it splits further through its lower buckets. The message
+        only ever descends into smaller subtrees, so duplicates come from
+        the `size` fold redundancy rather than from peers sending back.
+        """
+        height = node.message.height
+        if height is None:
+            height = node.id_space.bits + 1
+        for bucket in node.routing_table.non_empty_buckets:
+            if bucket.distance >= height:
+                break
+            forwarded = node.get_message(message.hops, bucket.distance)
+            population = bucket.peers
+            sample_size = min(size, len(population))
+            for peer in node.rng.sample(population, sample_size):
+                node.send_message(peer, forwarded)
+        return
+
     @property
     def broadcast_type(self) -> "str":
         return self._broadcast_type
@@ -0,0 +1,263 @@
+import contextlib
+import functools
+import time
+import tracemalloc
+
+import typing
+if typing.TYPE_CHECKING:
+    from libs.network import KademliaNetwork
+    from libs.node import KademliaNode
+
+class PhaseStats:
+    """
+    Running counters of one instrumented phase.
+    """
+    def __init__(self, name: "str"):
+        self._name = name
+        self._calls = 0
+        self._total_time = 0.0
+        self._self_time = 0.0
+        self._allocated = 0
+        return
+
+    def add_call(
+        self,
+        total_time: "float",
+        self_time: "float",
+        allocated: "int",
+    ):
+        self._calls = self._calls + 1
+        self._total_time = self._total_time + total_time
+        self._self_time = self._self_time + self_time
+        self._allocated = self._allocated + allocated
+        return
+
+    @property
+    def name(self) -> "str":
+        return self._name
+
+    @property
+    def calls(self) -> "int":
+        return self._calls
+
+    @property
+    def total_time(self) -> "float":
+        """
+        Seconds spent in the phase, nested phases included.
+        """
+        return self._total_time
+
+    @property
+    def self_time(self) -> "float":
+        """
+        Seconds spent in the phase outside nested phases.
+        """
+        return self._self_time
+
+    @property
+    def allocated(self) -> "int":
+        """
+        Net bytes allocated in the phase, nested phases included, if
+        allocations are traced.
+        """
+        return self._allocated
+
+class NetworkProfiler:
+    """
+    Phase timers and call counters for the construction and propagation
+    hot paths of `network`, with net allocated bytes per phase if
+    `trace_allocations`.
+
+    Phases are the methods below, instrumented by wrapping them on the
+    network's own instances, so a network without an enabled profiler
+    runs exactly the code it would without this module. Each call of an
+    enabled phase pays for the wrapper, which is what phases called
+    millions of times, such as `get_neighbors`, will show most. Tracing
+    allocations slows every phase several times over, so times are best
+    read from a run without it.
+
+    - `build`: `KademliaNetwork.bulk_build`
+    - `add_node`: `KademliaNetwork.add_node`
+    - `discover_peers`: the discovery policy's `discover_peers`
+    - `bulk_discover`: the discovery policy's complete discovery fill
+    - `refresh_peers`: the discovery policy's `refresh_peers`
+    - `get_neighbors`: `KademliaNode.get_neighbors` of every node
+    - `add_address`: `NodeStore.add_peer`, behind `Bucket.add_address`
+    - `propagate`: `KademliaNetwork.propagate_message`
+    - `broadcast`: the broadcast policy's `broadcast_message`
+
+    Policies are instrumented on their instances, so another network
+    sharing them is timed as well while the profiler is enabled.
+    """
+    def __init__(
+        self,
+        network: "KademliaNetwork",
+        trace_allocations: "bool" = False,
+    ):
+        self._network = network
+        self._trace_allocations = trace_allocations
+        self._enabled = False
+        self._phases = {}
+        self._started_tracing = False
+        # time spent in nested phases, one entry per phase being timed
+        self._child_times = []
+        self._wrapped = []
+        return
+
+    def enable(self):
+        if self._enabled:
+            return
+
+        network = self._network
+        if isinstance(network._register_node, functools.partial):
+            raise RuntimeError("network already profiled")
+
+        # a phase failing to wrap undoes the others, leaving the network
+        # as it was
+        try:
+            self._wrap_network()
+        except BaseException:
+            self._unwrap()
+            raise
+        self._started_tracing = (
+            self._trace_allocations and not tracemalloc.is_tracing()
+        )
+        if self._started_tracing:
+            tracemalloc.start()
+        self._enabled = True
+        return
+
+    def disable(self):
+        if not self._enabled:
+            return
+
+        self._unwrap()
+        if self._started_tracing:
+            tracemalloc.stop()
+        self._enabled = False
+        return
+
+    def _wrap_network(self):
+        network = self._network
+        self._wrap(network, "bulk_build", "build")
+        self._wrap(network, "add_node", "add_node")
+        self._wrap(network, "propagate_message", "propagate")
+        self._wrap(
+            network.discovery_policy,
+            "discover_peers",
+            "discover_peers",
+        )
+        self._wrap(
+            network.discovery_policy,
+            "bulk_discover_peers_complete",
+            "bulk_discover",
+        )
+        self._wrap(network.discovery_policy, "refresh_peers", "refresh_peers")
+        self._wrap(
+            network.broadcast_policy,
+            "broadcast_message",
+            "broadcast",
+        )
+        self._wrap(network.store, "add_peer", "add_address")
+        # nodes joining while enabled are instrumented as they come in
+        network._register_node = functools.partial(
+            self._register_node,
+            network._register_node,
+        )
+        self._wrapped.append((network, "_register_node"))
+        for node in network.nodes.values():
+            self._wrap(node, "get_neighbors", "get_neighbors")
+        return
+
+    def _wrap(self, instance, attribute: "str", name: "str"):
+        method = getattr(instance, attribute)
+        if isinstance(method, functools.partial):
+            raise RuntimeError(f"{attribute} already instrumented")
+
+        if not name in self._phases:
+            self._phases[name] = PhaseStats(name)
+        setattr(
+            instance,
+            attribute,
+            functools.partial(self._call, self._phases[name], method),
+        )
+        self._wrapped.append((instance, attribute))
+        return
+
+    def _unwrap(self):
+        for instance, attribute in self._wrapped:
+            delattr(instance, attribute)
+        self._wrapped = []
+        return
+
+    def _register_node(self, method, node: "KademliaNode"):
+        method(node)
+        self._wrap(node, "get_neighbors", "get_neighbors")
+        return
+
+    def _call(self, stats: "PhaseStats", method, *args, **kwargs):
+        child_times = self._child_times
+        child_times.append(0.0)
+        if self._trace_allocations:
+            start_allocated = tracemalloc.get_traced_memory()[0]
+        start_time = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start_time
+            allocated = 0
+            if self._trace_allocations:
+                allocated = (
+                    tracemalloc.get_traced_memory()[0] - start_allocated
+                )
+            stats.add_call(elapsed, elapsed - child_times.pop(), allocated)
+            if child_times:
+                child_times[-1] = child_times[-1] + elapsed
+
+    def reset(self):
+        self._phases = {name: PhaseStats(name) for name in self._phases}
+        # wrappers hold the old counters, rewrap onto the new ones
+        if self._enabled:
+            self.disable()
+            self.enable()
+        return
+
+    @property
+    def network(self) -> "KademliaNetwork":
+        return self._network
+
+    @property
+    def enabled(self) -> "bool":
+        return self._enabled
+
+    @property
+    def trace_allocations(self) -> "bool":
+        return self._trace_allocations
+
+    @property
+    def phases(self) -> "list":
+        """
+        Phases called at least once, by descending self time.
+        """
+        return sorted(
+            [stats for stats in self._phases.values() if stats.calls],
+            key=lambda stats: stats.self_time,
+            reverse=True,
+        )
+
+@contextlib.contextmanager
+def profile_network(
+    network: "KademliaNetwork",
+    trace_allocations: "bool" = False,
+):
+    """
+    Profiles `network` while in the block and yields the profiler, whose
+    phases hold the breakdown once the block exits.
+    """
+    profiler = NetworkProfiler(network, trace_allocations)
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+    return
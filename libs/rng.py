@@ -0,0 +1,90 @@
+import math
+import numpy as np
+
+class RandomStream:
+    """
+    Source of every random choice of a network, wrapping a NumPy
+    `Generator`.
+
+    Scalar draws are served from blocks drawn from the generator ahead of
+    time, as a NumPy call per draw costs more than the draw itself in the
+    hot loops of propagation. The sequence of draws depends only on the
+    generator's seed.
+    """
+    BLOCK_SIZE = 1 << 12
+
+    def __init__(self, generator: "np.random.Generator"):
+        self._generator = generator
+        self._uniforms = []
+        self._bytes = b""
+        self._offset = 0
+        return
+
+    @staticmethod
+    def from_seed(seed) -> "RandomStream":
+        """
+        Stream seeded with an integer or a `np.random.SeedSequence`.
+        """
+        return RandomStream(np.random.default_rng(seed))
+
+    def spawn(self, n: "int") -> "list":
+        """
+        Returns `n` independent child streams, for trials or workers.
+        """
+        return [
+            RandomStream(generator) for generator in self._generator.spawn(n)
+        ]
+
+    def random(self) -> "float":
+        if not self._uniforms:
+            self._uniforms = self._generator.random(
+                RandomStream.BLOCK_SIZE
+            ).tolist()
+        return self._uniforms.pop()
+
+    def randrange(self, n: "int") -> "int":
+        """
+        Uniform integer in `[0, n)`, for `n` far below `2 ** 53`.
+        """
+        return int(self.random() * n)
+
+    def choice(self, sequence):
+        return sequence[self.randrange(len(sequence))]
+
+    def sample(self, population, k: "int") -> "list":
+        """
+        Uniform sample of `k` distinct elements of `population`, by a
+        partial Fisher-Yates shuffle.
+        """
+        pool = list(population)
+        n = len(pool)
+        if not 0 <= k <= n:
+            raise ValueError("sample larger than population")
+
+        for i in range(k):
+            j = i + int(self.random() * (n - i))
+            pool[i], pool[j] = pool[j], pool[i]
+        return pool[:k]
+
+    def uniform(self, a: "float", b: "float") -> "float":
+        return a + (b - a) * self.random()
+
+    def expovariate(self, rate: "float") -> "float":
+        return -math.log(1.0 - self.random()) / rate
+
+    def bytes(self, n: "int") -> "bytes":
+        if self._offset + n > len(self._bytes):
+            self._bytes = self._generator.bytes(
+                max(RandomStream.BLOCK_SIZE, n)
+            )
+            self._offset = 0
+        data = self._bytes[self._offset:self._offset + n]
+        self._offset = self._offset + n
+        return data
+
+    @property
+    def generator(self) -> "np.random.Generator":
+        """
+        Underlying generator, for vectorized draws.
+        """
+        return self._generator
@@ -1,6 +1,10 @@
 import abc
+import heapq
 from libs.address import Address, KademliaAddress
 from libs.bucket import Bucket
+from libs.idspace import IdSpace
+from libs.rng import RandomStream
+from libs.store import NodeStore
 
 class RoutingTable(abc.ABC):
     def __init__(self, address: Address):
@@ -32,56 +36,116 @@ class RoutingTable(abc.ABC):
         pass
 
 class KademliaRoutingTable(RoutingTable):
-    def __init__(self, address: KademliaAddress):
-        super().__init__(address)
-        self._buckets = [
-            Bucket(address, d)
-                for d in range(KademliaAddress.ADDRESS_LENGTH + 1)
-        ]
+    """
+    View of a node's routing table in a `NodeStore`.
+    """
+    def __init__(self, store: NodeStore, index: int):
+        super().__init__(store.get_address(index))
+        self._store = store
+        self._index = index
         return
 
     def get_neighbors(
         self,
         address: KademliaAddress,
-        n=Bucket.BUCKET_SIZE
+        n: int = None,
     ) -> list:
-        return sorted(
-            self.peers,
-            key=lambda peer: peer.get_distance(address)
-        )[:n]
+        """
+        Returns the `n` closest peers to `address`, `k` by default,
+        ordered by XOR distance.
+
+        Buckets are walked outward from the bucket `address` falls in
+        and the walk stops as soon as `n` peers are collected.
+        """
+        if n is None:
+            n = self.id_space.k
+        target = address.value
+        key = lambda peer: peer.value ^ target
+        fills = self._store.get_fills(self._index).tolist()
+
+        neighbors = []
+        for d in self._get_ordered_distances(self.address.value ^ target):
+            remaining = n - len(neighbors)
+            if remaining <= 0:
+                break
+            if not fills[d]:
+                continue
+            peers = self._store.get_bucket_peers(self._index, d)
+            if len(peers) <= remaining:
+                neighbors.extend(sorted(peers, key=key))
+            else:
+                neighbors.extend(heapq.nsmallest(remaining, peers, key=key))
+        return neighbors
+
+    def _get_ordered_distances(self, xor: int):
+        """
+        Yields bucket distances so that every peer of a bucket is closer
+        to the target than any peer of a later bucket, where `xor` is the
+        XOR distance between this table's address and the target.
+
+        The target's own bucket comes first. A lower bucket `d` is closer
+        than everything below it if bit `d - 1` of `xor` is set, and
+        farther otherwise, so those with the bit set come next in
+        descending order, then bucket 0, then the rest in ascending
+        order. The buckets above the target's come last.
+        """
+        distance = xor.bit_length()
+        yield distance
+        for d in range(distance - 1, 0, -1):
+            if xor >> (d - 1) & 1:
+                yield d
+        if distance:
+            yield 0
+        for d in range(1, distance):
+            if not xor >> (d - 1) & 1:
+                yield d
+        yield from range(distance + 1, self.id_space.bits + 1)
+        return
 
     def add_address(self, address: KademliaAddress):
-        d = self.get_distance(address)
-        self._buckets[d].add_address(address)
+        self._store.add_address(self._index, address)
         return
 
     def get_distance(self, address: KademliaAddress) -> int:
         return self.address.get_distance(address)
 
-    def select_random_peers(self) -> list:
+    def select_random_peers(self, rng: RandomStream) -> list:
         """
         Selects a random peer from each bucket.
         """
         return [
-            bucket.select_random_address() for bucket in self.non_empty_buckets
+            bucket.select_random_address(rng)
+                for bucket in self.non_empty_buckets
         ]
 
-    def generate_random_addresses(self) -> list:
+    def generate_random_addresses(self, rng: RandomStream) -> list:
         """
         Generate a random address from each bucket.
         """
         return [
-            bucket.generate_random_address() for bucket in self.buckets[1:]
+            bucket.generate_random_address(rng) for bucket in self.buckets[1:]
         ]
 
+    @property
+    def id_space(self) -> IdSpace:
+        return self._store.id_space
+
     @property
     def buckets(self) -> list:
-        return self._buckets
+        return [
+            Bucket(self._store, self._index, d)
+                for d in range(self.id_space.bits + 1)
+        ]
 
     @property
     def non_empty_buckets(self) -> list:
-        return [bucket for bucket in self.buckets[1:] if bucket.peers]
+        fills = self._store.get_fills(self._index).tolist()
+        return [
+            Bucket(self._store, self._index, d)
+                for d in range(1, len(fills))
+                if fills[d]
+        ]
 
     @property
     def peers(self) -> list:
-        return [address for bucket in self.buckets for address in bucket.peers]
+        return self._store.get_peers(self._index)
@@ -0,0 +1,822 @@
+import abc
+import asyncio
+import json
+import time
+from libs.address import KademliaAddress
+from libs.idspace import DEFAULT_ID_SPACE, IdSpace
+from libs.lookup import IterativeLookup
+from libs.message import Message
+from libs.policy import KademliaBroadcastPolicy, KademliaDiscoveryPolicy
+from libs.rng import RandomStream
+from libs.routingtable import KademliaRoutingTable
+from libs.store import NodeStore
+
+# datagram types, requests are answered with the matching response
+PING = "ping"
+PONG = "pong"
+FIND_NODE = "find_node"
+NODES = "nodes"
+STORE = "store"
+STORED = "stored"
+BROADCAST = "broadcast"
+RESPONSES = [PONG, NODES, STORED]
+
+def encode_datagram(datagram: "dict") -> "bytes":
+    return json.dumps(datagram, separators=(",", ":")).encode("utf-8")
+
+def decode_datagram(data: "bytes") -> "dict":
+    return json.loads(data.decode("utf-8"))
+
+class Endpoint(abc.ABC):
+    """
+    Socket of one node bound on a `Transport`.
+    """
+    @abc.abstractmethod
+    def send(self, data: "bytes", address):
+        pass
+
+    @abc.abstractmethod
+    def close(self):
+        pass
+
+    @property
+    @abc.abstractmethod
+    def address(self):
+        """
+        Transport address of the socket, JSON serializable.
+        """
+        pass
+
+class Transport(abc.ABC):
+    """
+    Datagram transport shared by the nodes of a runtime.
+    """
+    @abc.abstractmethod
+    async def bind(self, receive) -> "Endpoint":
+        """
+        Opens an endpoint calling `receive(data, source)` for every
+        datagram it receives, where `source` is the sender's transport
+        address.
+        """
+        pass
+
+class MemoryEndpoint(Endpoint):
+    def __init__(self, transport: "MemoryTransport", address: "int"):
+        self._transport = transport
+        self._address = address
+        return
+
+    def send(self, data: "bytes", address: "int"):
+        self._transport.send(data, self._address, address)
+        return
+
+    def close(self):
+        self._transport.unbind(self._address)
+        return
+
+    @property
+    def address(self) -> "int":
+        return self._address
+
+class MemoryTransport(Transport):
+    """
+    In-process transport handing datagrams to the receiving endpoint on
+    the event loop after `delay` seconds, or on the next loop iteration
+    if zero. Each datagram is lost with probability `loss_rate`, drawn
+    from `rng`. Datagrams to closed endpoints are lost.
+    """
+    def __init__(
+        self,
+        rng: "RandomStream",
+        delay: "float" = 0.0,
+        loss_rate: "float" = 0.0,
+    ):
+        if delay < 0:
+            raise ValueError(f"invalid delay: {delay}")
+        if not 0 <= loss_rate < 1:
+            raise ValueError(f"invalid loss rate: {loss_rate}")
+
+        self._delay = delay
+        self._loss_rate = loss_rate
+        self._rng = rng
+        self._receivers = {}
+        self._next_address = 0
+        return
+
+    async def bind(self, receive) -> "MemoryEndpoint":
+        address = self._next_address
+        self._next_address = self._next_address + 1
+        self._receivers[address] = receive
+        return MemoryEndpoint(self, address)
+
+    def unbind(self, address: "int"):
+        self._receivers.pop(address, None)
+        return
+
+    def send(self, data: "bytes", source: "int", destination: "int"):
+        if self._loss_rate and self._rng.random() < self._loss_rate:
+            return
+        loop = asyncio.get_running_loop()
+        if self._delay:
+            loop.call_later(
+                self._delay,
+                self._deliver,
+                data,
+                source,
+                destination,
+            )
+        else:
+            loop.call_soon(self._deliver, data, source, destination)
+        return
+
+    def _deliver(self, data: "bytes", source: "int", destination: "int"):
+        receive = self._receivers.get(destination)
+        if receive is not None:
+            receive(data, source)
+        return
+
+    @property
+    def delay(self) -> "float":
+        return self._delay
+
+    @property
+    def loss_rate(self) -> "float":
+        return self._loss_rate
+
+class _DatagramProtocol(asyncio.DatagramProtocol):
+    def __init__(self, receive):
+        self._receive = receive
+        return
+
+    def datagram_received(self, data: "bytes", address: "tuple"):
+        self._receive(data, list(address[:2]))
+        return
+
+class UdpEndpoint(Endpoint):
+    def __init__(self, transport: "asyncio.DatagramTransport"):
+        self._transport = transport
+        self._address = list(transport.get_extra_info("sockname")[:2])
+        return
+
+    def send(self, data: "bytes", address: "list"):
+        self._transport.sendto(data, tuple(address))
+        return
+
+    def close(self):
+        self._transport.close()
+        return
+
+    @property
+    def address(self) -> "list":
+        return self._address
+
+class UdpTransport(Transport):
+    """
+    One UDP socket per node on `host`, loopback by default, each on a
+    port picked by the system. Every node holds a file descriptor, so
+    large runtimes may need a higher open file limit, and bursts beyond
+    the socket buffers are dropped by the kernel.
+    """
+    def __init__(self, host: "str" = "127.0.0.1"):
+        self._host = host
+        return
+
+    async def bind(self, receive) -> "UdpEndpoint":
+        loop = asyncio.get_running_loop()
+        transport, _ = await loop.create_datagram_endpoint(
+            lambda: _DatagramProtocol(receive),
+            local_addr=(self._host, 0),
+        )
+        return UdpEndpoint(transport)
+
+    @property
+    def host(self) -> "str":
+        return self._host
+
+class LiveNode:
+    """
+    Node of a `KademliaRuntime`, talking to its peers only through
+    datagrams on the runtime's transport.
+
+    The routing table is the node's row of the runtime's `NodeStore`, so
+    the routing table and broadcast policy classes of the synchronous
+    model work on it unchanged. Every datagram received adds its sender
+    to the table, and a request left unanswered for the runtime's
+    request timeout marks the peer stale.
+    """
+    def __init__(self, runtime: "KademliaRuntime", address: "KademliaAddress"):
+        if address.bits != runtime.id_space.bits:
+            raise ValueError("invalid address length")
+
+        self._runtime = runtime
+        self._address = address
+        self._index = runtime.store.add(address)
+        self._endpoint = None
+        # transport addresses of known nodes
+        self._endpoints = {}
+        self._pending = {}
+        self._next_request = 0
+        self._values = {}
+        # broadcast messages received in the runtime's current epoch
+        self._epoch = runtime.epoch
+        self._messages = {}
+        self._message = None
+        self._handlers = {
+            PING: self._handle_ping,
+            FIND_NODE: self._handle_find_node,
+            STORE: self._handle_store,
+            BROADCAST: self._handle_broadcast,
+        }
+        return
+
+    async def start(self):
+        self._endpoint = await self._runtime.transport.bind(self._receive)
+        return
+
+    def close(self):
+        if self._endpoint is not None:
+            self._endpoint.close()
+            self._endpoint = None
+        for future in self._pending.values():
+            future.cancel()
+        self._pending = {}
+        return
+
+    def add_contact(self, address: "KademliaAddress", endpoint):
+        """
+        Learns the transport address of the node at `address`.
+        """
+        if address != self._address:
+            self._endpoints[address] = endpoint
+        return
+
+    def add_address(self, address: "KademliaAddress"):
+        if address != self._address and address in self._runtime.store:
+            self._runtime.store.add_address(self._index, address)
+        return
+
+    def mark_stale(self, address: "KademliaAddress"):
+        store = self._runtime.store
+        # the index of a long departed peer may be reused already
+        if address in store or store.is_departed(address):
+            store.mark_stale(self._index, store.get_index(address))
+        return
+
+    def get_neighbors(self, address: "KademliaAddress") -> "list":
+        return self.routing_table.get_neighbors(address)
+
+    def select_random_peers(self) -> "list":
+        return self.routing_table.select_random_peers(self.rng)
+
+    def generate_random_addresses(self) -> "list":
+        return self.routing_table.generate_random_addresses(self.rng)
+
+    def _send(self, address: "KademliaAddress", datagram: "dict"):
+        endpoint = self._endpoints.get(address)
+        if endpoint is None or self._endpoint is None:
+            return
+        datagram["sender"] = self._address.value
+        self._runtime.record_send()
+        self._endpoint.send(encode_datagram(datagram), endpoint)
+        return
+
+    def _receive(self, data: "bytes", source):
+        self._runtime.record_receive()
+        datagram = decode_datagram(data)
+        sender = KademliaAddress(datagram["sender"], self._address.bits)
+        self.add_contact(sender, source)
+        self.add_address(sender)
+
+        if datagram["type"] in RESPONSES:
+            future = self._pending.pop(datagram["id"], None)
+            if future is not None and not future.done():
+                future.set_result(datagram)
+        else:
+            self._handlers[datagram["type"]](datagram, sender)
+        return
+
+    async def request(
+        self,
+        address: "KademliaAddress",
+        datagram: "dict",
+    ) -> "dict":
+        """
+        Sends the request `datagram` to `address` and returns the
+        response, or `None` if none arrives within the request timeout.
+        """
+        if not address in self._endpoints:
+            return None
+
+        request_id = self._next_request
+        self._next_request = self._next_request + 1
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        datagram["id"] = request_id
+        self._send(address, datagram)
+        try:
+            return await asyncio.wait_for(
+                future,
+                self._runtime.request_timeout,
+            )
+        except asyncio.TimeoutError:
+            self._pending.pop(request_id, None)
+            self._runtime.record_timeout()
+            if address in self._runtime.store:
+                self.mark_stale(address)
+            return None
+
+    async def ping(self, address: "KademliaAddress") -> "bool":
+        return await self.request(address, {"type": PING}) is not None
+
+    async def find_node(
+        self,
+        target: "KademliaAddress",
+        max_rounds: "int" = 0,
+    ) -> "tuple":
+        """
+        Iteratively looks up the `k` closest nodes to `target` by driving
+        an `IterativeLookup`, as `libs.lookup.find_node` does, sending
+        the queries of each round concurrently, and returns them with the
+        cost of the lookup.
+        """
+        lookup = IterativeLookup(
+            self.id_space,
+            self._address,
+            target,
+            self.get_neighbors(target),
+            max_rounds,
+        )
+        while True:
+            addresses = lookup.next_round()
+            if not addresses:
+                break
+
+            responses = await asyncio.gather(*[
+                self.request(
+                    address,
+                    {"type": FIND_NODE, "target": target.value},
+                )
+                    for address in addresses
+            ])
+            for address, response in zip(addresses, responses):
+                if response is None:
+                    lookup.add_failure(address)
+                    continue
+                contacts = [
+                    KademliaAddress(contact, self._address.bits)
+                        for contact, _ in response["contacts"]
+                ]
+                endpoints = dict(zip(
+                    contacts,
+                    [endpoint for _, endpoint in response["contacts"]],
+                ))
+                for contact in lookup.add_response(address, contacts):
+                    self.add_contact(contact, endpoints[contact])
+            lookup.end_round()
+        return lookup.closest, lookup.stats
+
+    async def join(self, seed: "LiveNode", policy: "KademliaDiscoveryPolicy"):
+        """
+        Joins through `seed` by looking up the node's own address, with
+        at most `discovery_depth` rounds for partial discovery and until
+        the lookup converges otherwise. Complete discovery also refreshes
+        every bucket, the closest a live node gets to knowing everyone.
+        """
+        self.add_contact(seed.address, seed.endpoint)
+        self.add_address(seed.address)
+
+        depth = 0
+        if policy.discovery_type == KademliaDiscoveryPolicy.PARTIAL:
+            depth = policy.discovery_depth
+        _, stats = await self.find_node(self._address, depth)
+        policy.lookup_stats.add(stats)
+        if policy.discovery_type == KademliaDiscoveryPolicy.COMPLETE:
+            await self.refresh(policy)
+        return
+
+    async def refresh(self, policy: "KademliaDiscoveryPolicy"):
+        """
+        Looks up a random address in each bucket from the closest
+        non-empty bucket up, as `KademliaDiscoveryPolicy.refresh_peers`.
+        """
+        buckets = self.routing_table.non_empty_buckets
+        if not buckets:
+            return
+
+        depth = 0
+        if policy.discovery_type == KademliaDiscoveryPolicy.PARTIAL:
+            depth = policy.discovery_depth
+        addresses = self.generate_random_addresses()
+        for address in addresses[buckets[0].distance - 1:]:
+            _, stats = await self.find_node(address, depth)
+            policy.lookup_stats.add(stats)
+        return
+
+    async def store_value(self, key: "KademliaAddress", value: "str") -> "int":
+        """
+        Stores `value` under `key` on the `k` closest nodes to `key` and
+        returns how many acknowledged it.
+        """
+        closest, _ = await self.find_node(key)
+        responses = await asyncio.gather(*[
+            self.request(
+                address,
+                {"type": STORE, "key": key.value, "value": value},
+            )
+                for address in closest
+        ])
+        return sum(response is not None for response in responses)
+
+    def get_value(self, key: "KademliaAddress") -> "str":
+        """
+        Value stored on this node under `key`, or `None`.
+        """
+        return self._values.get(key.value)
+
+    def send_message(self, address: "KademliaAddress", message: "Message"):
+        self._send(address, {
+            "type": BROADCAST,
+            "content": message.content,
+            "hops": message.hops,
+            "height": message.height,
+            "size": message.size,
+        })
+        return
+
+    def get_message(self, hops: "int", height: "int" = None) -> "Message":
+        """
+        The message last received as forwarded `hops` hops away from
+        where it started through a bucket at distance `height`. Messages
+        go out by value, so there is none to share.
+        """
+        return Message(
+            self._message.content,
+            hops,
+            height,
+            self._message.size,
+        )
+
+    def _handle_ping(self, datagram: "dict", sender: "KademliaAddress"):
+        self._send(sender, {"type": PONG, "id": datagram["id"]})
+        return
+
+    def _handle_find_node(self, datagram: "dict", sender: "KademliaAddress"):
+        target = KademliaAddress(datagram["target"], self._address.bits)
+        contacts = []
+        for address in self.get_neighbors(target):
+            if address == self._address:
+                continue
+            endpoint = self._endpoints.get(address)
+            if endpoint is not None:
+                contacts.append([address.value, endpoint])
+        self._send(sender, {
+            "type": NODES,
+            "id": datagram["id"],
+            "contacts": contacts,
+        })
+        return
+
+    def _handle_store(self, datagram: "dict", sender: "KademliaAddress"):
+        self._values[datagram["key"]] = datagram["value"]
+        self._send(sender, {"type": STORED, "id": datagram["id"]})
+        return
+
+    def _handle_broadcast(self, datagram: "dict", sender: "KademliaAddress"):
+        if self._epoch != self._runtime.epoch:
+            self._epoch = self._runtime.epoch
+            self._messages = {}
+            self._message = None
+
+        content = datagram["content"]
+        message = Message(
+            content,
+            datagram["hops"],
+            datagram["height"],
+            datagram["size"],
+        )
+        if content in self._messages:
+            self._runtime.record_duplicate(message)
+            return
+
+        self._messages[content] = message
+        self._message = message
+        self._runtime.record_reception(message)
+        self._runtime.broadcast_policy.broadcast_message(
+            self,
+            Message(content, message.hops + 1, None, message.size),
+        )
+        return
+
+    def receive_broadcast(self, message: "Message"):
+        """
+        Starts propagating `message` from this node.
+        """
+        self._handle_broadcast(
+            {
+                "content": message.content,
+                "hops": message.hops,
+                "height": message.height,
+                "size": message.size,
+            },
+            None,
+        )
+        return
+
+    @property
+    def address(self) -> "KademliaAddress":
+        return self._address
+
+    @property
+    def index(self) -> "int":
+        return self._index
+
+    @property
+    def endpoint(self):
+        """
+        Transport address of the node, or `None` once closed.
+        """
+        if self._endpoint is None:
+            return None
+        return self._endpoint.address
+
+    @property
+    def id_space(self) -> "IdSpace":
+        return self._runtime.id_space
+
+    @property
+    def rng(self) -> "RandomStream":
+        return self._runtime.rng
+
+    @property
+    def routing_table(self) -> "KademliaRoutingTable":
+        return KademliaRoutingTable(self._runtime.store, self._index)
+
+    @property
+    def peers(self) -> "list":
+        return self._runtime.store.get_peers(self._index)
+
+    @property
+    def message(self) -> "Message":
+        """
+        Broadcast message last received for the first time.
+        """
+        return self._message
+
+    @property
+    def values(self) -> "dict":
+        return dict(self._values)
+
+class KademliaRuntime:
+    """
+    Runs every node as a `LiveNode` in one asyncio event loop, exchanging
+    PING, FIND_NODE, STORE and BROADCAST datagrams over `transport`.
+
+    Unlike `KademliaNetwork`, nothing is delivered by method calls: joins
+    run concurrent lookups, requests time out after `request_timeout`
+    seconds, and a broadcast completes when every datagram sent has been
+    received. Propagation counters match those of `KademliaNetwork`.
+    """
+    def __init__(
+        self,
+        discovery_policy: "KademliaDiscoveryPolicy",
+        broadcast_policy: "KademliaBroadcastPolicy",
+        transport: "Transport",
+        rng: "RandomStream",
+        id_space: "IdSpace" = DEFAULT_ID_SPACE,
+        request_timeout: "float" = 1.0,
+    ):
+        if request_timeout <= 0:
+            raise ValueError(f"invalid request timeout: {request_timeout}")
+
+        self._discovery_policy = discovery_policy
+        self._broadcast_policy = broadcast_policy
+        self._transport = transport
+        self._id_space = id_space
+        self._rng = rng
+        self._request_timeout = request_timeout
+        self._store = NodeStore(id_space)
+        self._nodes = {}
+        self._seed = None
+
+        self._epoch = 0
+        self._in_flight = 0
+        self._idle = None
+        self._timeout_count = 0
+        self._send_count = 0
+        self._duplicate_count = 0
+        self._propagation = 0
+        self._max_hops = 0
+        self._hop_histogram = []
+        return
+
+    async def add_node(self, address: "KademliaAddress" = None) -> "LiveNode":
+        """
+        Starts a node at `address`, random if not given, and joins it
+        through the seed with the discovery policy.
+        """
+        if address is None:
+            address = self._store.generate_addresses(1, self._rng)[0]
+
+        node = LiveNode(self, address)
+        await node.start()
+        self._nodes[address] = node
+        if self._seed is None:
+            self._seed = node
+        else:
+            await node.join(self._seed, self._discovery_policy)
+        return node
+
+    async def add_nodes(self, count: "int") -> "list":
+        """
+        Adds `count` random nodes one after another, as each join relies
+        on the tables built by the previous ones.
+        """
+        return [await self.add_node() for _ in range(count)]
+
+    def remove_node(self, address: "KademliaAddress"):
+        """
+        Stops the node at `address` without notifying anyone.
+        """
+        node = self._nodes.pop(address, None)
+        if node is None:
+            raise ValueError("node not in network")
+
+        node.close()
+        self._store.kill(node.index)
+        if self._seed is node:
+            self._seed = next(iter(self._nodes.values()), None)
+        return
+
+    async def broadcast(
+        self,
+        message: "Message",
+        start_address: "KademliaAddress",
+        timeout: "float" = None,
+    ) -> "float":
+        """
+        Propagates `message` from the node at `start_address` and returns
+        the seconds until every datagram sent was received. Lost
+        datagrams keep the runtime busy, so waiting gives up after
+        `timeout` seconds, the request timeout by default.
+        """
+        if timeout is None:
+            timeout = self._request_timeout
+
+        self.reset()
+        start_time = time.perf_counter()
+        self._nodes[start_address].receive_broadcast(message)
+        await self.wait_idle(timeout)
+        return time.perf_counter() - start_time
+
+    async def wait_idle(self, timeout: "float") -> "bool":
+        """
+        Waits until no datagram is in flight, for at most `timeout`
+        seconds, and returns whether the runtime went idle.
+        """
+        if not self._in_flight:
+            return True
+        self._idle = asyncio.Event()
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self._idle = None
+        return True
+
+    async def stop(self):
+        for node in self._nodes.values():
+            node.close()
+        # let pending deliveries and closing sockets drain
+        await asyncio.sleep(0)
+        return
+
+    async def __aenter__(self) -> "KademliaRuntime":
+        return self
+
+    async def __aexit__(self, *args):
+        await self.stop()
+        return
+
+    def get_random_node(self) -> "LiveNode":
+        return self._rng.choice(list(self._nodes.values()))
+
+    def record_send(self):
+        self._send_count = self._send_count + 1
+        self._in_flight = self._in_flight + 1
+        return
+
+    def record_receive(self):
+        # datagrams sent before a reset no longer count
+        self._in_flight = max(self._in_flight - 1, 0)
+        if not self._in_flight and self._idle is not None:
+            self._idle.set()
+        return
+
+    def record_timeout(self):
+        self._timeout_count = self._timeout_count + 1
+        return
+
+    def record_reception(self, message: "Message"):
+        self._propagation = self._propagation + 1
+        hops = message.hops
+        if hops > self._max_hops:
+            self._max_hops = hops
+        while len(self._hop_histogram) <= hops:
+            self._hop_histogram.append(0)
+        self._hop_histogram[hops] = self._hop_histogram[hops] + 1
+        return
+
+    def record_duplicate(self, message: "Message"):
+        self._duplicate_count = self._duplicate_count + 1
+        return
+
+    def reset(self):
+        """
+        Resets the propagation counters and starts a new epoch, in which
+        every node takes broadcast messages as new. Datagrams lost before
+        now no longer count as in flight.
+        """
+        self._epoch = self._epoch + 1
+        self._in_flight = 0
+        self._send_count = 0
+        self._duplicate_count = 0
+        self._propagation = 0
+        self._max_hops = 0
+        self._hop_histogram = []
+        return
+
+    @property
+    def discovery_policy(self) -> "KademliaDiscoveryPolicy":
+        return self._discovery_policy
+
+    @property
+    def broadcast_policy(self) -> "KademliaBroadcastPolicy":
+        return self._broadcast_policy
+
+    @property
+    def transport(self) -> "Transport":
+        return self._transport
+
+    @property
+    def id_space(self) -> "IdSpace":
+        return self._id_space
+
+    @property
+    def rng(self) -> "RandomStream":
+        return self._rng
+
+    @property
+    def epoch(self) -> "int":
+        return self._epoch
+
+    @property
+    def request_timeout(self) -> "float":
+        return self._request_timeout
+
+    @property
+    def store(self) -> "NodeStore":
+        return self._store
+
+    @property
+    def nodes(self) -> "dict":
+        return self._nodes
+
+    @property
+    def seed(self) -> "LiveNode":
+        return self._seed
+
+    @property
+    def size(self) -> "int":
+        return len(self._nodes)
+
+    @property
+    def send_count(self) -> "int":
+        """
+        Datagrams sent since the last reset, requests and responses
+        included.
+        """
+        return self._send_count
+
+    @property
+    def timeout_count(self) -> "int":
+        return self._timeout_count
+
+    @property
+    def duplicate_count(self) -> "int":
+        return self._duplicate_count
+
+    @property
+    def propagation(self) -> "int":
+        return self._propagation
+
+    @property
+    def max_hops(self) -> "int":
+        return self._max_hops
+
+    @property
+    def hop_histogram(self) -> "list":
+        """
+        Number of nodes first reached at each hop count.
+        """
+        return list(self._hop_histogram)
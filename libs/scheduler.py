@@ -0,0 +1,85 @@
+import abc
+import collections
+
+import typing
+if typing.TYPE_CHECKING:
+    from libs.message import Message
+    from libs.network import KademliaNetwork
+    from libs.node import KademliaNode
+
+class Scheduler(abc.ABC):
+    """
+    Decides when sent messages are delivered and when nodes that received
+    a message broadcast it on.
+    """
+    @abc.abstractmethod
+    def push(self, node: "KademliaNode", hops: "int"):
+        """
+        Schedules `node` to broadcast the message with `hops`.
+        """
+        pass
+
+    @abc.abstractmethod
+    def deliver(
+        self,
+        sender: "KademliaNode",
+        node: "KademliaNode",
+        message: "Message",
+    ):
+        """
+        Schedules the delivery of `message` from `sender` to `node`.
+        `sender` is `None` for the message starting a propagation.
+        """
+        pass
+
+    @abc.abstractmethod
+    def step(self, network: "KademliaNetwork"):
+        """
+        Processes the next pending event.
+        """
+        pass
+
+    @abc.abstractmethod
+    def clear(self):
+        pass
+
+    @abc.abstractmethod
+    def __len__(self) -> "int":
+        pass
+
+class PropagationScheduler(Scheduler):
+    """
+    FIFO queue of pending broadcasts stored as (node, hops) records.
+
+    Messages are delivered as soon as they are sent and nodes are
+    dequeued in the order they first received the message, which keeps
+    the BFS hop ordering of a propagation.
+    """
+    def __init__(self):
+        self._queue = collections.deque()
+        return
+
+    def push(self, node: "KademliaNode", hops: "int"):
+        self._queue.append((node, hops))
+        return
+
+    def deliver(
+        self,
+        sender: "KademliaNode",
+        node: "KademliaNode",
+        message: "Message",
+    ):
+        node.receive_message(message, sender)
+        return
+
+    def step(self, network: "KademliaNetwork"):
+        node, hops = self._queue.popleft()
+        network.broadcast_message(node, hops)
+        return
+
+    def clear(self):
+        self._queue.clear()
+        return
+
+    def __len__(self) -> "int":
+        return len(self._queue)
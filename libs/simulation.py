@@ -0,0 +1,204 @@
+import collections
+import heapq
+import itertools
+import numpy as np
+from libs.latency import LatencyModel
+from libs.scheduler import Scheduler
+
+import typing
+if typing.TYPE_CHECKING:
+    from libs.message import Message
+    from libs.network import KademliaNetwork
+    from libs.node import KademliaNode
+
+class EventScheduler(Scheduler):
+    """
+    Discrete-event scheduler keeping simulated time in seconds.
+
+    Deliveries arrive after the link latency given by `latency_model`. A
+    node that receives the message for the first time broadcasts it after
+    `processing_delay`. If an upload bandwidth (bytes per second) is set,
+    every node has an outbound queue: its sends leave one after another,
+    each taking `message.size / bandwidth` to serialize, starting once
+    the sends queued before them are out.
+
+    `upload_bandwidth` applies to every node unless overridden per node
+    with `set_upload_bandwidths`.
+    """
+    def __init__(
+        self,
+        latency_model: "LatencyModel",
+        processing_delay: "float" = 0.0,
+        upload_bandwidth: "float" = None,
+    ):
+        if processing_delay < 0:
+            raise ValueError(f"invalid processing delay: {processing_delay}")
+        if upload_bandwidth is not None and upload_bandwidth <= 0:
+            raise ValueError(f"invalid upload bandwidth: {upload_bandwidth}")
+
+        self._latency_model = latency_model
+        self._processing_delay = processing_delay
+        self._upload_bandwidth = upload_bandwidth
+        self._upload_bandwidths = None
+        self.clear()
+        return
+
+    def set_upload_bandwidths(self, upload_bandwidths: "np.ndarray"):
+        """
+        Sets the upload bandwidth of each node by store index, or falls
+        back to `upload_bandwidth` for every node if `None`.
+        """
+        if upload_bandwidths is not None:
+            upload_bandwidths = np.asarray(upload_bandwidths, dtype=float)
+            if (upload_bandwidths <= 0).any():
+                raise ValueError("invalid upload bandwidths")
+            upload_bandwidths = upload_bandwidths.tolist()
+
+        self._upload_bandwidths = upload_bandwidths
+        return
+
+    def push(self, node: "KademliaNode", hops: "int"):
+        heapq.heappush(
+            self._events,
+            (
+                self._time + self._processing_delay,
+                next(self._counter),
+                node,
+                hops,
+                None,
+                None,
+            ),
+        )
+        return
+
+    def deliver(
+        self,
+        sender: "KademliaNode",
+        node: "KademliaNode",
+        message: "Message",
+    ):
+        if sender is None:
+            time = self._time
+        else:
+            if self._upload_bandwidths is not None:
+                bandwidth = self._upload_bandwidths[sender.index]
+            else:
+                bandwidth = self._upload_bandwidth
+            if bandwidth:
+                time = self._enqueue_upload(sender.index, message, bandwidth)
+            else:
+                time = self._time
+            time = time + self._latency_model.get_latency(
+                sender.address,
+                node.address,
+            )
+        heapq.heappush(
+            self._events,
+            (time, next(self._counter), node, 0, message, sender),
+        )
+        return
+
+    def _enqueue_upload(
+        self,
+        index: "int",
+        message: "Message",
+        bandwidth: "float",
+    ) -> "float":
+        """
+        Queues `message` on the outbound queue of node `index` and returns
+        the time it is fully sent.
+        """
+        queue = self._upload_queues.get(index)
+        if queue is None:
+            queue = collections.deque()
+            self._upload_queues[index] = queue
+        # sends already out by now leave the queue
+        while queue and queue[0] <= self._time:
+            queue.popleft()
+        start = queue[-1] if queue else self._time
+        time = start + message.size / bandwidth
+        queue.append(time)
+        if len(queue) > self._queue_depths.get(index, 0):
+            self._queue_depths[index] = len(queue)
+        return time
+
+    def step(self, network: "KademliaNetwork"):
+        time, _, node, hops, message, sender = heapq.heappop(self._events)
+        self._time = time
+        if message is None:
+            network.broadcast_message(node, hops)
+        else:
+            if not node.message:
+                self._arrival_times[node.address] = time
+            node.receive_message(message, sender)
+        return
+
+    def clear(self):
+        self._events = []
+        # tie-breaker keeping events at the same time in FIFO order
+        self._counter = itertools.count()
+        self._time = 0.0
+        # finish times of the sends queued at each node, by store index
+        self._upload_queues = {}
+        self._queue_depths = {}
+        self._arrival_times = {}
+        return
+
+    def get_coverage_times(self, network_size: "int", fractions: "list"):
+        """
+        Returns the simulated time by which each fraction of
+        `network_size` nodes had received the message, or `inf` if the
+        message never reached that many nodes.
+        """
+        arrival_times = np.sort(np.fromiter(
+            self._arrival_times.values(),
+            dtype=float,
+            count=len(self._arrival_times),
+        ))
+        coverage_times = []
+        for fraction in fractions:
+            count = max(int(np.ceil(fraction * network_size)), 1)
+            if count > len(arrival_times):
+                coverage_times.append(float("inf"))
+            else:
+                coverage_times.append(float(arrival_times[count - 1]))
+        return coverage_times
+
+    def __len__(self) -> "int":
+        return len(self._events)
+
+    @property
+    def time(self) -> "float":
+        return self._time
+
+    @property
+    def arrival_times(self) -> "dict":
+        """
+        Simulated arrival time of the message at each reached node, keyed
+        by address.
+        """
+        return self._arrival_times
+
+    @property
+    def queue_depths(self) -> "dict":
+        """
+        Largest number of sends queued at once at each node that sent
+        anything, keyed by store index.
+        """
+        return self._queue_depths
+
+    @property
+    def latency_model(self) -> "LatencyModel":
+        return self._latency_model
+
+    @property
+    def processing_delay(self) -> "float":
+        return self._processing_delay
+
+    @property
+    def upload_bandwidth(self) -> "float":
+        return self._upload_bandwidth
+
+    @property
+    def upload_bandwidths(self) -> "list":
+        return self._upload_bandwidths
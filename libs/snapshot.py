@@ -0,0 +1,175 @@
+import json
+import numpy as np
+from libs.address import KademliaAddress
+from libs.idspace import IdSpace
+from libs.network import KademliaNetwork
+from libs.policy import KademliaBroadcastPolicy, KademliaDiscoveryPolicy
+from libs.rng import RandomStream
+from libs.vectorized import FrozenNetwork
+
+# file layout: MAGIC, little-endian uint64 header length and JSON header
+# within the first HEADER_SIZE bytes, then the arrays listed in the
+# header at ALIGNMENT-aligned offsets
+MAGIC = b"KADNET01"
+VERSION = 1
+HEADER_SIZE = 4096
+ALIGNMENT = 64
+
+def save_network(kademlia_network: KademliaNetwork, path: str):
+    """
+    Writes the addresses, seed, policies and every routing table of
+    `kademlia_network`, with bucket contents in LRU order.
+
+    Arrays stored:
+        addresses: (n, address bytes) uint8, big-endian IDs
+        bucket_indptr: (n * (bits + 1) + 1,) int64, where the peers of
+            bucket `d` of node `i` are entries
+            `bucket_indptr[i * (bits + 1) + d]` up to the next offset
+        peer_indices: int32 node index of each entry
+        peer_buckets: int16 bucket of each entry
+    """
+    if kademlia_network.size != kademlia_network.store.size:
+        raise ValueError("network has departed nodes")
+
+    id_space = kademlia_network.id_space
+    address_bytes = (id_space.bits + 7) // 8
+
+    addresses = np.frombuffer(
+        b"".join([
+            address.value.to_bytes(address_bytes, "big")
+                for address in kademlia_network.nodes
+        ]),
+        dtype=np.uint8,
+    ).reshape(kademlia_network.size, address_bytes)
+    bucket_indptr, peer_indices, peer_buckets = (
+        kademlia_network.store.get_peer_arrays()
+    )
+    arrays = {
+        "addresses": addresses,
+        "bucket_indptr": bucket_indptr,
+        "peer_indices": peer_indices,
+        "peer_buckets": peer_buckets,
+    }
+
+    discovery_policy = kademlia_network.discovery_policy
+    broadcast_policy = kademlia_network.broadcast_policy
+    header = {
+        "version": VERSION,
+        "id_space": {
+            "bits": id_space.bits,
+            "k": id_space.k,
+            "alpha": id_space.alpha,
+        },
+        "discovery_policy": {
+            "discovery_type": discovery_policy.discovery_type,
+            "discovery_depth": discovery_policy.discovery_depth,
+        },
+        "broadcast_policy": {
+            "broadcast_type": broadcast_policy.broadcast_type,
+            "broadcast_size": broadcast_policy.broadcast_size,
+        },
+        "size": kademlia_network.size,
+        "seed_index": (
+            kademlia_network.seed.index if kademlia_network.seed else None
+        ),
+        "arrays": {},
+    }
+
+    offset = HEADER_SIZE
+    for name, array in arrays.items():
+        header["arrays"][name] = {
+            "offset": offset,
+            "dtype": array.dtype.str,
+            "shape": list(array.shape),
+        }
+        offset = _align(offset + array.nbytes)
+    header_bytes = json.dumps(header).encode("utf-8")
+    if len(MAGIC) + 8 + len(header_bytes) > HEADER_SIZE:
+        raise RuntimeError("header too large")
+
+    with open(path, "wb") as f:
+        f.write(MAGIC)
+        f.write(len(header_bytes).to_bytes(8, "little"))
+        f.write(header_bytes)
+        for name, array in arrays.items():
+            f.seek(header["arrays"][name]["offset"])
+            f.write(np.ascontiguousarray(array).tobytes())
+    return
+
+def load_header(path: str) -> dict:
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"invalid snapshot file: {path}")
+        header_length = int.from_bytes(f.read(8), "little")
+        header = json.loads(f.read(header_length).decode("utf-8"))
+    if header["version"] != VERSION:
+        raise ValueError(f"unsupported snapshot version: {header['version']}")
+    return header
+
+def load_arrays(path: str, header: dict = None) -> dict:
+    """
+    Returns the snapshot arrays as read-only memory maps, so that loading
+    is lazy and processes mapping the same file share its pages.
+    """
+    if header is None:
+        header = load_header(path)
+    arrays = {}
+    for name, spec in header["arrays"].items():
+        shape = tuple(spec["shape"])
+        if not np.prod(shape):
+            arrays[name] = np.zeros(shape, dtype=spec["dtype"])
+        else:
+            arrays[name] = np.memmap(
+                path,
+                dtype=spec["dtype"],
+                mode="r",
+                offset=spec["offset"],
+                shape=shape,
+            )
+    return arrays
+
+def load_network(path: str, rng: RandomStream) -> KademliaNetwork:
+    """
+    Rebuilds the saved `KademliaNetwork` with identical routing tables,
+    drawing from `rng`.
+    """
+    header = load_header(path)
+    arrays = load_arrays(path, header)
+    id_space = IdSpace(**header["id_space"])
+    kademlia_network = KademliaNetwork(
+        KademliaDiscoveryPolicy(**header["discovery_policy"]),
+        KademliaBroadcastPolicy(**header["broadcast_policy"]),
+        rng,
+        id_space,
+    )
+    addresses = [
+        KademliaAddress(int.from_bytes(row.tobytes(), "big"), id_space.bits)
+            for row in arrays["addresses"]
+    ]
+    kademlia_network.restore_nodes(addresses, header["seed_index"])
+    kademlia_network.store.set_peer_arrays(
+        arrays["bucket_indptr"],
+        arrays["peer_indices"],
+    )
+    return kademlia_network
+
+def load_frozen_network(path: str) -> FrozenNetwork:
+    """
+    Maps the saved network as a `FrozenNetwork` without copying its
+    peer arrays.
+    """
+    header = load_header(path)
+    arrays = load_arrays(path, header)
+    num_buckets = header["id_space"]["bits"] + 1
+    return FrozenNetwork(
+        peer_indptr=arrays["bucket_indptr"][::num_buckets],
+        peer_indices=arrays["peer_indices"],
+        peer_buckets=arrays["peer_buckets"],
+        seed_index=header["seed_index"],
+        broadcast_policy=KademliaBroadcastPolicy(
+            **header["broadcast_policy"]
+        ),
+    )
+
+def _align(offset: int) -> int:
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
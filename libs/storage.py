@@ -0,0 +1,465 @@
+import collections
+import functools
+import hashlib
+import heapq
+import numpy as np
+from libs.address import KademliaAddress
+from libs.lookup import LookupStats, find_node
+
+import typing
+if typing.TYPE_CHECKING:
+    from libs.latency import LatencyModel
+    from libs.network import KademliaNetwork
+    from libs.node import KademliaNode
+
+def get_key_address(key: "str", bits: "int") -> "KademliaAddress":
+    """
+    Address a key is stored at, the first `bits` bits of its SHA-256.
+    """
+    digest = hashlib.sha256(key.encode("utf-8")).digest()
+    return KademliaAddress(int.from_bytes(digest, "big") >> (256 - bits), bits)
+
+class ValueStore:
+    """
+    Values held by one node, at most `capacity`, evicting the least
+    recently used. Entries are either stored by a STORE or cached by a
+    lookup that passed by.
+    """
+    def __init__(self, capacity: "int"):
+        if capacity < 1:
+            raise ValueError(f"invalid capacity: {capacity}")
+
+        self._capacity = capacity
+        self._entries = collections.OrderedDict()
+        self._evictions = 0
+        return
+
+    def get(self, key: "str") -> "str":
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key: "str", value: "str", cached: "bool" = False):
+        """
+        Puts `value` under `key`. A cached value never replaces a stored
+        one.
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            cached = cached and entry[1]
+            self._entries.move_to_end(key)
+        self._entries[key] = (value, cached)
+        if len(self._entries) > self._capacity:
+            self._entries.popitem(last=False)
+            self._evictions = self._evictions + 1
+        return
+
+    def is_cached(self, key: "str") -> "bool":
+        entry = self._entries.get(key)
+        return entry is not None and entry[1]
+
+    def __contains__(self, key: "str") -> "bool":
+        return key in self._entries
+
+    def __len__(self) -> "int":
+        return len(self._entries)
+
+    @property
+    def capacity(self) -> "int":
+        return self._capacity
+
+    @property
+    def evictions(self) -> "int":
+        return self._evictions
+
+class ValueLookup:
+    """
+    Outcome of one FIND_VALUE lookup.
+    """
+    def __init__(
+        self,
+        key: "str",
+        value: "str",
+        holder: "int",
+        stats: "LookupStats",
+        latency: "float",
+    ):
+        self._key = key
+        self._value = value
+        self._holder = holder
+        self._stats = stats
+        self._latency = latency
+        return
+
+    @property
+    def key(self) -> "str":
+        return self._key
+
+    @property
+    def value(self) -> "str":
+        """
+        Value found, or `None` if the lookup failed.
+        """
+        return self._value
+
+    @property
+    def holder(self) -> "int":
+        """
+        Store index of the node that returned the value, or `None`.
+        """
+        return self._holder
+
+    @property
+    def stats(self) -> "LookupStats":
+        return self._stats
+
+    @property
+    def hops(self) -> "int":
+        """
+        Rounds of queries until the value was found, zero if the
+        looking up node held it.
+        """
+        return self._stats.rounds
+
+    @property
+    def latency(self) -> "float":
+        """
+        Round trip latency of the lookup, each round taking as long as
+        its slowest query.
+        """
+        return self._latency
+
+    @property
+    def success(self) -> "bool":
+        return self._value is not None
+
+class KademliaStorage:
+    """
+    Key-value layer over `network`, each node holding a `ValueStore` of
+    `capacity` values.
+
+    A value is stored on the `k` closest nodes to its key. FIND_VALUE
+    runs the iterative lookup of `libs.lookup.find_node`, stopping at the
+    first queried node holding the value, after which the value is
+    cached on the closest queried node that did not have it, so lookups
+    for popular keys end sooner and spread over more nodes. `republish`
+    stores every published value again on the current `k` closest, as
+    nodes join and leave.
+
+    Lookup hops and latency, with `latency_model` giving one-way link
+    latencies, and per-node and per-key load are recorded as lookups
+    run.
+    """
+    def __init__(
+        self,
+        network: "KademliaNetwork",
+        capacity: "int" = 1024,
+        latency_model: "LatencyModel" = None,
+    ):
+        if capacity < 1:
+            raise ValueError(f"invalid capacity: {capacity}")
+
+        self._network = network
+        self._capacity = capacity
+        self._latency_model = latency_model
+        self._stores = {}
+        # key -> (publisher address, value)
+        self._published = {}
+        self.reset_stats()
+        return
+
+    def get_store(self, index: "int") -> "ValueStore":
+        # values held by a departed node do not pass on to the node that
+        # reuses its index
+        generation = self._network.store.get_generation(index)
+        entry = self._stores.get(index)
+        if entry is None or entry[0] != generation:
+            entry = (generation, ValueStore(self._capacity))
+            self._stores[index] = entry
+        return entry[1]
+
+    def store(self, node: "KademliaNode", key: "str", value: "str") -> "int":
+        """
+        Publishes `value` under `key` from `node` and returns the number
+        of nodes it was stored on.
+        """
+        self._published[key] = (node.address, value)
+        return self._store(node, key, value)
+
+    def _store(self, node: "KademliaNode", key: "str", value: "str") -> "int":
+        target = get_key_address(key, self._network.id_space.bits)
+        closest, stats = find_node(self._network, node, target)
+        self._store_stats.add(stats)
+        # the publisher is a candidate too, the lookup never returns it
+        closest = heapq.nsmallest(
+            self._network.id_space.k,
+            closest + [node.address],
+            key=lambda address: address.value ^ target.value,
+        )
+        store = self._network.store
+        for address in closest:
+            self.get_store(store.get_index(address)).put(key, value)
+        return len(closest)
+
+    def republish(self) -> "int":
+        """
+        Stores every published value again from its publisher, or from a
+        random node if the publisher left, and returns the number of
+        values republished.
+        """
+        if not self._network.size:
+            return 0
+
+        for key, (address, value) in self._published.items():
+            node = self._network.nodes.get(address)
+            if node is None:
+                node = self._network.get_random_node()
+                self._published[key] = (node.address, value)
+            self._store(node, key, value)
+        return len(self._published)
+
+    def find_value(self, node: "KademliaNode", key: "str") -> "ValueLookup":
+        """
+        Looks up `key` from `node`.
+        """
+        self._key_counts[key] = self._key_counts[key] + 1
+        found = self.get_store(node.index).get(key)
+        if found is not None:
+            stats = LookupStats()
+            stats.add_lookup()
+            return self._record_lookup(key, found, node.index, stats, 0.0)
+
+        search = _ValueSearch(node, key)
+        target = get_key_address(key, self._network.id_space.bits)
+        _, stats = find_node(
+            self._network,
+            node,
+            target,
+            on_query=functools.partial(self._query_value, search),
+            on_round=functools.partial(self._end_round, search),
+        )
+        if search.holder is None:
+            return self._record_lookup(key, None, None, stats, search.latency)
+
+        self._cache(key, search.value, search.peers, search.holder, target)
+        return self._record_lookup(
+            key,
+            search.value,
+            search.holder.index,
+            stats,
+            search.latency,
+        )
+
+    def _query_value(
+        self,
+        search: "_ValueSearch",
+        peer: "KademliaNode",
+    ) -> "bool":
+        self._query_counts[peer.index] = self._query_counts[peer.index] + 1
+        value = self.get_store(peer.index).get(search.key)
+        if value is None:
+            return False
+        search.set_found(value, peer)
+        return True
+
+    def _end_round(self, search: "_ValueSearch", peers: "list"):
+        # a round takes as long as its slowest query
+        latency = max(
+            [self._get_round_trip(search.node, peer) for peer in peers],
+            default=0.0,
+        )
+        search.add_round(peers, latency)
+        return
+
+    def _get_round_trip(self, node: "KademliaNode", peer: "KademliaNode"):
+        if self._latency_model is None:
+            return 0.0
+        return (
+            self._latency_model.get_latency(node.address, peer.address)
+                + self._latency_model.get_latency(peer.address, node.address)
+        )
+
+    def _cache(
+        self,
+        key: "str",
+        value: "str",
+        peers: "list",
+        holder: "KademliaNode",
+        target: "KademliaAddress",
+    ):
+        candidates = [peer for peer in peers if peer is not holder]
+        if candidates:
+            peer = min(
+                candidates,
+                key=lambda peer: peer.address.value ^ target.value,
+            )
+            self.get_store(peer.index).put(key, value, cached=True)
+            self._cache_count = self._cache_count + 1
+        return
+
+    def _record_lookup(
+        self,
+        key: "str",
+        value: "str",
+        holder: "int",
+        stats: "LookupStats",
+        latency: "float",
+    ) -> "ValueLookup":
+        self._lookup_stats.add(stats)
+        self._hops.append(stats.rounds)
+        self._latencies.append(latency)
+        if holder is not None:
+            self._hit_count = self._hit_count + 1
+            self._serve_counts[holder] = self._serve_counts[holder] + 1
+        return ValueLookup(key, value, holder, stats, latency)
+
+    def reset_stats(self):
+        self._store_stats = LookupStats()
+        self._lookup_stats = LookupStats()
+        self._hops = []
+        self._latencies = []
+        self._hit_count = 0
+        self._cache_count = 0
+        self._key_counts = collections.Counter()
+        self._query_counts = collections.Counter()
+        self._serve_counts = collections.Counter()
+        return
+
+    def _get_counts(self, counts: "collections.Counter") -> "np.ndarray":
+        array = np.zeros(self._network.store.size, dtype=np.int64)
+        for index, count in counts.items():
+            array[index] = count
+        return array
+
+    @property
+    def network(self) -> "KademliaNetwork":
+        return self._network
+
+    @property
+    def capacity(self) -> "int":
+        return self._capacity
+
+    @property
+    def published(self) -> "dict":
+        """
+        Published values by key.
+        """
+        return {key: value for key, (_, value) in self._published.items()}
+
+    @property
+    def store_stats(self) -> "LookupStats":
+        """
+        Cost of the lookups run by stores and republishes.
+        """
+        return self._store_stats
+
+    @property
+    def lookup_stats(self) -> "LookupStats":
+        """
+        Cost of the FIND_VALUE lookups.
+        """
+        return self._lookup_stats
+
+    @property
+    def lookup_count(self) -> "int":
+        return len(self._hops)
+
+    @property
+    def hit_count(self) -> "int":
+        return self._hit_count
+
+    @property
+    def cache_count(self) -> "int":
+        """
+        Values cached along lookup paths.
+        """
+        return self._cache_count
+
+    @property
+    def hops(self) -> "np.ndarray":
+        """
+        Hops of every lookup, failed ones included.
+        """
+        return np.array(self._hops, dtype=np.int64)
+
+    @property
+    def latencies(self) -> "np.ndarray":
+        return np.array(self._latencies, dtype=float)
+
+    @property
+    def key_counts(self) -> "dict":
+        """
+        Lookups per key.
+        """
+        return dict(self._key_counts)
+
+    @property
+    def query_counts(self) -> "np.ndarray":
+        """
+        FIND_VALUE queries received by each node, by store index.
+        """
+        return self._get_counts(self._query_counts)
+
+    @property
+    def serve_counts(self) -> "np.ndarray":
+        """
+        Lookups answered with the value by each node, by store index,
+        the load hot keys put on the nodes holding them.
+        """
+        return self._get_counts(self._serve_counts)
+
+    @property
+    def eviction_count(self) -> "int":
+        return sum(store.evictions for _, store in self._stores.values())
+
+class _ValueSearch:
+    """
+    State of one FIND_VALUE lookup from `node`.
+    """
+    def __init__(self, node: "KademliaNode", key: "str"):
+        self._node = node
+        self._key = key
+        self._value = None
+        self._holder = None
+        self._peers = []
+        self._latency = 0.0
+        return
+
+    def set_found(self, value: "str", holder: "KademliaNode"):
+        self._value = value
+        self._holder = holder
+        return
+
+    def add_round(self, peers: "list", latency: "float"):
+        self._peers.extend(peers)
+        self._latency = self._latency + latency
+        return
+
+    @property
+    def node(self) -> "KademliaNode":
+        return self._node
+
+    @property
+    def key(self) -> "str":
+        return self._key
+
+    @property
+    def value(self) -> "str":
+        return self._value
+
+    @property
+    def holder(self) -> "KademliaNode":
+        return self._holder
+
+    @property
+    def peers(self) -> "list":
+        """
+        Nodes that answered a query, in query order.
+        """
+        return self._peers
+
+    @property
+    def latency(self) -> "float":
+        return self._latency
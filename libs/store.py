@@ -0,0 +1,493 @@
+import numpy as np
+from libs.address import KademliaAddress
+from libs.idspace import IdSpace
+from libs.rng import RandomStream
+
+class NodeStore:
+    """
+    Flat storage of the nodes of a network, indexed in join order.
+
+    Routing tables are one `(capacity, bits + 1, k)` int32 array of peer
+    node indices, with the number of peers in each bucket in a
+    `(capacity, bits + 1)` fill count array. Peers of a bucket are kept
+    least recently seen first. Message state is one epoch, one hop count
+    and one height per node. Addresses stay packed `KademliaAddress`
+    objects, as they are the keys peers are looked up by.
+
+    Nodes that left keep their index for a while, so entries pointing to
+    them go stale rather than pointing to another node. Once departed
+    nodes make up `PURGE_RATIO` of all indices, and are at least
+    `PURGE_MINIMUM`, every entry still pointing to one is dropped in one
+    pass and their indices are reused by joining nodes, so the arrays
+    stay bounded under churn. Each reuse bumps the index's generation,
+    for holders of indices outside the routing tables.
+    """
+    PURGE_RATIO = 0.25
+    # fewer departed nodes free too few indices to pay for a purge pass
+    PURGE_MINIMUM = 16
+
+    def __init__(self, id_space: IdSpace, capacity: int = 16):
+        self._id_space = id_space
+        self._size = 0
+        self._addresses = []
+        self._indices = {}
+        # indices of departed nodes not reused yet, and the last of them
+        # by address, for entries still pointing to them
+        self._departed = []
+        self._departed_indices = {}
+        self._free = []
+        # failed contacts per (node, peer) entry not yet evicted
+        self._failures = {}
+        self._stale_threshold = 1
+        self._ping_before_replace = False
+        self._ping_count = 0
+        self._table = np.full(
+            (0, id_space.bits + 1, id_space.k), -1, dtype=np.int32
+        )
+        self._fills = np.zeros((0, id_space.bits + 1), dtype=np.int16)
+        self._epochs = np.zeros(0, dtype=np.int64)
+        self._hops = np.zeros(0, dtype=np.int32)
+        self._heights = np.zeros(0, dtype=np.int16)
+        self._alive = np.zeros(0, dtype=bool)
+        self._generations = np.zeros(0, dtype=np.int64)
+        self.reserve(capacity)
+        return
+
+    def configure_eviction(
+        self,
+        ping_before_replace: bool,
+        stale_threshold: int,
+    ):
+        """
+        With `ping_before_replace`, a full bucket pings its least recently
+        seen peer before taking a new one, and only evicts it if it does
+        not answer. Otherwise the head is evicted unconditionally. Entries
+        are dropped after `stale_threshold` failed contacts.
+        """
+        if stale_threshold < 1:
+            raise ValueError(f"invalid stale threshold: {stale_threshold}")
+
+        self._ping_before_replace = ping_before_replace
+        self._stale_threshold = stale_threshold
+        return
+
+    def reserve(self, capacity: int):
+        """
+        Grows the arrays to hold at least `capacity` nodes.
+        """
+        if capacity <= len(self._fills):
+            return
+
+        size = self._size
+        table = np.full(
+            (capacity, self._id_space.bits + 1, self._id_space.k),
+            -1,
+            dtype=np.int32,
+        )
+        table[:size] = self._table[:size]
+        fills = np.zeros((capacity, self._id_space.bits + 1), dtype=np.int16)
+        fills[:size] = self._fills[:size]
+        epochs = np.full(capacity, -1, dtype=np.int64)
+        epochs[:size] = self._epochs[:size]
+        hops = np.zeros(capacity, dtype=np.int32)
+        hops[:size] = self._hops[:size]
+        heights = np.zeros(capacity, dtype=np.int16)
+        heights[:size] = self._heights[:size]
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:size] = self._alive[:size]
+        generations = np.zeros(capacity, dtype=np.int64)
+        generations[:size] = self._generations[:size]
+
+        self._table = table
+        self._fills = fills
+        self._epochs = epochs
+        self._hops = hops
+        self._heights = heights
+        self._alive = alive
+        self._generations = generations
+        return
+
+    def add(self, address: KademliaAddress) -> int:
+        """
+        Adds a node with empty routing table and returns its index.
+        """
+        if address.bits != self._id_space.bits:
+            raise ValueError("invalid address length")
+        if address in self._indices:
+            raise ValueError("node already in network")
+
+        if (
+            not self._free
+            and len(self._departed) >= self.PURGE_RATIO * self._size
+            and len(self._departed) >= self.PURGE_MINIMUM
+        ):
+            self._purge()
+        if self._free:
+            index = self._free.pop()
+            self._addresses[index] = address
+            self._table[index] = -1
+            self._fills[index] = 0
+            self._epochs[index] = -1
+            self._generations[index] = self._generations[index] + 1
+        else:
+            if self._size == len(self._fills):
+                self.reserve(max(2 * self._size, 16))
+            index = self._size
+            self._addresses.append(address)
+            self._size = self._size + 1
+        # a rejoining address is no longer a departed node
+        self._departed_indices.pop(address, None)
+        self._indices[address] = index
+        self._alive[index] = True
+        return index
+
+    def _purge(self):
+        """
+        Drops every entry pointing to a departed node and frees their
+        indices for reuse.
+        """
+        size = self._size
+        departed = np.zeros(size, dtype=bool)
+        departed[self._departed] = True
+        slots = np.arange(self._id_space.k)
+        # in blocks of rows, the masks of the whole table would not fit
+        for start in range(0, size, 1 << 12):
+            fills = self._fills[start:start + (1 << 12)]
+            table = self._table[start:start + (1 << 12)]
+            filled = slots < fills[:, :, None]
+            stale = filled & departed[np.where(filled, table, 0)]
+            rows, distances = np.nonzero(stale.any(axis=2))
+            if not len(rows):
+                continue
+            keep = filled[rows, distances] & ~stale[rows, distances]
+            # stable, so kept peers stay least recently seen first
+            order = np.argsort(~keep, axis=1, kind="stable")
+            buckets = np.take_along_axis(table[rows, distances], order, 1)
+            buckets[~np.take_along_axis(keep, order, 1)] = -1
+            table[rows, distances] = buckets
+            fills[rows, distances] = keep.sum(axis=1)
+        if self._failures:
+            self._failures = {
+                entry: failures
+                    for entry, failures in self._failures.items()
+                    if not departed[entry[1]]
+            }
+        self._free = sorted(self._departed, reverse=True)
+        self._departed = []
+        self._departed_indices = {}
+        return
+
+    def __contains__(self, address: KademliaAddress) -> bool:
+        """
+        Whether a node at `address` is in the store and alive.
+        """
+        return address in self._indices
+
+    def kill(self, index: int):
+        """
+        Marks node `index` as gone. Entries pointing to it are kept until
+        they fail or get evicted, or its index is reused.
+        """
+        if not self._alive[index]:
+            return
+
+        address = self._addresses[index]
+        self._alive[index] = False
+        del self._indices[address]
+        self._departed.append(index)
+        self._departed_indices[address] = index
+        return
+
+    def is_alive(self, index: int) -> bool:
+        return bool(self._alive[index])
+
+    def is_departed(self, address: KademliaAddress) -> bool:
+        """
+        Whether `address` is a departed node entries may still point to.
+        """
+        return address in self._departed_indices
+
+    def generate_addresses(self, count: int, rng: RandomStream) -> list:
+        """
+        Draws `count` distinct random addresses from `rng`, none of a node
+        in the store, alive or departed but still in routing tables.
+        """
+        addresses = []
+        unique_addresses = set()
+        while len(addresses) < count:
+            address = KademliaAddress.generate_random_address(
+                self._id_space.bits,
+                rng,
+            )
+            if (
+                not address in self._indices
+                    and not address in self._departed_indices
+                    and not address in unique_addresses
+            ):
+                unique_addresses.add(address)
+                addresses.append(address)
+        return addresses
+
+    def get_generation(self, index: int) -> int:
+        """
+        Number of times index `index` was reused by a joining node.
+        """
+        return int(self._generations[index])
+
+    def get_index(self, address: KademliaAddress) -> int:
+        """
+        Index of the node at `address`, or of the departed node at
+        `address` while entries may still point to it.
+        """
+        index = self._indices.get(address)
+        if index is None:
+            return self._departed_indices[address]
+        return index
+
+    def get_address(self, index: int) -> KademliaAddress:
+        return self._addresses[index]
+
+    def add_address(self, index: int, address: KademliaAddress):
+        distance = self._addresses[index].get_distance(address)
+        self.add_peer(index, distance, self._indices[address])
+        return
+
+    def add_peer(self, index: int, distance: int, peer: int):
+        """
+        Adds node `peer` as the most recently seen peer of bucket
+        `distance` of node `index`, moving it to the tail if already
+        present and evicting the head if the bucket overflows.
+        """
+        row = self._table[index, distance]
+        fill = int(self._fills[index, distance])
+        entries = row[:fill].tolist()
+        if self._failures:
+            self._failures.pop((index, peer), None)
+        if peer in entries:
+            entries.remove(peer)
+            entries.append(peer)
+            row[:fill] = entries
+        elif fill < len(row):
+            row[fill] = peer
+            self._fills[index, distance] = fill + 1
+        else:
+            head = entries[0]
+            if self._ping_before_replace:
+                self._ping_count = self._ping_count + 1
+                if self._alive[head]:
+                    # the head answered, it becomes the most recently
+                    # seen peer and the new one is dropped
+                    row[:-1] = row[1:]
+                    row[-1] = head
+                    return
+            self._failures.pop((index, head), None)
+            row[:-1] = row[1:]
+            row[-1] = peer
+        return
+
+    def remove_peer(self, index: int, distance: int, peer: int):
+        row = self._table[index, distance]
+        fill = int(self._fills[index, distance])
+        entries = row[:fill].tolist()
+        self._failures.pop((index, peer), None)
+        if peer in entries:
+            entries.remove(peer)
+            row[:fill - 1] = entries
+            row[fill - 1] = -1
+            self._fills[index, distance] = fill - 1
+        return
+
+    def mark_stale(self, index: int, peer: int):
+        """
+        Records a failed contact from node `index` to node `peer` and
+        drops the entry once it reaches the stale threshold.
+        """
+        distance = self._addresses[index].get_distance(self._addresses[peer])
+        if not peer in self.get_bucket_peer_indices(index, distance):
+            return
+
+        failures = self._failures.get((index, peer), 0) + 1
+        if failures >= self._stale_threshold:
+            self.remove_peer(index, distance, peer)
+        else:
+            self._failures[(index, peer)] = failures
+        return
+
+    def get_dead_entry_fraction(self) -> float:
+        """
+        Fraction of routing table entries of live nodes pointing to nodes
+        that are gone.
+        """
+        size = self._size
+        alive = self._alive[:size]
+        mask = (
+            np.arange(self._id_space.k) < self._fills[:size, :, None]
+        ) & alive[:, None, None]
+        entries = self._table[:size][mask]
+        if not len(entries):
+            return 0.0
+        return float(1.0 - alive[entries].mean())
+
+    def set_bucket(self, index: int, distance: int, peers: list):
+        """
+        Replaces the peers of bucket `distance` of node `index`, given
+        least recently seen first.
+        """
+        if len(peers) > self._id_space.k:
+            raise ValueError("too many peers")
+
+        self._table[index, distance, :len(peers)] = peers
+        self._table[index, distance, len(peers):] = -1
+        self._fills[index, distance] = len(peers)
+        return
+
+    def get_bucket_peer_indices(self, index: int, distance: int) -> np.ndarray:
+        """
+        View of the peer indices of a bucket, least recently seen first.
+        """
+        return self._table[index, distance, :self._fills[index, distance]]
+
+    def get_bucket_peers(self, index: int, distance: int) -> list:
+        return [
+            self._addresses[peer]
+                for peer
+                in self.get_bucket_peer_indices(index, distance).tolist()
+        ]
+
+    def get_fills(self, index: int) -> np.ndarray:
+        return self._fills[index]
+
+    def get_peer_indices(self, index: int) -> list:
+        """
+        Peer indices of node `index` in bucket order.
+        """
+        mask = (
+            np.arange(self._id_space.k) < self._fills[index][:, None]
+        )
+        return self._table[index][mask].tolist()
+
+    def get_peers(self, index: int) -> list:
+        return [self._addresses[peer] for peer in self.get_peer_indices(index)]
+
+    def get_peer_arrays(self) -> tuple:
+        """
+        Returns all routing tables in CSR form as `(bucket_indptr,
+        peer_indices, peer_buckets)`, where the peers of bucket `d` of
+        node `i` are entries `bucket_indptr[i * (bits + 1) + d]` up to
+        the next offset.
+        """
+        size = self._size
+        fills = self._fills[:size]
+        mask = np.arange(self._id_space.k) < fills[:, :, None]
+        bucket_indptr = np.zeros(fills.size + 1, dtype=np.int64)
+        np.cumsum(fills, out=bucket_indptr[1:])
+        peer_indices = self._table[:size][mask]
+        peer_buckets = np.repeat(
+            np.tile(np.arange(fills.shape[1], dtype=np.int16), size),
+            fills.ravel(),
+        )
+        return bucket_indptr, peer_indices, peer_buckets
+
+    def set_peer_arrays(
+        self,
+        bucket_indptr: np.ndarray,
+        peer_indices: np.ndarray,
+    ):
+        """
+        Replaces all routing tables with ones in the CSR form returned by
+        `get_peer_arrays`.
+        """
+        size = self._size
+        counts = np.diff(np.asarray(bucket_indptr))
+        if len(counts) != size * (self._id_space.bits + 1):
+            raise ValueError("invalid bucket offsets")
+        if len(counts) and counts.max() > self._id_space.k:
+            raise ValueError("too many peers")
+
+        slots = np.arange(len(peer_indices)) - np.repeat(
+            np.asarray(bucket_indptr[:-1]), counts
+        )
+        buckets = np.repeat(np.arange(len(counts)), counts)
+        table = self._table[:size].reshape(-1, self._id_space.k)
+        table[:] = -1
+        table[buckets, slots] = peer_indices
+        self._fills[:size] = counts.reshape(size, -1)
+        return
+
+    def get_hops(self, index: int, epoch: int) -> int:
+        """
+        Hop count node `index` received the message at in `epoch`, or
+        `None` if it has not received it in that epoch.
+        """
+        if self._epochs[index] != epoch:
+            return None
+        return int(self._hops[index])
+
+    def get_height(self, index: int) -> int:
+        """
+        Height of the message node `index` last received, or `None` if
+        unrestricted.
+        """
+        height = int(self._heights[index])
+        if height < 0:
+            return None
+        return height
+
+    def set_message(
+        self,
+        index: int,
+        epoch: int,
+        hops: int,
+        height: int = None,
+    ):
+        self._epochs[index] = epoch
+        self._hops[index] = hops
+        self._heights[index] = -1 if height is None else height
+        return
+
+    def reset_message(self, index: int):
+        self._epochs[index] = -1
+        return
+
+    @property
+    def id_space(self) -> IdSpace:
+        return self._id_space
+
+    @property
+    def size(self) -> int:
+        """
+        Number of indices in use, including those of nodes that left and
+        are not reused yet.
+        """
+        return self._size
+
+    @property
+    def alive(self) -> np.ndarray:
+        return self._alive[:self._size]
+
+    @property
+    def stale_count(self) -> int:
+        """
+        Entries with failed contacts that are not dropped yet.
+        """
+        return len(self._failures)
+
+    @property
+    def ping_count(self) -> int:
+        return self._ping_count
+
+    @property
+    def addresses(self) -> list:
+        return self._addresses
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Bytes held by the node arrays, excluding addresses.
+        """
+        return (
+            self._table.nbytes + self._fills.nbytes
+                + self._epochs.nbytes + self._hops.nbytes
+                + self._heights.nbytes + self._alive.nbytes
+                + self._generations.nbytes
+        )
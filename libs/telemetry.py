@@ -0,0 +1,170 @@
+import numpy as np
+
+import typing
+if typing.TYPE_CHECKING:
+    from libs.message import Message
+    from libs.network import KademliaNetwork
+    from libs.node import KademliaNode
+
+class DeliveryTelemetry:
+    """
+    Counters of the deliveries of one propagation on `network`, split
+    into useful deliveries, which reach a node for the first time, and
+    duplicates.
+
+    Duplicates are counted by the bucket distance between sender and
+    receiver and by the hop count of the duplicate message, and every
+    delivery counts towards the inbound load of its receiver and the
+    outbound load of its sender. Counters are preallocated lists, as
+    Python integers increment faster than NumPy scalars, grown only when
+    the network or the hop count outgrows them, and reset with the
+    network. They are returned as NumPy arrays.
+
+    Recording starts with `KademliaNetwork.set_telemetry`.
+    """
+    def __init__(self, network: "KademliaNetwork", max_hops: "int" = 64):
+        bits = network.id_space.bits
+        capacity = max(network.store.size, 16)
+
+        self._network = network
+        self._record_reception = None
+        self._record_duplicate = None
+        self._useful_count = 0
+        self._duplicate_count = 0
+        self._useful_by_distance = [0] * (bits + 1)
+        self._duplicates_by_distance = [0] * (bits + 1)
+        self._duplicates_by_hop = [0] * (max_hops + 1)
+        self._in_counts = [0] * capacity
+        self._out_counts = [0] * capacity
+        return
+
+    def bind(self, record_reception, record_duplicate):
+        """
+        Passes every delivery on to `record_reception` and
+        `record_duplicate` once counted, duplicates only if
+        `record_duplicate` is not `None`.
+        """
+        self._record_reception = record_reception
+        self._record_duplicate = record_duplicate
+        return
+
+    def record_reception(
+        self,
+        message: "Message",
+        node: "KademliaNode",
+        sender: "KademliaNode",
+    ):
+        self._useful_count = self._useful_count + 1
+        if sender is not None:
+            self._record_load(node.index, sender.index)
+            distance = sender.address.get_distance(node.address)
+            counts = self._useful_by_distance
+            counts[distance] = counts[distance] + 1
+        self._record_reception(message, node, sender)
+        return
+
+    def record_duplicate(
+        self,
+        message: "Message",
+        node: "KademliaNode",
+        sender: "KademliaNode",
+    ):
+        self._duplicate_count = self._duplicate_count + 1
+        if sender is not None:
+            self._record_load(node.index, sender.index)
+            distance = sender.address.get_distance(node.address)
+            counts = self._duplicates_by_distance
+            counts[distance] = counts[distance] + 1
+        hops = message.hops
+        if hops >= len(self._duplicates_by_hop):
+            self._grow(self._duplicates_by_hop, hops + 1)
+        self._duplicates_by_hop[hops] = self._duplicates_by_hop[hops] + 1
+        if self._record_duplicate is not None:
+            self._record_duplicate(message, node, sender)
+        return
+
+    def _record_load(self, index: "int", sender_index: "int"):
+        if max(index, sender_index) >= len(self._in_counts):
+            self._reserve(max(index, sender_index) + 1)
+        self._in_counts[index] = self._in_counts[index] + 1
+        self._out_counts[sender_index] = self._out_counts[sender_index] + 1
+        return
+
+    def _reserve(self, size: "int"):
+        if size > len(self._in_counts):
+            self._grow(self._in_counts, size)
+            self._grow(self._out_counts, size)
+        return
+
+    @staticmethod
+    def _grow(counts: "list", size: "int"):
+        counts.extend([0] * (max(2 * len(counts), size) - len(counts)))
+        return
+
+    def reset(self):
+        self._useful_count = 0
+        self._duplicate_count = 0
+        for counts in [
+            self._useful_by_distance,
+            self._duplicates_by_distance,
+            self._duplicates_by_hop,
+            self._in_counts,
+            self._out_counts,
+        ]:
+            counts[:] = [0] * len(counts)
+        return
+
+    @property
+    def network(self) -> "KademliaNetwork":
+        return self._network
+
+    @property
+    def useful_count(self) -> "int":
+        """
+        Deliveries reaching a node for the first time, the initial
+        delivery included.
+        """
+        return self._useful_count
+
+    @property
+    def duplicate_count(self) -> "int":
+        return self._duplicate_count
+
+    @property
+    def useful_by_distance(self) -> "np.ndarray":
+        """
+        Useful deliveries by bucket distance from sender to receiver.
+        """
+        return np.array(self._useful_by_distance, dtype=np.int64)
+
+    @property
+    def duplicates_by_distance(self) -> "np.ndarray":
+        """
+        Duplicate deliveries by bucket distance from sender to receiver.
+        """
+        return np.array(self._duplicates_by_distance, dtype=np.int64)
+
+    @property
+    def duplicates_by_hop(self) -> "np.ndarray":
+        """
+        Duplicate deliveries by the hop count of the duplicate message.
+        """
+        return np.array(self._duplicates_by_hop, dtype=np.int64)
+
+    @property
+    def in_counts(self) -> "np.ndarray":
+        """
+        Messages delivered to each node, by store index.
+        """
+        size = self._network.store.size
+        self._reserve(size)
+        return np.array(self._in_counts[:size], dtype=np.int64)
+
+    @property
+    def out_counts(self) -> "np.ndarray":
+        """
+        Messages delivered from each node, by store index.
+        """
+        size = self._network.store.size
+        self._reserve(size)
+        return np.array(self._out_counts[:size], dtype=np.int64)
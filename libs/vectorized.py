@@ -0,0 +1,231 @@
+import numpy as np
+from libs.policy import KademliaBroadcastPolicy
+
+import typing
+if typing.TYPE_CHECKING:
+    from libs.network import KademliaNetwork
+
+class FrozenNetwork:
+    """
+    Immutable snapshot of a network's peer lists as integer arrays, for
+    running propagation trials a whole BFS frontier at a time.
+
+    Nodes are numbered in the order of `KademliaNetwork.nodes`. The peers
+    of node `i` are `peer_indices[peer_indptr[i]:peer_indptr[i + 1]]` in
+    the same order as `KademliaNode.peers`, with the bucket each one is
+    in at the same positions of `peer_buckets`.
+    """
+    def __init__(
+        self,
+        peer_indptr: "np.ndarray",
+        peer_indices: "np.ndarray",
+        peer_buckets: "np.ndarray",
+        seed_index: "int",
+        broadcast_policy: "KademliaBroadcastPolicy",
+    ):
+        if len(peer_indices) != peer_indptr[-1]:
+            raise ValueError("invalid peer indices length")
+        if len(peer_buckets) != len(peer_indices):
+            raise ValueError("invalid peer buckets length")
+
+        self._peer_indptr = peer_indptr
+        self._peer_indices = peer_indices
+        self._peer_buckets = peer_buckets
+        self._num_buckets = (
+            int(peer_buckets.max()) + 1 if len(peer_buckets) else 1
+        )
+        self._seed_index = seed_index
+        self.set_broadcast_policy(broadcast_policy)
+        return
+
+    @staticmethod
+    def from_network(kademlia_network: "KademliaNetwork") -> "FrozenNetwork":
+        if kademlia_network.size != kademlia_network.store.size:
+            raise ValueError("network has departed nodes")
+
+        bucket_indptr, peer_indices, peer_buckets = (
+            kademlia_network.store.get_peer_arrays()
+        )
+        return FrozenNetwork(
+            peer_indptr=bucket_indptr[::kademlia_network.id_space.bits + 1],
+            peer_indices=peer_indices,
+            peer_buckets=peer_buckets,
+            seed_index=kademlia_network.seed.index,
+            broadcast_policy=kademlia_network.broadcast_policy,
+        )
+
+    def set_broadcast_policy(
+        self,
+        broadcast_policy: "KademliaBroadcastPolicy",
+    ):
+        broadcast_type = broadcast_policy.broadcast_type
+        if broadcast_type == KademliaBroadcastPolicy.FLOOD:
+            self._select_entries = self._select_flood_entries
+        elif broadcast_type == KademliaBroadcastPolicy.SELECT:
+            self._select_entries = self._select_select_entries
+        elif broadcast_type == KademliaBroadcastPolicy.RANDOM:
+            self._select_entries = self._select_random_entries
+        elif broadcast_type == KademliaBroadcastPolicy.HYBRID:
+            self._select_entries = self._select_hybrid_entries
+        elif broadcast_type == KademliaBroadcastPolicy.KADCAST:
+            self._select_entries = self._select_kadcast_entries
+        else:
+            raise ValueError(f"unsupported broadcast type: {broadcast_type}")
+
+        self._broadcast_policy = broadcast_policy
+        return
+
+    def propagate_message(
+        self,
+        start_index: "int",
+        rng: "np.random.Generator",
+    ) -> "tuple":
+        """
+        Propagates a message from node `start_index` and returns its
+        `(send_count, propagation, max_hops)`, matching what
+        `KademliaNetwork` reports for the same trial.
+        """
+        reached = np.zeros(self.size, dtype=bool)
+        reached[start_index] = True
+        # bucket each node was first reached through, the start node is
+        # unrestricted
+        heights = np.zeros(self.size, dtype=np.int16)
+        heights[start_index] = self._num_buckets
+        frontier = np.array([start_index], dtype=np.int32)
+        send_count = 1
+        propagation = 1
+        max_hops = 0
+        while True:
+            entries = self._select_entries(frontier, heights, rng)
+            send_count = send_count + len(entries)
+            targets = self._peer_indices[entries]
+            entries = entries[~reached[targets]]
+            targets = targets[~reached[targets]]
+            # entries are in the order `KademliaNetwork` sends them, so a
+            # node reached by several senders keeps the first delivery and
+            # the next frontier is in the order the nodes are reached
+            _, first = np.unique(targets, return_index=True)
+            first.sort()
+            frontier = targets[first]
+            if not len(frontier):
+                break
+            heights[frontier] = self._peer_buckets[entries[first]]
+            reached[frontier] = True
+            propagation = propagation + len(frontier)
+            max_hops = max_hops + 1
+        return send_count, propagation, max_hops
+
+    def _expand(self, frontier: "np.ndarray") -> "tuple":
+        """
+        Returns the positions of all peer entries of the nodes in
+        `frontier` and, for each position, the index into `frontier` of
+        the node owning it.
+        """
+        starts = self._peer_indptr[frontier]
+        counts = self._peer_indptr[frontier + 1] - starts
+        owners = np.repeat(np.arange(len(frontier)), counts)
+        offsets = np.cumsum(counts) - counts
+        entries = (
+            np.arange(counts.sum()) - np.repeat(offsets, counts)
+                + np.repeat(starts, counts)
+        )
+        return entries, owners
+
+    @staticmethod
+    def _sample_groups(
+        groups: "np.ndarray",
+        size: "int",
+        rng: "np.random.Generator",
+    ) -> "np.ndarray":
+        """
+        Returns the positions of a uniform sample without replacement of
+        up to `size` elements from each group, where `groups` holds a
+        non-decreasing group key for every element.
+        """
+        # shuffle within groups, then keep the first `size` of each group
+        order = np.lexsort((rng.random(len(groups)), groups))
+        ranks = np.arange(len(groups)) - np.searchsorted(groups, groups)
+        return order[ranks < size]
+
+    def _select_flood_entries(
+        self,
+        frontier: "np.ndarray",
+        heights: "np.ndarray",
+        rng: "np.random.Generator",
+    ) -> "np.ndarray":
+        entries, _ = self._expand(frontier)
+        return entries
+
+    def _select_select_entries(
+        self,
+        frontier: "np.ndarray",
+        heights: "np.ndarray",
+        rng: "np.random.Generator",
+    ) -> "np.ndarray":
+        # one random peer from each non-empty bucket, skipping bucket 0
+        entries, owners = self._expand(frontier)
+        buckets = self._peer_buckets[entries].astype(np.int64)
+        mask = buckets > 0
+        # peers of a node are stored in bucket order, so the keys are
+        # non-decreasing
+        groups = owners[mask] * self._num_buckets + buckets[mask]
+        return entries[mask][self._sample_groups(groups, 1, rng)]
+
+    def _select_random_entries(
+        self,
+        frontier: "np.ndarray",
+        heights: "np.ndarray",
+        rng: "np.random.Generator",
+    ) -> "np.ndarray":
+        entries, owners = self._expand(frontier)
+        size = self._broadcast_policy.broadcast_size
+        return entries[self._sample_groups(owners, size, rng)]
+
+    def _select_hybrid_entries(
+        self,
+        frontier: "np.ndarray",
+        heights: "np.ndarray",
+        rng: "np.random.Generator",
+    ) -> "np.ndarray":
+        return np.union1d(
+            self._select_select_entries(frontier, heights, rng),
+            self._select_random_entries(frontier, heights, rng),
+        )
+
+    def _select_kadcast_entries(
+        self,
+        frontier: "np.ndarray",
+        heights: "np.ndarray",
+        rng: "np.random.Generator",
+    ) -> "np.ndarray":
+        # up to `size` random peers from each bucket below the height
+        entries, owners = self._expand(frontier)
+        buckets = self._peer_buckets[entries].astype(np.int64)
+        mask = (buckets > 0) & (buckets < heights[frontier][owners])
+        groups = owners[mask] * self._num_buckets + buckets[mask]
+        size = self._broadcast_policy.broadcast_size
+        return entries[mask][self._sample_groups(groups, size, rng)]
+
+    @property
+    def size(self) -> "int":
+        return len(self._peer_indptr) - 1
+
+    @property
+    def seed_index(self) -> "int":
+        return self._seed_index
+
+    @property
+    def broadcast_policy(self) -> "KademliaBroadcastPolicy":
+        return self._broadcast_policy
+
+    @property
+    def peer_indptr(self) -> "np.ndarray":
+        return self._peer_indptr
+
+    @property
+    def peer_indices(self) -> "np.ndarray":
+        return self._peer_indices
+
+    @property
+    def peer_buckets(self) -> "np.ndarray":
+        return self._peer_buckets
@@ -0,0 +1,83 @@
+import pytest
+from libs.message import Message
+from libs.policy import KademliaBroadcastPolicy, KademliaDiscoveryPolicy
+from libs.rng import RandomStream
+from libs.vectorized import FrozenNetwork
+from tools import test, util
+
+NETWORK_SIZE = 400
+NUM_TRIALS = 200
+DISCOVERY_POLICIES = [
+    (KademliaDiscoveryPolicy.COMPLETE, 0),
+    (KademliaDiscoveryPolicy.PARTIAL, 2),
+]
+BROADCAST_POLICIES = [
+    (KademliaBroadcastPolicy.FLOOD, 0),
+    (KademliaBroadcastPolicy.SELECT, 0),
+    (KademliaBroadcastPolicy.RANDOM, 4),
+    (KademliaBroadcastPolicy.HYBRID, 2),
+    (KademliaBroadcastPolicy.KADCAST, 1),
+    (KademliaBroadcastPolicy.KADCAST, 3),
+]
+# every metric of every case below is one comparison of the family
+Z_THRESHOLD = test.get_z_threshold(
+    len(DISCOVERY_POLICIES) * len(BROADCAST_POLICIES)
+        * len(test.ENGINE_METRICS),
+    0.01,
+)
+
+@pytest.mark.parametrize("discovery_type, discovery_depth", DISCOVERY_POLICIES)
+@pytest.mark.parametrize("broadcast_type, broadcast_size", BROADCAST_POLICIES)
+def test_engines_are_equivalent(
+    discovery_type: str,
+    discovery_depth: int,
+    broadcast_type: str,
+    broadcast_size: int,
+):
+    kademlia_network = util.generate_kademlia_network(
+        NETWORK_SIZE,
+        broadcast_type,
+        broadcast_size,
+        discovery_type,
+        discovery_depth,
+        RandomStream.from_seed(1),
+    )
+    object_results, vectorized_results = test.run_engine_trials(
+        kademlia_network,
+        NUM_TRIALS,
+        False,
+    )
+    z_scores = test.get_z_scores(object_results, vectorized_results)
+    assert (abs(z_scores) < Z_THRESHOLD).all(), dict(
+        zip(test.ENGINE_METRICS, z_scores)
+    )
+
+@pytest.mark.parametrize("discovery_type, discovery_depth", DISCOVERY_POLICIES)
+def test_flood_matches_per_start_node(
+    discovery_type: str,
+    discovery_depth: int,
+):
+    kademlia_network = util.generate_kademlia_network(
+        NETWORK_SIZE,
+        KademliaBroadcastPolicy.FLOOD,
+        0,
+        discovery_type,
+        discovery_depth,
+        RandomStream.from_seed(2),
+    )
+    frozen_network = FrozenNetwork.from_network(kademlia_network)
+    rng = kademlia_network.rng.generator
+    for node in list(kademlia_network.nodes.values())[::40]:
+        kademlia_network.reset()
+        kademlia_network.propagate_message(Message("test", 0), node.address)
+        assert frozen_network.propagate_message(node.index, rng) == (
+            kademlia_network.send_count,
+            kademlia_network.propagation,
+            kademlia_network.max_hops,
+        )
+
+def test_z_threshold_is_corrected():
+    assert test.get_z_threshold(1, 0.05) == pytest.approx(1.96, abs=0.01)
+    assert test.get_z_threshold(36, 0.01) > test.get_z_threshold(3, 0.01)
+    with pytest.raises(ValueError):
+        test.get_z_threshold(3, 0.0)
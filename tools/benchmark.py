@@ -0,0 +1,303 @@
+import argparse
+import json
+import math
+import platform
+import sys
+import time
+import tracemalloc
+import numpy as np
+from libs.address import KademliaAddress
+from libs.bucket import Bucket
+from libs.idspace import DEFAULT_ID_SPACE
+from libs.message import Message
+from libs.network import KademliaNetwork
+from libs.policy import KademliaBroadcastPolicy, KademliaDiscoveryPolicy
+from libs.rng import RandomStream
+from tools import util
+from tools.report import RESET, SUCCESS_COLORS, TITLE_COLOR
+
+PROFILES = {
+    "quick": [1000],
+    "full": [1000, 10000, 100000],
+}
+
+def _get_neighbors_sorted(node, address, n):
+    """
+    Reference implementation sorting every peer by distance.
+    """
+    return sorted(
+        node.peers,
+        key=lambda peer: peer.get_distance(address)
+    )[:n]
+
+def benchmark_get_neighbors(
+    kademlia_network: KademliaNetwork,
+    num_queries: int,
+):
+    """
+    Compares the bucket-indexed `get_neighbors` against a full sort over
+    all peers for random (node, target) pairs from the network.
+    """
+    n = kademlia_network.id_space.k
+    queries = [
+        (
+            kademlia_network.get_random_node(),
+            kademlia_network.get_random_node().address,
+        )
+            for _ in range(num_queries)
+    ]
+
+    print(f"{TITLE_COLOR}benchmarking get_neighbors with{RESET}")
+    print(f"    network size: {kademlia_network.size}")
+    print(f"    number of queries: {num_queries}")
+
+    start = time.perf_counter()
+    sorted_results = [
+        _get_neighbors_sorted(node, address, n) for node, address in queries
+    ]
+    sorted_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    indexed_results = [
+        node.get_neighbors(address) for node, address in queries
+    ]
+    indexed_time = time.perf_counter() - start
+
+    # exact XOR ordering refines the bucket distance ordering, so both
+    # must agree on the bucket distances of the selected peers
+    match = all(
+        [peer.get_distance(address) for peer in indexed]
+            == [peer.get_distance(address) for peer in reference]
+            for (_, address), indexed, reference
+            in zip(queries, indexed_results, sorted_results)
+    )
+
+    print(f"full sort: {sorted_time / num_queries * 1e6:.2f} us/query")
+    print(f"bucket walk: {indexed_time / num_queries * 1e6:.2f} us/query")
+    print(f"speedup: {sorted_time / indexed_time:.2f}x")
+    print(f"results match: {match}")
+    return
+
+def _time_op(run, number: int, repeat: int) -> float:
+    """
+    Best seconds per operation over `repeat` runs of `run`, each doing
+    `number` operations.
+    """
+    best = math.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best
+
+def _measure_peak(run) -> int:
+    """
+    Peak bytes allocated by Python during one call of `run`.
+    """
+    tracemalloc.start()
+    try:
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+def _measure(run, number: int, repeat: int) -> dict:
+    # timed without tracing, which slows allocation heavy code down
+    return {
+        "seconds": _time_op(run, number, repeat),
+        "ops": number,
+        "peak_bytes": _measure_peak(run),
+    }
+
+def run_benchmarks(sizes: list, seed: int = 0) -> dict:
+    """
+    Times the hot paths of construction, lookup and propagation on
+    networks of each of `sizes` nodes and returns timings keyed by
+    benchmark name, each with best seconds per operation, operations per
+    run and peak memory traced while running it, which excludes the
+    network itself.
+
+    Networks are built with complete discovery, which has the densest
+    routing tables, and every broadcast policy runs on the same network.
+    """
+    rng = RandomStream.from_seed(seed)
+    results = {}
+
+    pairs = [
+        (
+            KademliaAddress.generate_random_address(
+                DEFAULT_ID_SPACE.bits,
+                rng,
+            ),
+            KademliaAddress.generate_random_address(
+                DEFAULT_ID_SPACE.bits,
+                rng,
+            ),
+        )
+            for _ in range(100000)
+    ]
+    def run_get_distance():
+        for a, b in pairs:
+            a.get_distance(b)
+        return
+    results["get_distance"] = _measure(run_get_distance, len(pairs), 5)
+
+    for size in sizes:
+        kademlia_network = util.generate_kademlia_network(
+            size,
+            KademliaBroadcastPolicy.FLOOD,
+            0,
+            KademliaDiscoveryPolicy.COMPLETE,
+            0,
+            rng=rng,
+        )
+        nodes = list(kademlia_network.nodes.values())
+        store = kademlia_network.store
+
+        # re-adding known peers keeps the tables at their built size
+        updates = []
+        for _ in range(10000):
+            node = rng.choice(nodes)
+            peer = rng.choice(nodes)
+            distance = node.address.get_distance(peer.address)
+            updates.append((
+                Bucket(store, node.index, distance),
+                peer.address,
+            ))
+        def run_add_address():
+            for bucket, address in updates:
+                bucket.add_address(address)
+            return
+        results[f"add_address/n={size}"] = _measure(
+            run_add_address,
+            len(updates),
+            3,
+        )
+
+        queries = [
+            (rng.choice(nodes), rng.choice(nodes).address)
+                for _ in range(10000)
+        ]
+        def run_get_neighbors():
+            for node, address in queries:
+                node.get_neighbors(address)
+            return
+        results[f"get_neighbors/n={size}"] = _measure(
+            run_get_neighbors,
+            len(queries),
+            3,
+        )
+
+        num_trials, repeat = (5, 3) if size <= 10000 else (1, 1)
+        for broadcast_type in KademliaBroadcastPolicy.POLICIES:
+            kademlia_network.set_broadcast_policy(
+                KademliaBroadcastPolicy(broadcast_type, 3)
+            )
+            start_nodes = [rng.choice(nodes) for _ in range(num_trials)]
+            def run_propagate():
+                for start_node in start_nodes:
+                    kademlia_network.reset()
+                    kademlia_network.propagate_message(
+                        Message("test", 0),
+                        start_node.address,
+                    )
+                return
+            results[f"propagate/{broadcast_type}/n={size}"] = _measure(
+                run_propagate,
+                num_trials,
+                repeat,
+            )
+
+        # joins last, as they grow the network
+        num_joins = 20
+        for discovery_type in KademliaDiscoveryPolicy.POLICIES:
+            policy = KademliaDiscoveryPolicy(discovery_type, 3)
+            batches = iter([
+                util.generate_addresses(kademlia_network, num_joins)
+                    for _ in range(2)
+            ])
+            def run_join():
+                for address in next(batches):
+                    kademlia_network.bulk_build([address], policy)
+                return
+            results[f"join/{discovery_type}/n={size}"] = _measure(
+                run_join,
+                num_joins,
+                1,
+            )
+    return results
+
+def compare_benchmarks(
+    results: dict,
+    baseline: dict,
+    tolerance: float,
+) -> list:
+    """
+    Prints each benchmark against `baseline` and returns the names of
+    those slower than the baseline by more than `tolerance`.
+    """
+    print(f"{TITLE_COLOR}benchmark results{RESET}")
+    regressions = []
+    for name, result in results.items():
+        line = (
+            f"    {name}: {result['seconds'] * 1e6:.2f} us/op, "
+            f"peak {result['peak_bytes'] / 2 ** 10:.1f} KiB"
+        )
+        if name in baseline:
+            ratio = result["seconds"] / baseline[name]["seconds"]
+            passed = ratio <= 1 + tolerance
+            if not passed:
+                regressions.append(name)
+            line = line + (
+                f", {SUCCESS_COLORS[passed]}{ratio:.2f}x{RESET} baseline"
+            )
+        print(line)
+    return regressions
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Benchmarks the hot paths of the network model.",
+    )
+    parser.add_argument(
+        "--profile",
+        choices=list(PROFILES),
+        default="quick",
+        help="network sizes to run, quick for a check on every change",
+    )
+    parser.add_argument("--sizes", type=int, nargs="+")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write timings as JSON")
+    parser.add_argument("--baseline", help="compare with saved timings")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args(argv)
+
+    sizes = args.sizes if args.sizes else PROFILES[args.profile]
+    results = run_benchmarks(sizes, args.seed)
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+    regressions = compare_benchmarks(results, baseline, args.tolerance)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(
+                {
+                    "python": platform.python_version(),
+                    "numpy": np.__version__,
+                    "machine": platform.machine(),
+                    "sizes": sizes,
+                    "seed": args.seed,
+                    "results": results,
+                },
+                f,
+                indent=2,
+            )
+    if regressions:
+        print(f"regressions: {', '.join(regressions)}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
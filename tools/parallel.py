@@ -0,0 +1,96 @@
+import multiprocessing
+import numpy as np
+from libs.message import Message
+from libs.network import KademliaNetwork
+from libs.policy import KademliaBroadcastPolicy
+from libs.rng import RandomStream
+from libs.snapshot import load_frozen_network
+from libs.vectorized import FrozenNetwork
+from tools import util
+from tools.results import TrialResults
+
+# network shipped to each worker process once by `_init_worker`
+_network = None
+
+def _init_worker(network, broadcast_policy: KademliaBroadcastPolicy):
+    global _network
+    if isinstance(network, str):
+        # snapshot path, mapped read-only and shared between workers
+        network = load_frozen_network(network)
+    if broadcast_policy is not None:
+        network.set_broadcast_policy(broadcast_policy)
+    _network = network
+    return
+
+def _run_object_trial(seed_sequence: np.random.SeedSequence, seed_start: bool):
+    _network.set_rng(RandomStream.from_seed(seed_sequence))
+    _network.reset()
+    start_node = util.get_start_node(_network, seed_start)
+    _network.propagate_message(Message("test", 0), start_node.address)
+    return _network.send_count, _network.propagation, _network.max_hops
+
+def _run_frozen_trial(seed_sequence: np.random.SeedSequence, seed_start: bool):
+    rng = np.random.default_rng(seed_sequence)
+    if seed_start:
+        start_index = _network.seed_index
+    else:
+        start_index = rng.integers(_network.size)
+    return _network.propagate_message(start_index, rng)
+
+def _run_trials(args: tuple) -> TrialResults:
+    seed_sequences, seed_start = args
+    if isinstance(_network, FrozenNetwork):
+        run_trial = _run_frozen_trial
+    else:
+        run_trial = _run_object_trial
+    results = np.array(
+        [
+            run_trial(seed_sequence, seed_start)
+                for seed_sequence in seed_sequences
+        ],
+        dtype=np.int64,
+    ).reshape(-1, 3)
+    return TrialResults(
+        network_size=_network.size,
+        send_counts=results[:, 0],
+        propagations=results[:, 1],
+        max_hops=results[:, 2],
+    )
+
+def run_parallel_trials(
+    kademlia_network: "KademliaNetwork | FrozenNetwork | str",
+    num_trials: int,
+    seed_start: bool,
+    master_seed: int,
+    num_workers: int = None,
+    chunk_size: int = 64,
+    broadcast_policy: KademliaBroadcastPolicy = None,
+) -> TrialResults:
+    """
+    Runs `num_trials` trials across `num_workers` processes, one per core
+    by default, and returns their results in trial order.
+
+    The network is sent to each worker once. A path to a snapshot saved
+    with `libs.snapshot.save_network` is instead mapped by every worker
+    as a `FrozenNetwork`, sharing one read-only copy. Workers switch to
+    `broadcast_policy` if given, leaving the caller's network as is.
+
+    Every trial draws from its own stream spawned from `master_seed`, so
+    results depend only on the master seed and not on the number of
+    workers or the chunking.
+    """
+    if num_trials < 1:
+        raise ValueError(f"invalid number of trials: {num_trials}")
+
+    seed_sequences = np.random.SeedSequence(master_seed).spawn(num_trials)
+    chunks = [
+        (seed_sequences[i:i + chunk_size], seed_start)
+            for i in range(0, num_trials, chunk_size)
+    ]
+    with multiprocessing.Pool(
+        processes=num_workers,
+        initializer=_init_worker,
+        initargs=(kademlia_network, broadcast_policy),
+    ) as pool:
+        results = pool.map(_run_trials, chunks)
+    return TrialResults.concatenate(results)
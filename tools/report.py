@@ -0,0 +1,151 @@
+from libs.network import KademliaNetwork
+from libs.policy import KademliaBroadcastPolicy, KademliaDiscoveryPolicy
+from libs.profiling import NetworkProfiler
+from tools.results import TrialResult, TrialResults, TrialSummary
+
+RED_BOLD = "\033[031;1m"
+GREEN_BOLD = "\033[032;1m"
+BLUE_BOLD = "\033[034;1m"
+RESET = "\033[0m"
+TITLE_COLOR = BLUE_BOLD
+SUCCESS_COLORS = {False: RED_BOLD, True: GREEN_BOLD}
+
+def print_network_config(
+    title: str,
+    kademlia_network: KademliaNetwork,
+    num_trials: int = None,
+):
+    discovery_type = kademlia_network.discovery_policy.discovery_type
+    discovery_depth = kademlia_network.discovery_policy.discovery_depth
+    broadcast_type = kademlia_network.broadcast_policy.broadcast_type
+    broadcast_size = kademlia_network.broadcast_policy.broadcast_size
+
+    print(f"{TITLE_COLOR}{title}{RESET}")
+    if num_trials is not None:
+        print(f"    number of trials: {num_trials}")
+    print(f"    network size: {kademlia_network.size}")
+    print(f"    discovery type: {discovery_type}")
+    if discovery_type == KademliaDiscoveryPolicy.PARTIAL:
+        print(f"    discovery depth: {discovery_depth}")
+    print(f"    broadcast type: {broadcast_type}")
+    if not broadcast_type in [
+        KademliaBroadcastPolicy.FLOOD,
+        KademliaBroadcastPolicy.SELECT,
+    ]:
+        print(f"    broadcast size: {broadcast_size}")
+    return
+
+def print_trial_result(result: TrialResult):
+    print(
+        f"success: "
+        f"{SUCCESS_COLORS[result.success]}{result.success}{RESET}"
+    )
+    print(f"send count: {result.send_count}")
+    print(f"propagation: {result.propagation}")
+    print(f"max hops: {result.max_hops}")
+    print(f"hop histogram: {list(result.hop_histogram)}")
+    print(f"wall time: {result.wall_time:.4f}")
+    return
+
+def print_trial_summary(summary: TrialSummary):
+    success = summary.num_successes == summary.num_trials
+    print(
+        f"number of successes: "
+        f"{SUCCESS_COLORS[success]}{summary.num_successes}{RESET}"
+    )
+    print(f"    average propagation: {summary.propagation.mean:.2f}")
+    for name, stats in [
+        ("send count", summary.send_count),
+        ("max hops", summary.max_hops),
+    ]:
+        if stats.count:
+            print(
+                f"    average {name} for successes: {stats.mean:.2f}"
+                f" (std {stats.std:.2f}, p50/p95/p99 "
+                f"{stats.get_quantile(0.5):.0f}/"
+                f"{stats.get_quantile(0.95):.0f}/"
+                f"{stats.get_quantile(0.99):.0f})"
+            )
+        else:
+            print(f"    average {name} for successes: invalid")
+    if summary.wall_time.count:
+        print(
+            f"    average wall time: {summary.wall_time.mean:.4f} "
+            f"(p99 {summary.wall_time.get_quantile(0.99):.4f})"
+        )
+    return
+
+def print_trial_results(results: TrialResults):
+    print(f"{TITLE_COLOR}results of {results.num_trials} trials{RESET}")
+    print(f"    network size: {results.network_size}")
+
+    num_successes = int(results.successes.sum())
+    success = num_successes == results.num_trials
+    print(
+        f"number of successes: "
+        f"{SUCCESS_COLORS[success]}{num_successes}{RESET}"
+    )
+    print(
+        f"    average propagation: "
+        f"{results.propagations.mean():.2f}"
+    )
+    if num_successes:
+        print(
+            f"    average send count for successes: "
+            f"{results.send_counts[results.successes].mean():.2f}"
+        )
+        print(
+            f"    average max hops for successes: "
+            f"{results.max_hops[results.successes].mean():.2f}"
+        )
+    else:
+        print(
+            f"    average send count for successes: invalid"
+        )
+        print(
+            f"    average max hops for successes: invalid"
+        )
+    return
+
+def print_sweep_summaries(summaries: list):
+    """
+    Prints one line per `(config, TrialSummary)` cell of a sweep.
+    """
+    print(f"{TITLE_COLOR}results of {len(summaries)} cells{RESET}")
+    for config, summary in summaries:
+        success = summary.num_successes == summary.num_trials
+        if summary.send_count.count:
+            send_count = f"{summary.send_count.mean:.2f}"
+        else:
+            send_count = "invalid"
+        print(
+            f"    size {config['network_size']} "
+            f"{config['discovery_type']}/{config['discovery_depth']} "
+            f"{config['broadcast_type']}/{config['broadcast_size']}: "
+            f"successes {SUCCESS_COLORS[success]}"
+            f"{summary.num_successes}{RESET}/{summary.num_trials}, "
+            f"propagation {summary.propagation.mean:.2f}, "
+            f"send count {send_count}"
+        )
+    return
+
+def print_profile(profiler: NetworkProfiler):
+    """
+    Prints one line per profiled phase, by descending self time, with
+    the share of the total self time of all phases.
+    """
+    phases = profiler.phases
+    total_time = sum(stats.self_time for stats in phases)
+    print(f"{TITLE_COLOR}profile of {len(phases)} phases{RESET}")
+    for stats in phases:
+        share = stats.self_time / total_time if total_time else 0.0
+        line = (
+            f"    {stats.name}: {stats.calls} calls, "
+            f"total {stats.total_time:.4f}, self {stats.self_time:.4f} "
+            f"({share:.4f}), "
+            f"{stats.total_time / stats.calls * 1e6:.2f} us per call"
+        )
+        if profiler.trace_allocations:
+            line = line + f", allocated {stats.allocated} bytes"
+        print(line)
+    return
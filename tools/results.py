@@ -0,0 +1,367 @@
+import bisect
+import math
+import numpy as np
+
+class TrialResults:
+    """
+    Per-trial outcomes of a run over a network of `network_size` nodes.
+    """
+    def __init__(
+        self,
+        network_size: int,
+        send_counts: np.ndarray,
+        propagations: np.ndarray,
+        max_hops: np.ndarray,
+    ):
+        if not len(send_counts) == len(propagations) == len(max_hops):
+            raise ValueError("invalid result lengths")
+
+        self._network_size = network_size
+        self._send_counts = send_counts
+        self._propagations = propagations
+        self._max_hops = max_hops
+        return
+
+    @staticmethod
+    def concatenate(results: list) -> "TrialResults":
+        if not results:
+            raise ValueError("invalid results")
+        if len(set(result.network_size for result in results)) != 1:
+            raise ValueError("mismatching network sizes")
+
+        return TrialResults(
+            network_size=results[0].network_size,
+            send_counts=np.concatenate(
+                [result.send_counts for result in results]
+            ),
+            propagations=np.concatenate(
+                [result.propagations for result in results]
+            ),
+            max_hops=np.concatenate([result.max_hops for result in results]),
+        )
+
+    @property
+    def network_size(self) -> int:
+        return self._network_size
+
+    @property
+    def num_trials(self) -> int:
+        return len(self._send_counts)
+
+    @property
+    def send_counts(self) -> np.ndarray:
+        return self._send_counts
+
+    @property
+    def propagations(self) -> np.ndarray:
+        return self._propagations
+
+    @property
+    def max_hops(self) -> np.ndarray:
+        return self._max_hops
+
+    @property
+    def successes(self) -> np.ndarray:
+        return self._propagations == self._network_size
+
+class TrialResult:
+    """
+    Outcome of one trial over a network of `network_size` nodes.
+    """
+    def __init__(
+        self,
+        network_size: int,
+        send_count: int,
+        propagation: int,
+        max_hops: int,
+        hop_histogram: list,
+        wall_time: float,
+    ):
+        self._network_size = network_size
+        self._send_count = send_count
+        self._propagation = propagation
+        self._max_hops = max_hops
+        self._hop_histogram = tuple(hop_histogram)
+        self._wall_time = wall_time
+        return
+
+    @property
+    def network_size(self) -> int:
+        return self._network_size
+
+    @property
+    def send_count(self) -> int:
+        return self._send_count
+
+    @property
+    def propagation(self) -> int:
+        return self._propagation
+
+    @property
+    def max_hops(self) -> int:
+        return self._max_hops
+
+    @property
+    def hop_histogram(self) -> tuple:
+        """
+        Number of nodes first reached at each hop count.
+        """
+        return self._hop_histogram
+
+    @property
+    def wall_time(self) -> float:
+        """
+        Seconds spent propagating the message.
+        """
+        return self._wall_time
+
+    @property
+    def success(self) -> bool:
+        return self._propagation == self._network_size
+
+class P2Quantile:
+    """
+    Streaming estimate of quantile `p` with the P-square algorithm of Jain
+    and Chlamtac, keeping five markers instead of the observations.
+    """
+    def __init__(self, p: float):
+        if not 0 < p < 1:
+            raise ValueError(f"invalid quantile: {p}")
+
+        self._p = p
+        self._heights = []
+        self._positions = [1, 2, 3, 4, 5]
+        self._desired = [1, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5]
+        self._increments = [0, p / 2, p, (1 + p) / 2, 1]
+        return
+
+    def add(self, x: float):
+        heights = self._heights
+        if len(heights) < 5:
+            bisect.insort(heights, x)
+            return
+
+        positions = self._positions
+        if x < heights[0]:
+            heights[0] = x
+            cell = 0
+        elif x >= heights[4]:
+            heights[4] = x
+            cell = 3
+        else:
+            cell = bisect.bisect_right(heights, x) - 1
+        for i in range(cell + 1, 5):
+            positions[i] = positions[i] + 1
+        for i in range(5):
+            self._desired[i] = self._desired[i] + self._increments[i]
+
+        # move the middle markers towards their desired positions
+        for i in range(1, 4):
+            offset = self._desired[i] - positions[i]
+            if (
+                offset >= 1 and positions[i + 1] - positions[i] > 1
+                    or offset <= -1 and positions[i - 1] - positions[i] < -1
+            ):
+                step = 1 if offset > 0 else -1
+                height = self._get_parabolic_height(i, step)
+                if not heights[i - 1] < height < heights[i + 1]:
+                    height = heights[i] + step * (
+                        heights[i + step] - heights[i]
+                    ) / (positions[i + step] - positions[i])
+                heights[i] = height
+                positions[i] = positions[i] + step
+        return
+
+    def _get_parabolic_height(self, i: int, step: int) -> float:
+        heights = self._heights
+        positions = self._positions
+        return heights[i] + step / (positions[i + 1] - positions[i - 1]) * (
+            (positions[i] - positions[i - 1] + step)
+                * (heights[i + 1] - heights[i])
+                / (positions[i + 1] - positions[i])
+            + (positions[i + 1] - positions[i] - step)
+                * (heights[i] - heights[i - 1])
+                / (positions[i] - positions[i - 1])
+        )
+
+    @property
+    def p(self) -> float:
+        return self._p
+
+    @property
+    def value(self) -> float:
+        """
+        Current estimate, exact while fewer than five values were added.
+        """
+        heights = self._heights
+        if not heights:
+            return float("nan")
+        if len(heights) < 5:
+            return float(np.percentile(heights, 100 * self._p))
+        return heights[2]
+
+class RunningStats:
+    """
+    Streaming count, mean, variance and range of a metric, using
+    Welford's update, with P-square estimates of `quantiles`.
+    """
+    def __init__(self, quantiles: tuple = (0.5, 0.95, 0.99)):
+        self._count = 0
+        self._mean = 0.0
+        self._m2 = 0.0
+        self._min = float("inf")
+        self._max = float("-inf")
+        self._quantiles = {p: P2Quantile(p) for p in quantiles}
+        return
+
+    def add(self, x: float):
+        self._count = self._count + 1
+        delta = x - self._mean
+        self._mean = self._mean + delta / self._count
+        self._m2 = self._m2 + delta * (x - self._mean)
+        if x < self._min:
+            self._min = x
+        if x > self._max:
+            self._max = x
+        for quantile in self._quantiles.values():
+            quantile.add(x)
+        return
+
+    def get_quantile(self, p: float) -> float:
+        return self._quantiles[p].value
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    @property
+    def mean(self) -> float:
+        if not self._count:
+            return float("nan")
+        return self._mean
+
+    @property
+    def variance(self) -> float:
+        """
+        Sample variance.
+        """
+        if self._count < 2:
+            return float("nan")
+        return self._m2 / (self._count - 1)
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.variance)
+
+    @property
+    def min(self) -> float:
+        return self._min
+
+    @property
+    def max(self) -> float:
+        return self._max
+
+    @property
+    def quantiles(self) -> list:
+        return list(self._quantiles)
+
+class TrialSummary:
+    """
+    Streaming aggregate of trials over a network of `network_size`
+    nodes, in constant memory regardless of the number of trials.
+
+    Propagation and wall time are summarized over every trial, send
+    count and max hops over the successful ones, and hop histograms are
+    summed.
+    """
+    def __init__(
+        self,
+        network_size: int,
+        quantiles: tuple = (0.5, 0.95, 0.99),
+    ):
+        self._network_size = network_size
+        self._num_trials = 0
+        self._num_successes = 0
+        self._propagation = RunningStats(quantiles)
+        self._wall_time = RunningStats(quantiles)
+        self._send_count = RunningStats(quantiles)
+        self._max_hops = RunningStats(quantiles)
+        self._hop_histogram = []
+        return
+
+    def add(self, result: TrialResult):
+        if result.network_size != self._network_size:
+            raise ValueError("mismatching network sizes")
+
+        self._num_trials = self._num_trials + 1
+        self._propagation.add(result.propagation)
+        self._wall_time.add(result.wall_time)
+        if result.success:
+            self._num_successes = self._num_successes + 1
+            self._send_count.add(result.send_count)
+            self._max_hops.add(result.max_hops)
+        while len(self._hop_histogram) < len(result.hop_histogram):
+            self._hop_histogram.append(0)
+        for hops, count in enumerate(result.hop_histogram):
+            self._hop_histogram[hops] = self._hop_histogram[hops] + count
+        return
+
+    def add_results(self, results: TrialResults):
+        """
+        Adds trials in the columnar form returned by parallel runs, which
+        carry no hop histograms or wall times.
+        """
+        if results.network_size != self._network_size:
+            raise ValueError("mismatching network sizes")
+
+        successes = results.successes
+        self._num_trials = self._num_trials + results.num_trials
+        self._num_successes = self._num_successes + int(successes.sum())
+        for propagation in results.propagations.tolist():
+            self._propagation.add(propagation)
+        for send_count in results.send_counts[successes].tolist():
+            self._send_count.add(send_count)
+        for max_hops in results.max_hops[successes].tolist():
+            self._max_hops.add(max_hops)
+        return
+
+    @property
+    def network_size(self) -> int:
+        return self._network_size
+
+    @property
+    def num_trials(self) -> int:
+        return self._num_trials
+
+    @property
+    def num_successes(self) -> int:
+        return self._num_successes
+
+    @property
+    def propagation(self) -> RunningStats:
+        return self._propagation
+
+    @property
+    def wall_time(self) -> RunningStats:
+        return self._wall_time
+
+    @property
+    def send_count(self) -> RunningStats:
+        """
+        Send count of the successful trials.
+        """
+        return self._send_count
+
+    @property
+    def max_hops(self) -> RunningStats:
+        """
+        Max hops of the successful trials.
+        """
+        return self._max_hops
+
+    @property
+    def hop_histogram(self) -> list:
+        """
+        Nodes first reached at each hop count, summed over trials.
+        """
+        return list(self._hop_histogram)
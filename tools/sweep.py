@@ -0,0 +1,277 @@
+import hashlib
+import itertools
+import json
+import os
+import shutil
+import numpy as np
+from libs.idspace import DEFAULT_ID_SPACE, IdSpace
+from libs.policy import KademliaBroadcastPolicy, KademliaDiscoveryPolicy
+from libs.rng import RandomStream
+from libs.snapshot import save_network
+from tools import util
+from tools.parallel import run_parallel_trials
+from tools.results import TrialResults, TrialSummary
+from tools.report import RESET, TITLE_COLOR
+
+# columns of a stored cell, one `.npy` file each
+COLUMNS = ["send_counts", "propagations", "max_hops"]
+
+def get_config_key(config: dict) -> str:
+    """
+    Stable hash of a JSON-serializable config.
+    """
+    config_bytes = json.dumps(config, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(config_bytes).hexdigest()[:16]
+
+class SweepStore:
+    """
+    On-disk results of a sweep under `root`.
+
+    Each cell is a directory `results/<config key>` holding its config as
+    `config.json` and one `.npy` file per column of its `TrialResults`.
+    Built networks are kept as snapshots `networks/<config key>.kadnet`.
+
+    Cells and snapshots are written under a temporary name and renamed
+    into place, so a crash never leaves a partial entry behind, and
+    leftovers of interrupted writes are removed on open.
+    """
+    def __init__(self, root: str):
+        self._root = root
+        os.makedirs(os.path.join(root, "results"), exist_ok=True)
+        os.makedirs(os.path.join(root, "networks"), exist_ok=True)
+        for directory in ["results", "networks"]:
+            for name in os.listdir(os.path.join(root, directory)):
+                if ".tmp-" in name:
+                    path = os.path.join(root, directory, name)
+                    if os.path.isdir(path):
+                        shutil.rmtree(path)
+                    else:
+                        os.remove(path)
+        return
+
+    def has_results(self, key: str) -> bool:
+        return os.path.isdir(self._get_results_path(key))
+
+    def save_results(self, key: str, config: dict, results: TrialResults):
+        path = self._get_results_path(key)
+        temp_path = f"{path}.tmp-{os.getpid()}"
+        os.makedirs(temp_path)
+        with open(os.path.join(temp_path, "config.json"), "w") as f:
+            json.dump(config, f, sort_keys=True)
+        for column in COLUMNS:
+            np.save(
+                os.path.join(temp_path, f"{column}.npy"),
+                getattr(results, column),
+            )
+        os.replace(temp_path, path)
+        return
+
+    def load_results(self, key: str) -> tuple:
+        """
+        Returns the `(config, results)` of cell `key`.
+        """
+        path = self._get_results_path(key)
+        with open(os.path.join(path, "config.json")) as f:
+            config = json.load(f)
+        columns = {
+            column: np.load(os.path.join(path, f"{column}.npy"))
+                for column in COLUMNS
+        }
+        return config, TrialResults(
+            network_size=config["network_size"],
+            **columns,
+        )
+
+    def load_all_results(self) -> list:
+        return [
+            self.load_results(key)
+                for key in sorted(os.listdir(self._get_results_path("")))
+        ]
+
+    def get_network_path(self, key: str) -> str:
+        return os.path.join(self._root, "networks", f"{key}.kadnet")
+
+    def has_network(self, key: str) -> bool:
+        return os.path.isfile(self.get_network_path(key))
+
+    def save_network(self, key: str, kademlia_network):
+        path = self.get_network_path(key)
+        temp_path = f"{path}.tmp-{os.getpid()}"
+        save_network(kademlia_network, temp_path)
+        os.replace(temp_path, path)
+        return
+
+    def _get_results_path(self, key: str) -> str:
+        return os.path.join(self._root, "results", key)
+
+    @property
+    def root(self) -> str:
+        return self._root
+
+def build_grid(
+    network_sizes: list,
+    discovery_types: list,
+    discovery_depths: list,
+    broadcast_types: list,
+    broadcast_sizes: list,
+) -> list:
+    """
+    Returns the cells of the grid as `(network config, broadcast config)`
+    pairs, grouped by network. Depths only vary for partial discovery
+    and sizes only for broadcasts that use them, so no cell repeats.
+    """
+    network_configs = []
+    for network_size, discovery_type, discovery_depth in itertools.product(
+        network_sizes,
+        discovery_types,
+        discovery_depths,
+    ):
+        if discovery_type != KademliaDiscoveryPolicy.PARTIAL:
+            discovery_depth = 0
+        network_config = {
+            "network_size": network_size,
+            "discovery_type": discovery_type,
+            "discovery_depth": discovery_depth,
+        }
+        if not network_config in network_configs:
+            network_configs.append(network_config)
+
+    broadcast_configs = []
+    for broadcast_type, broadcast_size in itertools.product(
+        broadcast_types,
+        broadcast_sizes,
+    ):
+        if broadcast_type in [
+            KademliaBroadcastPolicy.FLOOD,
+            KademliaBroadcastPolicy.SELECT,
+        ]:
+            broadcast_size = 0
+        broadcast_config = {
+            "broadcast_type": broadcast_type,
+            "broadcast_size": broadcast_size,
+        }
+        if not broadcast_config in broadcast_configs:
+            broadcast_configs.append(broadcast_config)
+
+    return [
+        (network_config, broadcast_config)
+            for network_config in network_configs
+            for broadcast_config in broadcast_configs
+    ]
+
+def run_sweep(
+    root: str,
+    network_sizes: list,
+    discovery_types: list,
+    discovery_depths: list,
+    broadcast_types: list,
+    broadcast_sizes: list,
+    num_trials: int,
+    master_seed: int,
+    seed_start: bool = False,
+    id_space: IdSpace = DEFAULT_ID_SPACE,
+    num_workers: int = None,
+):
+    """
+    Runs `num_trials` parallel trials for every cell of the grid and
+    stores their results in a `SweepStore` at `root`.
+
+    Cells already in the store are skipped, so rerunning an interrupted
+    sweep resumes it. Each network is built once, from a seed derived
+    from `master_seed` and its config, and saved as a snapshot that every
+    broadcast policy cell maps instead of rebuilding it.
+    """
+    store = SweepStore(root)
+    id_space_config = {
+        "bits": id_space.bits,
+        "k": id_space.k,
+        "alpha": id_space.alpha,
+    }
+    cells = build_grid(
+        network_sizes,
+        discovery_types,
+        discovery_depths,
+        broadcast_types,
+        broadcast_sizes,
+    )
+
+    print(f"{TITLE_COLOR}running a sweep with{RESET}")
+    print(f"    store: {root}")
+    print(f"    number of cells: {len(cells)}")
+    print(f"    number of trials per cell: {num_trials}")
+
+    for network_config, group in itertools.groupby(
+        cells,
+        key=lambda cell: cell[0],
+    ):
+        network_config = dict(
+            network_config,
+            id_space=id_space_config,
+            master_seed=master_seed,
+        )
+        network_key = get_config_key(network_config)
+        pending = []
+        for _, broadcast_config in group:
+            config = dict(
+                network_config,
+                **broadcast_config,
+                num_trials=num_trials,
+                seed_start=seed_start,
+            )
+            key = get_config_key(config)
+            if store.has_results(key):
+                print(f"    skipping done cell {key}")
+            else:
+                pending.append((key, config))
+        if not pending:
+            continue
+
+        if not store.has_network(network_key):
+            print(
+                f"    building network {network_key} "
+                f"({network_config['network_size']} nodes, "
+                f"{network_config['discovery_type']} discovery)"
+            )
+            kademlia_network = util.generate_kademlia_network(
+                network_config["network_size"],
+                KademliaBroadcastPolicy.FLOOD,
+                0,
+                network_config["discovery_type"],
+                network_config["discovery_depth"],
+                RandomStream.from_seed(int(network_key, 16)),
+                id_space,
+            )
+            store.save_network(network_key, kademlia_network)
+
+        for key, config in pending:
+            print(
+                f"    running cell {key} "
+                f"({config['broadcast_type']} broadcast, "
+                f"size {config['broadcast_size']})"
+            )
+            results = run_parallel_trials(
+                store.get_network_path(network_key),
+                num_trials,
+                seed_start,
+                int(np.random.SeedSequence(
+                    [master_seed, int(key, 16)]
+                ).generate_state(1)[0]),
+                num_workers=num_workers,
+                broadcast_policy=KademliaBroadcastPolicy(
+                    config["broadcast_type"],
+                    config["broadcast_size"],
+                ),
+            )
+            store.save_results(key, config, results)
+    return store
+
+def summarize_sweep(root: str) -> list:
+    """
+    Returns the `(config, TrialSummary)` of every cell stored at `root`.
+    """
+    summaries = []
+    for config, results in SweepStore(root).load_all_results():
+        summary = TrialSummary(results.network_size)
+        summary.add_results(results)
+        summaries.append((config, summary))
+    return summaries
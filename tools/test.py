@@ -1,125 +1,748 @@
+import asyncio
+import statistics
+import time
+import numpy as np
+from libs.churn import ChurnSimulator
+from libs.latency import LatencyModel
 from libs.policy import KademliaBroadcastPolicy, KademliaDiscoveryPolicy
 from libs.message import Message
 from libs.network import KademliaNetwork
-from tools import util
+from libs.profiling import NetworkProfiler, profile_network
+from libs.rng import RandomStream
+from libs.runtime import KademliaRuntime, MemoryTransport, Transport
+from libs.simulation import EventScheduler
+from libs.storage import KademliaStorage
+from libs.telemetry import DeliveryTelemetry
+from libs.trace import (
+    PropagationTrace,
+    get_critical_path,
+    get_fan_out,
+    get_spanning_tree,
+)
+from libs.vectorized import FrozenNetwork
+from tools import report, util
+from tools.report import RESET, SUCCESS_COLORS
+from tools.results import TrialResult, TrialSummary
 
-RED_BOLD = "\033[031;1m"
-GREEN_BOLD = "\033[032;1m"
-BLUE_BOLD = "\033[034;1m"
-RESET = "\033[0m"
-TITLE_COLOR = BLUE_BOLD
-SUCCESS_COLORS = {False: RED_BOLD, True: GREEN_BOLD}
-
-def run_single_trial(
+def run_trial(
     kademlia_network: KademliaNetwork,
     seed_start: bool,
-):
-    network_size = kademlia_network.size
-    discovery_type = kademlia_network.discovery_policy.discovery_type
-    discovery_depth = kademlia_network.discovery_policy.discovery_depth
-    broadcast_type = kademlia_network.broadcast_policy.broadcast_type
-    broadcast_size = kademlia_network.broadcast_policy.broadcast_size
-
-    print(f"{TITLE_COLOR}running a single trial with{RESET}")
-    print(f"    network size: {network_size}")
-    print(f"    discovery type: {discovery_type}")
-    if discovery_type == KademliaDiscoveryPolicy.PARTIAL:
-        print(f"    discovery depth: {discovery_depth}")
-    print(f"    broadcast type: {broadcast_type}")
-    if broadcast_type == KademliaBroadcastPolicy.RANDOM:
-        print(f"    broadcast size: {broadcast_size}")
-
+    message_size: int = 0,
+) -> TrialResult:
+    """
+    Propagates one message of `message_size` bytes and returns the
+    outcome.
+    """
     kademlia_network.reset()
     start_node = util.get_start_node(kademlia_network, seed_start)
-    message = Message("test", 0)
+    message = Message("test", 0, size=message_size)
+    start_time = time.perf_counter()
     kademlia_network.propagate_message(
         message, start_node.address
     )
+    wall_time = time.perf_counter() - start_time
+    return TrialResult(
+        network_size=kademlia_network.size,
+        send_count=kademlia_network.send_count,
+        propagation=kademlia_network.propagation,
+        max_hops=kademlia_network.max_hops,
+        hop_histogram=kademlia_network.hop_histogram,
+        wall_time=wall_time,
+    )
 
-    print(f"total number of peers: {sum(kademlia_network.peer_counts)}")
-    print(
-        f"total non-empty buckets: "
-        f"{sum(kademlia_network.non_empty_bucket_counts)}"
+def run_single_trial(
+    kademlia_network: KademliaNetwork,
+    seed_start: bool,
+    verbose: bool = True,
+) -> TrialResult:
+    if verbose:
+        report.print_network_config(
+            "running a single trial with",
+            kademlia_network,
+        )
+
+    result = run_trial(kademlia_network, seed_start)
+
+    if verbose:
+        print(f"total number of peers: {sum(kademlia_network.peer_counts)}")
+        print(
+            f"total non-empty buckets: "
+            f"{sum(kademlia_network.non_empty_bucket_counts)}"
+        )
+        print(f"duplicate ratio: {kademlia_network.duplicate_ratio:.4f}")
+        report.print_trial_result(result)
+    return result
+
+def compare_broadcast_policies(
+    kademlia_network: KademliaNetwork,
+    broadcast_policies: list,
+    num_trials: int,
+    seed_start: bool,
+):
+    """
+    Runs `num_trials` trials on `kademlia_network` with each of
+    `broadcast_policies` and reports coverage, send count and the ratio
+    of duplicate deliveries of each.
+    """
+    report.print_network_config(
+        "comparing broadcast policies with",
+        kademlia_network,
+        num_trials,
     )
-    success = kademlia_network.propagation == kademlia_network.size
-    print(
-        f"success: "
-        f"{SUCCESS_COLORS[success]}{success}{RESET}")
-    print(f"send count: {kademlia_network.send_count}")
-    print(f"propagation: {kademlia_network.propagation}")
-    print(f"max hops: {kademlia_network.max_hops}")
+
+    previous_policy = kademlia_network.broadcast_policy
+    for broadcast_policy in broadcast_policies:
+        kademlia_network.set_broadcast_policy(broadcast_policy)
+        successes = 0
+        send_counts = []
+        propagations = []
+        duplicate_ratios = []
+        for _ in range(num_trials):
+            result = run_trial(kademlia_network, seed_start)
+            successes = successes + result.success
+            send_counts.append(result.send_count)
+            propagations.append(result.propagation)
+            duplicate_ratios.append(kademlia_network.duplicate_ratio)
+
+        success = successes == num_trials
+        print(
+            f"    {broadcast_policy.broadcast_type} "
+            f"(size {broadcast_policy.broadcast_size}): "
+            f"successes {SUCCESS_COLORS[success]}{successes}{RESET}, "
+            f"propagation {np.mean(propagations):.2f}, "
+            f"send count {np.mean(send_counts):.2f}, "
+            f"duplicate ratio {np.mean(duplicate_ratios):.4f}"
+        )
+    kademlia_network.set_broadcast_policy(previous_policy)
     return
 
 def run_multiple_trials(
     kademlia_network: KademliaNetwork,
     num_trials: int,
     seed_start: bool,
+    verbose: bool = True,
+) -> TrialSummary:
+    """
+    Runs `num_trials` trials and returns their streaming summary, which
+    keeps no per-trial records.
+    """
+    if verbose:
+        report.print_network_config(
+            "running multiple trials with",
+            kademlia_network,
+            num_trials,
+        )
+
+    summary = TrialSummary(kademlia_network.size)
+    for _ in range(num_trials):
+        summary.add(run_trial(kademlia_network, seed_start))
+
+    if verbose:
+        report.print_trial_summary(summary)
+    return summary
+
+def run_timed_trials(
+    kademlia_network: KademliaNetwork,
+    scheduler: EventScheduler,
+    num_trials: int,
+    seed_start: bool,
+    message_size: int = 0,
 ):
+    """
+    Runs trials on simulated time with `scheduler` and reports the time to
+    full coverage over the successful trials, sending messages of
+    `message_size` bytes.
+    """
     network_size = kademlia_network.size
-    discovery_type = kademlia_network.discovery_policy.discovery_type
-    discovery_depth = kademlia_network.discovery_policy.discovery_depth
-    broadcast_type = kademlia_network.broadcast_policy.broadcast_type
-    broadcast_size = kademlia_network.broadcast_policy.broadcast_size
-
-    print(f"{TITLE_COLOR}running multiple trials with{RESET}")
-    print(f"    number of trials: {num_trials}")
-    print(f"    network size: {network_size}")
-    print(f"    broadcast type: {broadcast_type}")
-    if broadcast_type == KademliaBroadcastPolicy.RANDOM:
-        print(f"    broadcast size: {broadcast_size}")
-    print(f"    discovery type: {discovery_type}")
-    if discovery_type == KademliaDiscoveryPolicy.PARTIAL:
-        print(f"    discovery depth: {discovery_depth}")
-
-    success_results = []
-    send_count_results = []
-    max_hops_results = []
-    propagation_results = []
+    latency_model = type(scheduler.latency_model).__name__
 
+    report.print_network_config(
+        "running timed trials with",
+        kademlia_network,
+        num_trials,
+    )
+    print(f"    latency model: {latency_model}")
+    print(f"    processing delay: {scheduler.processing_delay}")
+    if scheduler.upload_bandwidth:
+        print(f"    upload bandwidth: {scheduler.upload_bandwidth}")
+    print(f"    message size: {message_size}")
+
+    previous_scheduler = kademlia_network.scheduler
+    kademlia_network.set_scheduler(scheduler)
+    coverage_results = []
     for _ in range(num_trials):
-        kademlia_network.reset()
-        start_node = util.get_start_node(kademlia_network, seed_start)
-        message = Message("test", 0)
-        kademlia_network.propagate_message(
-            message, start_node.address
-        )
-        success = kademlia_network.propagation == kademlia_network.size
-        success_results.append(success)
-        if success:
-            send_count_results.append(kademlia_network.send_count)
-            max_hops_results.append(kademlia_network.max_hops)
-        propagation_results.append(kademlia_network.propagation)
-
-    success = sum(success_results) == num_trials
+        run_trial(kademlia_network, seed_start, message_size)
+        coverage_results.append(
+            scheduler.get_coverage_times(network_size, [0.5, 0.95, 0.99, 1.0])
+        )
+    kademlia_network.set_scheduler(previous_scheduler)
+
+    coverage_results = np.array(coverage_results)
+    full_coverage_results = coverage_results[:, -1]
+    full_coverage_results = full_coverage_results[
+        np.isfinite(full_coverage_results)
+    ]
+    success = len(full_coverage_results) == num_trials
     print(
         f"number of successes: "
-        f"{SUCCESS_COLORS[success]}{sum(success_results)}{RESET}"
+        f"{SUCCESS_COLORS[success]}{len(full_coverage_results)}{RESET}"
     )
-    print(
-        f"    average propagation: "
-        f"{sum(propagation_results) / len(propagation_results):.2f}"
-    )
-    max_hops_results = [
-        max_hops
-            for success, max_hops in zip(success_results, max_hops_results)
-            if success
-    ]
-    if send_count_results:
+    for fraction, column in zip([50, 95, 99], coverage_results.T):
+        column = column[np.isfinite(column)]
+        if len(column):
+            print(
+                f"    average time to {fraction}% coverage: "
+                f"{column.mean():.4f}"
+            )
+    if len(full_coverage_results):
+        p50, p95, p99 = np.percentile(full_coverage_results, [50, 95, 99])
         print(
-            f"    average send count for successes: "
-            f"{sum(send_count_results) / len(send_count_results):.2f}"
+            f"    time to full coverage p50/p95/p99: "
+            f"{p50:.4f}/{p95:.4f}/{p99:.4f}"
         )
     else:
         print(
-            f"    average send count for successes: invalid"
+            f"    time to full coverage p50/p95/p99: invalid"
         )
-    if max_hops_results:
+    return
+
+def run_block_size_sweep(
+    kademlia_network: KademliaNetwork,
+    scheduler: EventScheduler,
+    block_sizes: list,
+    num_trials: int,
+    seed_start: bool,
+):
+    """
+    Runs timed trials with `scheduler` for messages of each of
+    `block_sizes` bytes and reports the time to full coverage against the
+    outbound queue depth of the nodes, which dominates for large blocks
+    on nodes with many peers.
+    """
+    network_size = kademlia_network.size
+    latency_model = type(scheduler.latency_model).__name__
+
+    report.print_network_config(
+        "running a block size sweep with",
+        kademlia_network,
+        num_trials,
+    )
+    print(f"    latency model: {latency_model}")
+    print(f"    processing delay: {scheduler.processing_delay}")
+    if scheduler.upload_bandwidths is not None:
+        upload_bandwidths = np.array(scheduler.upload_bandwidths)
         print(
-            f"    average max hops for successes: "
-            f"{sum(max_hops_results) / len(max_hops_results):.2f}"
+            f"    upload bandwidth: {upload_bandwidths.min():.0f} "
+            f"to {upload_bandwidths.max():.0f}"
         )
     else:
+        print(f"    upload bandwidth: {scheduler.upload_bandwidth}")
+
+    previous_scheduler = kademlia_network.scheduler
+    kademlia_network.set_scheduler(scheduler)
+    for block_size in block_sizes:
+        full_coverage_results = []
+        depth_results = []
+        for _ in range(num_trials):
+            run_trial(kademlia_network, seed_start, block_size)
+            full_coverage_results.append(
+                scheduler.get_coverage_times(network_size, [1.0])[0]
+            )
+            depth_results.extend(scheduler.queue_depths.values())
+
+        full_coverage_results = np.array(full_coverage_results)
+        full_coverage_results = full_coverage_results[
+            np.isfinite(full_coverage_results)
+        ]
+        success = len(full_coverage_results) == num_trials
         print(
-            f"    average max hops for successes: invalid"
+            f"    block size {block_size}: "
+            f"successes {SUCCESS_COLORS[success]}"
+            f"{len(full_coverage_results)}{RESET}"
         )
+        if len(full_coverage_results):
+            p50, p99 = np.percentile(full_coverage_results, [50, 99])
+            print(
+                f"        time to full coverage p50/p99: "
+                f"{p50:.4f}/{p99:.4f}"
+            )
+        if depth_results:
+            depth_results = np.array(depth_results)
+            p50, p99 = np.percentile(depth_results, [50, 99])
+            print(
+                f"        max queue depth per node p50/p99/max: "
+                f"{p50:.0f}/{p99:.0f}/{depth_results.max()}"
+            )
+    kademlia_network.set_scheduler(previous_scheduler)
     return
+
+ENGINE_METRICS = ["send count", "propagation", "max hops"]
+
+def run_engine_trials(
+    kademlia_network: KademliaNetwork,
+    num_trials: int,
+    seed_start: bool,
+) -> tuple:
+    """
+    Runs `num_trials` trials on `kademlia_network` and as many on its
+    `FrozenNetwork`, and returns the `ENGINE_METRICS` of every trial of
+    the object and the vectorized engine as two `(num_trials, 3)` arrays.
+    """
+    object_results = []
+    for _ in range(num_trials):
+        result = run_trial(kademlia_network, seed_start)
+        object_results.append((
+            result.send_count,
+            result.propagation,
+            result.max_hops,
+        ))
+
+    frozen_network = FrozenNetwork.from_network(kademlia_network)
+    # both engines draw from the network's stream
+    rng = kademlia_network.rng.generator
+    vectorized_results = []
+    for _ in range(num_trials):
+        if seed_start:
+            start_index = frozen_network.seed_index
+        else:
+            start_index = rng.integers(frozen_network.size)
+        vectorized_results.append(
+            frozen_network.propagate_message(start_index, rng)
+        )
+    return (
+        np.array(object_results, dtype=float),
+        np.array(vectorized_results, dtype=float),
+    )
+
+def get_z_scores(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    Two-sample z-score of the mean of each column of `a` against the
+    same column of `b`. A column constant in both is 0 if the constants
+    are equal and infinite otherwise.
+    """
+    z_scores = []
+    for x, y in zip(a.T, b.T):
+        stderr = np.sqrt(x.var(ddof=1) / len(x) + y.var(ddof=1) / len(y))
+        if stderr:
+            z_scores.append((x.mean() - y.mean()) / stderr)
+        else:
+            z_scores.append(0.0 if x.mean() == y.mean() else float("inf"))
+    return np.array(z_scores)
+
+def get_z_threshold(num_comparisons: int, alpha: float) -> float:
+    """
+    Two-sided z-score threshold that any of `num_comparisons` equal means
+    exceeds with probability at most `alpha`, by Bonferroni correction.
+    """
+    if not 0 < alpha < 1:
+        raise ValueError(f"invalid alpha: {alpha}")
+    return statistics.NormalDist().inv_cdf(1 - alpha / (2 * num_comparisons))
+
+def compare_engines(
+    kademlia_network: KademliaNetwork,
+    num_trials: int,
+    seed_start: bool,
+    alpha: float = 0.01,
+) -> bool:
+    """
+    Runs the same number of trials on `kademlia_network` and on its
+    `FrozenNetwork`, compares the mean send count, propagation and max
+    hops of both engines with a two-sample z-score, and returns whether
+    none of them differs at a family-wise significance of `alpha`.
+    """
+    report.print_network_config(
+        "comparing propagation engines with",
+        kademlia_network,
+        num_trials,
+    )
+    threshold = get_z_threshold(len(ENGINE_METRICS), alpha)
+    print(f"    z threshold: {threshold:.2f}")
+
+    object_results, vectorized_results = run_engine_trials(
+        kademlia_network,
+        num_trials,
+        seed_start,
+    )
+    z_scores = get_z_scores(object_results, vectorized_results)
+    for name, a, b, z in zip(
+        ENGINE_METRICS,
+        object_results.T,
+        vectorized_results.T,
+        z_scores,
+    ):
+        print(
+            f"    {name}: {a.mean():.2f} (object) "
+            f"{b.mean():.2f} (vectorized) z={z:.2f}"
+        )
+    equivalent = bool((np.abs(z_scores) < threshold).all())
+    print(f"equivalent: {SUCCESS_COLORS[equivalent]}{equivalent}{RESET}")
+    return equivalent
+
+def run_churn_trial(
+    simulator: ChurnSimulator,
+    duration: float,
+    probe_interval: float,
+):
+    """
+    Runs `simulator` for `duration` seconds and reports the probe
+    broadcasts sent every `probe_interval` seconds as routing tables decay
+    and get refreshed.
+    """
+    kademlia_network = simulator.network
+    session_length = type(simulator.session_length).__name__
+
+    report.print_network_config(
+        "running a churn trial with",
+        kademlia_network,
+    )
+    print(f"    duration: {duration}")
+    print(f"    session length: {session_length}")
+    print(f"    mean session length: {simulator.session_length.mean:.2f}")
+    print(f"    arrival rate: {simulator.arrival_rate:.4f}")
+    print(f"    refresh interval: {simulator.refresh_interval}")
+    print(f"    failure rate: {simulator.failure_rate}")
+
+    probes = simulator.run(duration, probe_interval)
+    for probe in probes:
+        print(
+            f"    t={probe.time:.1f} size={probe.network_size} "
+            f"propagation={probe.propagation} "
+            f"send count={probe.send_count} "
+            f"dead entries={probe.dead_entry_fraction:.3f} "
+            f"success={SUCCESS_COLORS[probe.success]}{probe.success}{RESET}"
+        )
+    successes = sum([probe.success for probe in probes])
+    success = successes == len(probes)
+    print(
+        f"number of successes: "
+        f"{SUCCESS_COLORS[success]}{successes}{RESET}"
+        f" out of {len(probes)}"
+    )
+    print(f"    joins: {simulator.joins}")
+    print(f"    graceful departures: {simulator.departures}")
+    print(f"    failures: {simulator.failures}")
+    print(f"    refreshes: {simulator.refreshes}")
+    print(f"    pings: {kademlia_network.store.ping_count}")
+    return
+
+def run_telemetry_trials(
+    kademlia_network: KademliaNetwork,
+    num_trials: int,
+    seed_start: bool,
+):
+    """
+    Runs trials with delivery telemetry enabled and reports useful and
+    duplicate deliveries, where the duplicates come from by bucket
+    distance and hop, and the per-node message load, summed over trials.
+    """
+    report.print_network_config(
+        "running telemetry trials with",
+        kademlia_network,
+        num_trials,
+    )
+
+    previous_telemetry = kademlia_network.telemetry
+    telemetry = DeliveryTelemetry(kademlia_network)
+    kademlia_network.set_telemetry(telemetry)
+    useful_count = 0
+    duplicate_count = 0
+    useful_by_distance = np.zeros_like(telemetry.useful_by_distance)
+    duplicates_by_distance = np.zeros_like(telemetry.duplicates_by_distance)
+    duplicates_by_hop = np.zeros(0, dtype=np.int64)
+    in_counts = np.zeros(kademlia_network.store.size, dtype=np.int64)
+    out_counts = np.zeros(kademlia_network.store.size, dtype=np.int64)
+    for _ in range(num_trials):
+        run_trial(kademlia_network, seed_start)
+        useful_count = useful_count + telemetry.useful_count
+        duplicate_count = duplicate_count + telemetry.duplicate_count
+        useful_by_distance += telemetry.useful_by_distance
+        duplicates_by_distance += telemetry.duplicates_by_distance
+        if len(duplicates_by_hop) < len(telemetry.duplicates_by_hop):
+            duplicates_by_hop = np.pad(
+                duplicates_by_hop,
+                (0, len(telemetry.duplicates_by_hop) - len(duplicates_by_hop)),
+            )
+        duplicates_by_hop[:len(telemetry.duplicates_by_hop)] += (
+            telemetry.duplicates_by_hop
+        )
+        in_counts += telemetry.in_counts
+        out_counts += telemetry.out_counts
+    kademlia_network.set_telemetry(previous_telemetry)
+
+    deliveries = useful_count + duplicate_count
+    print(f"useful deliveries per trial: {useful_count / num_trials:.2f}")
+    print(
+        f"duplicate deliveries per trial: "
+        f"{duplicate_count / num_trials:.2f}"
+    )
+    if deliveries:
+        print(f"    duplicate ratio: {duplicate_count / deliveries:.4f}")
+    print(f"duplicates by sender bucket distance:")
+    totals = useful_by_distance + duplicates_by_distance
+    for distance in np.flatnonzero(totals):
+        total = totals[distance]
+        print(
+            f"    bucket {distance}: "
+            f"{duplicates_by_distance[distance] / num_trials:.2f} "
+            f"of {total / num_trials:.2f} per trial "
+            f"({duplicates_by_distance[distance] / total:.4f})"
+        )
+    print(f"duplicates by hop:")
+    for hops in np.flatnonzero(duplicates_by_hop):
+        print(f"    hop {hops}: {duplicates_by_hop[hops] / num_trials:.2f}")
+    alive = kademlia_network.store.alive
+    for name, counts in [("inbound", in_counts), ("outbound", out_counts)]:
+        counts = counts[alive] / num_trials
+        p50, p99 = np.percentile(counts, [50, 99])
+        print(
+            f"{name} messages per node: mean {counts.mean():.2f} "
+            f"p50 {p50:.2f} p99 {p99:.2f} max {counts.max():.2f}"
+        )
+    return
+
+def run_traced_trial(
+    kademlia_network: KademliaNetwork,
+    seed_start: bool,
+    path: str = None,
+) -> np.ndarray:
+    """
+    Propagates one message with tracing enabled, reports the shape of
+    its dissemination tree and returns its records, also saved to `path`
+    if given.
+    """
+    report.print_network_config(
+        "running a traced trial with",
+        kademlia_network,
+    )
+
+    previous_trace = kademlia_network.trace
+    trace = PropagationTrace(
+        kademlia_network,
+        max(kademlia_network.store.size * 64, 1 << 18),
+    )
+    kademlia_network.set_trace(trace)
+    run_trial(kademlia_network, seed_start)
+    kademlia_network.set_trace(previous_trace)
+    records = trace.get_records(kademlia_network.epoch)
+    if trace.dropped:
+        print(f"    records dropped: {trace.dropped}")
+    if path is not None:
+        np.save(path, records)
+
+    parents = get_spanning_tree(records, kademlia_network.store.size)
+    critical_path = get_critical_path(records)
+    print(f"deliveries: {len(records)}")
+    print(f"    nodes in tree: {int((parents >= 0).sum()) + 1}")
+    print(f"    critical path length: {len(critical_path) - 1}")
+    print(
+        f"    critical path bucket distances: "
+        f"{list(_get_path_distances(kademlia_network, critical_path))}"
+    )
+    print(f"fan-out by hop:")
+    for hop, (fan_out, useful_fan_out) in enumerate(zip(
+        get_fan_out(records),
+        get_fan_out(records, useful_only=True),
+    )):
+        print(
+            f"    hop {hop}: {fan_out:.2f} sent, "
+            f"{useful_fan_out:.2f} reaching new nodes"
+        )
+    return records
+
+def _get_path_distances(kademlia_network: KademliaNetwork, path: list):
+    addresses = [kademlia_network.store.get_address(index) for index in path]
+    for sender, receiver in zip(addresses, addresses[1:]):
+        yield sender.get_distance(receiver)
+    return
+
+def run_storage_trials(
+    kademlia_network: KademliaNetwork,
+    num_keys: int,
+    num_lookups: int,
+    zipf_exponent: float = 1.0,
+    capacity: int = 1024,
+    latency_model: LatencyModel = None,
+) -> KademliaStorage:
+    """
+    Publishes `num_keys` values from random nodes, then looks up keys
+    from random nodes with Zipf popularity of `zipf_exponent`, and
+    reports lookup hops and latency and how the load of hot keys falls
+    on the nodes holding them.
+    """
+    report.print_network_config(
+        "running storage trials with",
+        kademlia_network,
+    )
+    print(f"    number of keys: {num_keys}")
+    print(f"    number of lookups: {num_lookups}")
+    print(f"    zipf exponent: {zipf_exponent}")
+    print(f"    capacity: {capacity}")
+
+    storage = KademliaStorage(kademlia_network, capacity, latency_model)
+    for i in range(num_keys):
+        storage.store(kademlia_network.get_random_node(), f"key{i}", f"{i}")
+
+    weights = 1.0 / np.arange(1, num_keys + 1) ** zipf_exponent
+    ranks = kademlia_network.rng.generator.choice(
+        num_keys,
+        num_lookups,
+        p=weights / weights.sum(),
+    )
+    for rank in ranks:
+        storage.find_value(kademlia_network.get_random_node(), f"key{rank}")
+
+    success = storage.hit_count == num_lookups
+    print(
+        f"number of hits: "
+        f"{SUCCESS_COLORS[success]}{storage.hit_count}{RESET}"
+    )
+    hops = storage.hops
+    latencies = storage.latencies
+    print(
+        f"    hops mean/p50/p99: {hops.mean():.2f}/"
+        f"{np.percentile(hops, 50):.0f}/{np.percentile(hops, 99):.0f}"
+    )
+    if latency_model is not None:
+        print(
+            f"    latency mean/p50/p99: {latencies.mean():.4f}/"
+            f"{np.percentile(latencies, 50):.4f}/"
+            f"{np.percentile(latencies, 99):.4f}"
+        )
+    print(f"    values cached: {storage.cache_count}")
+    print(f"    values evicted: {storage.eviction_count}")
+
+    serve_counts = np.sort(storage.serve_counts)[::-1]
+    top = max(len(serve_counts) // 100, 1)
+    hottest_key = max(storage.key_counts.values())
+    print(f"    hottest key share: {hottest_key / num_lookups:.4f}")
+    print(
+        f"    max load over mean: "
+        f"{serve_counts[0] / serve_counts.mean():.2f}"
+    )
+    print(
+        f"    share of load on top 1% of nodes: "
+        f"{serve_counts[:top].sum() / serve_counts.sum():.4f}"
+    )
+    return storage
+
+def run_profiled_trials(
+    kademlia_network: KademliaNetwork,
+    network_size: int,
+    num_trials: int,
+    seed_start: bool,
+    trace_allocations: bool = False,
+) -> NetworkProfiler:
+    """
+    Adds `network_size` nodes to `kademlia_network`, usually empty, and
+    runs `num_trials` trials on it with profiling enabled, and reports
+    whether construction or propagation dominates and the time spent in
+    each phase of either.
+    """
+    report.print_network_config(
+        "running profiled trials with",
+        kademlia_network,
+        num_trials,
+    )
+    print(f"    nodes added: {network_size}")
+    print(f"    trace allocations: {trace_allocations}")
+
+    addresses = util.generate_addresses(kademlia_network, network_size)
+    with profile_network(kademlia_network, trace_allocations) as profiler:
+        start_time = time.perf_counter()
+        kademlia_network.bulk_build(addresses)
+        build_time = time.perf_counter() - start_time
+        summary = TrialSummary(kademlia_network.size)
+        start_time = time.perf_counter()
+        for _ in range(num_trials):
+            summary.add(run_trial(kademlia_network, seed_start))
+        trial_time = time.perf_counter() - start_time
+
+    report.print_trial_summary(summary)
+    print(f"construction wall time: {build_time:.4f}")
+    print(f"propagation wall time: {trial_time:.4f}")
+    report.print_profile(profiler)
+    return profiler
+
+def run_runtime_trials(
+    network_size: int,
+    broadcast_type: str,
+    broadcast_size: int,
+    discovery_type: str,
+    discovery_depth: int,
+    num_trials: int,
+    seed_start: bool,
+    rng: RandomStream,
+    transport: Transport = None,
+    request_timeout: float = 1.0,
+) -> TrialSummary:
+    """
+    Joins `network_size` live nodes on `transport`, in memory by default,
+    and propagates a message from one of them per trial, timing the
+    joins and each propagation on the wall clock. Every random choice is
+    drawn from `rng`.
+    """
+    runtime_rng, transport_rng = rng.spawn(2)
+    if transport is None:
+        transport = MemoryTransport(transport_rng)
+    return asyncio.run(_run_runtime_trials(
+        network_size,
+        KademliaBroadcastPolicy(broadcast_type, broadcast_size),
+        KademliaDiscoveryPolicy(discovery_type, discovery_depth),
+        num_trials,
+        seed_start,
+        runtime_rng,
+        transport,
+        request_timeout,
+    ))
+
+async def _run_runtime_trials(
+    network_size: int,
+    broadcast_policy: KademliaBroadcastPolicy,
+    discovery_policy: KademliaDiscoveryPolicy,
+    num_trials: int,
+    seed_start: bool,
+    rng: RandomStream,
+    transport: Transport,
+    request_timeout: float,
+) -> TrialSummary:
+    runtime = KademliaRuntime(
+        discovery_policy,
+        broadcast_policy,
+        transport,
+        rng,
+        request_timeout=request_timeout,
+    )
+    async with runtime:
+        start_time = time.perf_counter()
+        await runtime.add_nodes(network_size)
+        join_time = time.perf_counter() - start_time
+
+        report.print_network_config(
+            "running runtime trials with",
+            runtime,
+            num_trials,
+        )
+        print(f"    transport: {type(transport).__name__}")
+        print(f"    join time: {join_time:.4f}")
+        print(f"    request timeouts: {runtime.timeout_count}")
+
+        summary = TrialSummary(network_size)
+        for _ in range(num_trials):
+            if seed_start:
+                start_node = runtime.seed
+            else:
+                start_node = runtime.get_random_node()
+            wall_time = await runtime.broadcast(
+                Message("test", 0),
+                start_node.address,
+            )
+            summary.add(TrialResult(
+                network_size=network_size,
+                send_count=runtime.send_count,
+                propagation=runtime.propagation,
+                max_hops=runtime.max_hops,
+                hop_histogram=runtime.hop_histogram,
+                wall_time=wall_time,
+            ))
+    report.print_trial_summary(summary)
+    return summary
@@ -1,7 +1,7 @@
-from libs.address import KademliaAddress
+from libs.idspace import DEFAULT_ID_SPACE, IdSpace
 from libs.network import KademliaNetwork
-from libs.node import KademliaNode
 from libs.policy import KademliaBroadcastPolicy, KademliaDiscoveryPolicy
+from libs.rng import RandomStream
 
 def get_start_node(kademlia_network: KademliaNetwork, seed_start: bool):
     if seed_start:
@@ -15,6 +15,8 @@ def generate_kademlia_network(
     broadcast_size: int,
     discovery_type: str,
     discovery_depth: int,
+    rng: RandomStream,
+    id_space: IdSpace = DEFAULT_ID_SPACE,
 ):
     if not broadcast_type in KademliaBroadcastPolicy.POLICIES:
         raise ValueError("invalid broadcast type")
@@ -28,12 +30,26 @@ def generate_kademlia_network(
         discovery_type=discovery_type,
         discovery_depth=discovery_depth,
     )
-    kademlia_network = KademliaNetwork(discovery_policy, broadcast_policy)
-    for _ in range(network_size):
-        kademlia_network.add_node(
-            KademliaNode(
-                network=kademlia_network,
-                address=KademliaAddress.generate_random_address(),
-            )
-        )
+    kademlia_network = KademliaNetwork(
+        discovery_policy,
+        broadcast_policy,
+        rng,
+        id_space,
+    )
+    kademlia_network.bulk_build(
+        generate_addresses(kademlia_network, network_size)
+    )
     return kademlia_network
+
+def generate_addresses(
+    kademlia_network: KademliaNetwork,
+    num_addresses: int,
+) -> list:
+    """
+    Draws `num_addresses` distinct random addresses from the random
+    stream of `kademlia_network`, none of a node in its store.
+    """
+    return kademlia_network.store.generate_addresses(
+        num_addresses,
+        kademlia_network.rng,
+    )